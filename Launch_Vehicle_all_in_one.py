@@ -1,7 +1,11 @@
 import pandas as pd
-from matplotlib import pyplot as plt
+from cardinality import distinct_counts
+from aggregation_cube import get_cube, cube_query
+from instrumentation import instrument
+from memoize import memoize
 
 
+@instrument
 def numerate_mission_status(df):
     """
     Takes the "MissionStatus" Column of the Space Data, and converts the rows containing "Success" to 1 and the rows containing the words
@@ -14,24 +18,59 @@ def numerate_mission_status(df):
     """
     assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    for item in df.index:
-        if df['MissionStatus'][item] == "Success":
-            df['MissionStatus'][item] = 1
-        else:
-            df['MissionStatus'][item] = 0
+    df['MissionStatus'] = (df['MissionStatus'] == "Success").astype(int)
     return df
 
 
+@instrument
+@memoize
+def launch_vehicle_stats(df):
+    """
+    Computes the launch statistics of every Launch Vehicle in one grouped pass over the aggregation cube: the number of
+    launches, successes and failures, the success-rate, and the number of different companies and countries
+    that used it. Works on the raw "MissionStatus" column as well as on the output of numerate_mission_status.
+
+    :param df: The input dataframe containing the space data
+    :type df: pd.DataFrame
+    :return: Dataframe indexed by "LaunchVehicle" with the columns "launches", "successes", "failures",
+             "success_rate", "companies" and "countries", sorted by decreasing number of launches.
+    :rtype: pd.DataFrame
+    """
+    assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
+
+    cube = get_cube(df)
+    if pd.api.types.is_numeric_dtype(cube['MissionStatus']):
+        success = cube['MissionStatus'] == 1
+    else:
+        success = cube['MissionStatus'] == "Success"
+
+    stats = cube[['LaunchVehicle', 'Company', 'Country', 'launches']].assign(
+        successes=cube['launches'].where(success, 0)).groupby('LaunchVehicle', observed=True, sort=False).agg(
+        launches=('launches', 'sum'),
+        successes=('successes', 'sum'),
+        companies=('Company', 'nunique'),
+        countries=('Country', 'nunique'))
+
+    stats['failures'] = stats['launches'] - stats['successes']
+    stats['success_rate'] = stats['successes'] / stats['launches']
+    stats = stats[['launches', 'successes', 'failures', 'success_rate', 'companies', 'countries']]
+    return stats.sort_values('launches', ascending=False, kind='mergesort')
+
+
+@instrument
 def plot_top_5_most_used_LVs(df):
     """
     Plots the bar-chart showing the top 5 most heavily used Launch Vehicles and the total number of missions in which they have been used.
 
     :param df: The input dataframe containing the space data
     :type df: pd.DataFrame
+    :return: matplotlib figure
     """
+    from matplotlib import pyplot as plt
+
     assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    Launch_vehicle_counts = df['LaunchVehicle'].value_counts()
+    Launch_vehicle_counts = launch_vehicle_stats(df)['launches']
 
     top_5_LVs = list(Launch_vehicle_counts.index)[:5]
     top_5_LV_missions =  Launch_vehicle_counts.to_list()[:5]
@@ -39,40 +78,35 @@ def plot_top_5_most_used_LVs(df):
     fig, axs = plt.subplots(1, figsize = (10,7))
     axs.bar(x = top_5_LVs, height = top_5_LV_missions, color = "green")
     axs.set_title('Missions of Top-5 Launch Vehicles')
+    return fig
 
 
+@instrument
 def plot_success_rate_LVs(df):
     """
     Plots the horizontal bar-graph showing the success-rate of Launch Vehicles which have been used in 30 missions or more.
 
     :param df: The input dataframe containing the space data
     :type df: pd.DataFrame
+    :return: matplotlib figure
     """
-    assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
+    from matplotlib import pyplot as plt
 
-    success_rate_launch_vehicles = []
-
-    Launch_vehicle_counts = df['LaunchVehicle'].value_counts()
-
-    for item in Launch_vehicle_counts.index:
-        if Launch_vehicle_counts[item] >= 30:
-            success_rate_item = sum(df.loc[(df['LaunchVehicle'] == item), 'MissionStatus'].tolist()) / \
-                                Launch_vehicle_counts[item]
-            success_rate_launch_vehicles.append((item, success_rate_item))
-
-    success_rate_launch_vehicles = sorted(success_rate_launch_vehicles, key=lambda x: x[1], reverse=True)
+    assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    y1, width1 = [], []
+    stats = launch_vehicle_stats(df)
+    stats = stats[stats['launches'] >= 30].sort_values('success_rate', ascending=False, kind='mergesort')
 
-    for key, value in success_rate_launch_vehicles:
-        y1.append(key)
-        width1.append(value)
+    y1, width1 = list(stats.index), stats['success_rate'].to_list()
 
     fig, axs = plt.subplots(figsize=(10, 10))
     axs.barh(y=y1, width=width1, color="green")
     axs.set_title('Success rate of Launch Vehicles')
+    return fig
 
 
+@instrument
+@memoize
 def most_widely_used_LVs(df):
     """
     We have found in our dataset that the maximum number of different organizations a single Launch Vehicle model has been used in is 3. This
@@ -85,56 +119,39 @@ def most_widely_used_LVs(df):
     """
     assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    Unique_companies = []
-
-    Launch_vehicle_names = df.LaunchVehicle.unique()
-
-    for i in Launch_vehicle_names:
-      Company_counts = len(df.loc[(df['LaunchVehicle']==i),'Company'].unique())
-      Unique_companies.append((i,Company_counts))
-
-    Unique_companies = sorted(Unique_companies, key = lambda x: x[1], reverse = True)
-    launch_vehicles_most_used = []
-    for i in Unique_companies:
-      if i[1] > 2:
-        launch_vehicles_most_used.append(i[0])
+    Unique_companies = distinct_counts(df, 'LaunchVehicle', 'Company')
+    Unique_companies = Unique_companies.sort_values(ascending=False, kind='mergesort')
+    launch_vehicles_most_used = list(Unique_companies[Unique_companies > 2].index)
 
     return launch_vehicles_most_used
 
 
+@instrument
 def plot_LVs_per_country(df):
     """
     Plots a horizontal bar-graph showing the total number of Launch Vehicles used by a country (or a company based in it) over the years.
 
     :param df: The input dataframe containing the space data
     :type df: pd.DataFrame
+    :return: matplotlib figure
     """
-    assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
-
-    Unique_launch_vehicles_per_country = []
-
-    Country_names = df.Country.unique()
-
-    for i in Country_names:
-      if i is not None:
-        i_count = len(df.loc[(df['Country']== i),'LaunchVehicle'].unique())
-        Unique_launch_vehicles_per_country.append((i,i_count))
+    from matplotlib import pyplot as plt
 
+    assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    Unique_launch_vehicles_per_country = sorted(Unique_launch_vehicles_per_country, key = lambda x:x[1], reverse = True)
+    Unique_launch_vehicles_per_country = distinct_counts(df, 'Country', 'LaunchVehicle')
+    Unique_launch_vehicles_per_country = Unique_launch_vehicles_per_country.drop('Kiritimati', errors='ignore').sort_values(
+        ascending=False, kind='mergesort')
 
-    y1, width1 = [], []
-    for i in Unique_launch_vehicles_per_country:
-      if (i[0] == "Kiritimati"):
-        continue
-      y1.append(i[0])
-      width1.append(i[1])
+    y1, width1 = list(Unique_launch_vehicles_per_country.index), Unique_launch_vehicles_per_country.to_list()
 
     fig, axs = plt.subplots(figsize = (10,7))
     axs.barh(y = y1, width = width1, color = "green")
     axs.set_title('Number of Different Launch Vehicles Used Per Country')
+    return fig
 
 
+@instrument
 def plot_Missions_per_country(df):
     """
     Plots a horizontal bar-graph showing the number of space missions conducted within a country
@@ -142,16 +159,17 @@ def plot_Missions_per_country(df):
 
     :param df: The input dataframe containing the space data
     :type df: pd.DataFrame
+    :return: matplotlib figure
     """
+    from matplotlib import pyplot as plt
+
     assert isinstance(df, pd.DataFrame) and len(list(df.index)) != 0
 
-    temporary_series = df['Country'].value_counts()
-    Countries, Missions = [], []
-    for i in temporary_series.index:
-        Countries.append(i)
-        Missions.append(temporary_series[i])
+    temporary_series = cube_query(get_cube(df), ['Country']).sort_values('launches', ascending=False, kind='mergesort')
+    Countries, Missions = temporary_series['Country'].to_list(), temporary_series['launches'].to_list()
 
     fig, axs = plt.subplots(figsize=(10, 7))
 
     axs.barh(y=Countries, width=Missions, color="green")
-    axs.set_title('Number of Missions Per Country')
\ No newline at end of file
+    axs.set_title('Number of Missions Per Country')
+    return fig
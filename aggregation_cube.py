@@ -0,0 +1,274 @@
+import os
+import weakref
+import importlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from helper_func import frame_version, concat_categorical_frames
+from instrumentation import instrument
+from bitmap_index import BitmapIndex, INDEX_DIMENSIONS
+
+#dimensions of the cube, in the order of the cube columns
+CUBE_DIMENSIONS = ['Year', 'Month', 'Country', 'Company', 'LaunchVehicle', 'MissionStatus', 'RocketStatus']
+
+#additive measures stored for every cell of the cube
+#launches: number of launches, cost_sum/cost_count: sum and number of known MissionCost values,
+#cost_pos_sum/cost_pos_count: the same restricted to MissionCost > 0
+CUBE_MEASURES = ['launches', 'cost_sum', 'cost_count', 'cost_pos_sum', 'cost_pos_count']
+
+#number of cubes kept in memory by get_cube
+CUBE_CACHE_SIZE = 8
+
+#cubes of get_cube: (id(df), frame_version of its cube columns, backend) -> (weak reference to df, cube)
+_cube_cache = OrderedDict()
+
+#functions building the cube of a cleaned dataframe: backend name -> (module, function), imported on first use
+CUBE_BACKENDS = {'pandas': ('aggregation_cube', 'build_cube'), 'duckdb': ('sql_backend', 'build_cube_sql')}
+
+#environment variable selecting the backend at import time
+BACKEND_ENV = 'SPACE_DATA_BACKEND'
+_backend = 'pandas'
+
+#BitmapIndex of the indexed cubes: id(cube) -> (weak reference to the cube, index)
+_cube_indexes = {}
+
+
+@instrument
+def build_cube(df, dims=CUBE_DIMENSIONS):
+    '''
+    Returns the aggregation cube of the cleaned dataframe: one row per distinct combination of the dimensions
+    present in the dataframe, with the CUBE_MEASURES of the launches in that combination
+
+    Note: cells are kept in order of first appearance in the dataframe, so a roll-up with cube_query lists its
+          groups in the same order as df.groupby(..., sort=False) would
+
+    @param df: cleaned dataframe
+    @param dims: dimensions of the cube (any columns of the dataframe, CUBE_DIMENSIONS by default)
+    @type df: pd.DataFrame
+    @type dims: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(dims, list)
+
+    dims = [dim for dim in dims if dim in df.columns]
+    assert len(dims) > 0
+
+    cost = df['MissionCost'] if 'MissionCost' in df.columns else pd.Series(np.nan, index=df.index)
+    cells = df[dims].assign(
+        launches=1,
+        cost_sum=cost.fillna(0.0),
+        cost_count=cost.notna().astype(np.int64),
+        cost_pos_sum=cost.where(cost > 0, 0.0),
+        cost_pos_count=(cost > 0).astype(np.int64))
+    cube = cells.groupby(dims, observed=True, sort=False, dropna=False)[CUBE_MEASURES].sum().reset_index()
+    return _restore_dtypes(cube, df.dtypes[dims])
+
+
+def _restore_dtypes(frame, dtypes):
+    '''
+    Returns the frame with the given dtypes restored on the grouping keys
+
+    Note: grouping with sort=False reorders the categories of categorical keys by appearance, and astype treats
+          unordered categoricals with the same categories as equal, so the category order is set explicitly
+
+    @param frame: grouped frame with the keys as columns
+    @param dtypes: series with the original dtype of every key
+    @type frame: pd.DataFrame
+    @type dtypes: pd.Series
+    '''
+    for col, dtype in dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].cat.set_categories(dtype.categories, ordered=dtype.ordered)
+        else:
+            frame[col] = frame[col].astype(dtype)
+    return frame
+
+
+def is_cube(df):
+    '''
+    Returns True if the dataframe is an aggregation cube (it has the CUBE_MEASURES columns) rather than launches
+
+    @param df: dataframe
+    @type df: pd.DataFrame
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    return all(measure in df.columns for measure in CUBE_MEASURES)
+
+
+@instrument
+def merge_cubes(cube, delta):
+    '''
+    Returns the cube of the launches of both cubes, e.g. the stored cube updated with the cube of newly appended
+    launches. Cells of `cube` keep their order, cells only found in `delta` follow them
+
+    @param cube: cube returned by build_cube (or None)
+    @param delta: cube returned by build_cube
+    @type cube: pd.DataFrame
+    @type delta: pd.DataFrame
+    '''
+    assert cube is None or is_cube(cube)
+    assert is_cube(delta)
+
+    if cube is None:
+        return delta
+    assert list(cube.columns) == list(delta.columns)
+
+    dims = [col for col in cube.columns if col not in CUBE_MEASURES]
+    cells = concat_categorical_frames([cube, delta])
+    merged = cells.groupby(dims, observed=True, sort=False, dropna=False)[CUBE_MEASURES].sum().reset_index()
+    return _restore_dtypes(merged, cells.dtypes[dims])
+
+
+def set_backend(name):
+    '''
+    Selects the backend building the cubes of get_cube, and so computing every cube-based aggregation (success
+    rates, average costs, leaderboards, the country plots, ...). Returns the name of the previous backend
+
+    Note: both backends return the same cube; cubes are cached per backend
+
+    @param name: 'pandas' (in-memory groupby, the default) or 'duckdb' (embedded DuckDB, see sql_backend)
+    @type name: str
+    '''
+    global _backend
+    assert name in CUBE_BACKENDS, 'unknown backend {}'.format(name)
+
+    previous, _backend = _backend, name
+    return previous
+
+
+def get_backend():
+    '''
+    Returns the name of the backend building the cubes of get_cube
+    '''
+    return _backend
+
+
+def _cube_builder():
+    '''
+    Returns the function building the cubes of the selected backend
+    '''
+    module, function = CUBE_BACKENDS[_backend]
+    return getattr(importlib.import_module(module), function)
+
+
+def get_cube(df, dims=CUBE_DIMENSIONS):
+    '''
+    Returns the aggregation cube of the dataframe, built by the selected backend (see set_backend) once per
+    dataframe and version of its cube columns. A dataframe that already is a cube (e.g. one maintained by
+    incremental.IncrementalStore or read by sql_backend.parquet_cube) is returned as is
+
+    Note: a cached cube is found without reading the rows of the dataframe (see helper_func.frame_version for
+          the in-place edits it does not see; clear _cube_cache after those)
+
+    @param df: cleaned dataframe or cube
+    @param dims: dimensions of the cube (see build_cube)
+    @type df: pd.DataFrame
+    @type dims: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(dims, list)
+
+    if is_cube(df):
+        return df
+    columns = [col for col in dims + ['MissionCost'] if col in df.columns]
+    key = (id(df), frame_version(df, columns), _backend)
+    entry = _cube_cache.get(key)
+    #the weak reference tells the frame apart from a later one reusing its id
+    if entry is not None and entry[0]() is df:
+        _cube_cache.move_to_end(key)
+    else:
+        entry = (weakref.ref(df), _cube_builder()(df, dims))
+        _cube_cache[key] = entry
+        while len(_cube_cache) > CUBE_CACHE_SIZE:
+            _cube_cache.popitem(last=False)
+    return entry[1]
+
+
+def index_cube(cube):
+    '''
+    Returns the BitmapIndex of the cells of the cube, built on first use and kept as long as the cube exists.
+    cube_query uses it for the cubes of get_cube and for every cube indexed with this function
+
+    Note: the cube must not be modified once indexed (cubes are never modified in place by this module)
+
+    @param cube: cube returned by build_cube, get_cube or merge_cubes
+    @type cube: pd.DataFrame
+    '''
+    assert is_cube(cube)
+
+    entry = _cube_indexes.get(id(cube))
+    if entry is not None and entry[0]() is cube:
+        return entry[1]
+    index = BitmapIndex(cube, [dim for dim in INDEX_DIMENSIONS if dim in cube.columns])
+    key = id(cube)
+    _cube_indexes[key] = (weakref.ref(cube, lambda _: _cube_indexes.pop(key, None)), index)
+    return index
+
+
+def _cube_index(cube):
+    '''
+    Returns the BitmapIndex of the cube if it is indexed or cached by get_cube, None otherwise (slices of a cube
+    are filtered with masks rather than indexed once per slice)
+
+    @param cube: cube
+    @type cube: pd.DataFrame
+    '''
+    entry = _cube_indexes.get(id(cube))
+    if entry is not None and entry[0]() is cube:
+        return entry[1]
+    if any(cached is cube for _, cached in _cube_cache.values()):
+        return index_cube(cube)
+    return None
+
+
+@instrument
+def cube_query(cube, by, where=None, sort=False):
+    '''
+    Returns the measures of the cube rolled up to the dimensions in `by`, after slicing it with `where`
+
+    Note: besides CUBE_MEASURES, the result has the derived columns cost_mean (mean of the known costs) and
+          cost_pos_mean (mean of the costs > 0). Groups are listed in order of first appearance in the data
+          unless sort is True
+
+    @param cube: cube returned by build_cube or get_cube
+    @param by: list of dimensions to keep
+    @param where: dictionary with keys as dimensions and values as a value or a list of values to keep
+    @param sort: sort the result by the `by` dimensions
+    @type cube: pd.DataFrame
+    @type by: List
+    @type where: Dict
+    @type sort: bool
+    '''
+    assert isinstance(cube, pd.DataFrame)
+    assert isinstance(by, list) and all(dim in cube.columns for dim in by)
+    assert where is None or (isinstance(where, dict) and all(dim in cube.columns for dim in where))
+    assert isinstance(sort, bool)
+
+    if where:
+        index = _cube_index(cube)
+        if index is not None:
+            #indexed dimensions select the cells through the index, the others are checked on those cells
+            cube = cube.iloc[index.select({dim: value for dim, value in where.items() if dim in index.dims})]
+            where = {dim: value for dim, value in where.items() if dim not in index.dims}
+        mask = np.ones(len(cube), dtype=bool)
+        for dim, value in where.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= cube[dim].isin(values).to_numpy()
+        cube = cube[mask]
+
+    if by:
+        result = cube.groupby(by, observed=True, sort=False, dropna=False)[CUBE_MEASURES].sum().reset_index()
+        result = _restore_dtypes(result, cube.dtypes[by])
+    else:
+        result = pd.DataFrame({measure: [cube[measure].sum()] for measure in CUBE_MEASURES})
+    if sort and by:
+        result = result.sort_values(by, ignore_index=True)
+
+    result['cost_mean'] = result['cost_sum'] / result['cost_count'].where(result['cost_count'] > 0)
+    result['cost_pos_mean'] = result['cost_pos_sum'] / result['cost_pos_count'].where(result['cost_pos_count'] > 0)
+    return result
+
+
+if os.environ.get(BACKEND_ENV):
+    set_backend(os.environ[BACKEND_ENV])
@@ -0,0 +1,314 @@
+'''
+Benchmark suite of the cleaning pipeline and the analysis functions
+
+Runs pre_processing, every cleaning step of helper_func and every analysis/plotting function at 1x (the real csv),
+100x and 1000x scale (synthetic_data), and writes the timings as json. Analysis caches are cleared before every
+run, so the timings are cold. Two result files can be compared to catch regressions:
+
+    python benchmark_suite.py [--scales 1,100,1000] [--repeat 3] [--filter NAME] [--output results.json]
+    python benchmark_suite.py --compare BASE.json NEW.json [--threshold 1.25]
+'''
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import importlib.util
+import subprocess
+import numpy as np
+import pandas as pd
+import helper_func
+import aggregation_cube
+import cardinality
+import bitmap_index
+import timeseries
+import memoize
+from synthetic_data import synthetic_csv
+from data_cleaning_pre_processing import pre_processing, location_rules, CLEAN_SCHEMA
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(_BASE_DIR, '.cache', 'benchmarks')
+SCALES = [1, 100, 1000]
+
+
+def cleaning_benchmarks(path):
+    '''
+    Returns the list of (name, function, setup) cleaning benchmarks of the csv file: pre_processing and every step
+    of clean_dataframe, each step timed on a copy (made by setup, outside the timing) of the output of the previous
+    ones. The vectorized steps are followed by the per-row baseline they replaced, timed on the same input
+
+    @param path: path of the csv file
+    @type path: str
+    '''
+    assert isinstance(path, str)
+
+    stages = [('load_dataframe', lambda df: helper_func.load_dataframe(path)),
+              ('drop_columns', lambda df: helper_func.drop_columns(df, ['Unnamed: 0', 'Unnamed: 0.1'])),
+              ('rename_columns', lambda df: helper_func.rename_columns(df, {
+                  'Company Name': 'Company', 'Status Rocket': 'RocketStatus', ' Rocket': 'MissionCost',
+                  'Status Mission': 'MissionStatus'})),
+              ('convert_str_float', lambda df: df.assign(MissionCost=helper_func.convert_str_float(df, 'MissionCost'))),
+              ('split_detail', lambda df: df.join(df['Detail'].str.split('|', n=1, expand=True).set_axis(
+                  ['LaunchVehicle', 'RocketName'], axis=1)).drop(columns='Detail')),
+              ('split_date', lambda df: helper_func.split_date(df, 'Datum', 2)),
+              ('location_split_col', lambda df: pd.concat(
+                  [df, helper_func.location_split_col(df['Location'], ',')], axis=1).drop(columns='Location')),
+              ('merge_mission_status', lambda df: df.assign(MissionStatus=df['MissionStatus'].replace(
+                  {'Prelaunch Failure': 'Failure', 'Partial Failure': 'Failure'}))),
+              ('apply_location_rules', lambda df: helper_func.apply_location_rules(df, location_rules())),
+              ('fill_empty_with_NaN', lambda df: df.assign(
+                  **{'State/Region': helper_func.fill_empty_with_NaN(df, 'State/Region', '')})),
+              ('apply_schema', lambda df: helper_func.apply_schema(df, CLEAN_SCHEMA))]
+
+    #per-row implementations the vectorized steps replaced, timed on the same input as the step
+    baselines = {'convert_str_float': ('convert_str_float (per-row baseline)', lambda df: df.assign(
+                     MissionCost=df['MissionCost'].apply(lambda x: str(x).replace(',', '')).astype(np.float64))),
+                 'location_split_col': ('location_split (per-row baseline)', lambda df: pd.concat(
+                     [df, pd.DataFrame([helper_func.location_split(x, ',') for x in df['Location']], index=df.index,
+                                       columns=['LaunchCenter', 'SpaceCenter', 'State/Region', 'Country'])],
+                     axis=1).drop(columns='Location'))}
+
+    benchmarks = [('pre_processing', pre_processing, lambda: (path,))]
+    df = None
+    for name, stage in stages:
+        setup = lambda df=df: (None if df is None else df.copy(),)
+        benchmarks.append((name, stage, setup))
+        if name in baselines:
+            benchmarks.append(baselines[name] + (setup,))
+        df = stage(None if df is None else df.copy())
+    return benchmarks
+
+
+def analysis_benchmarks(df, df_datum=None):
+    '''
+    Returns the list of (name, function, setup) benchmarks of the analysis and plotting functions on the cleaned
+    dataframe
+
+    @param df: cleaned dataframe
+    @param df_datum: cleaned dataframe keeping the launch times (pre_processing(..., keep_datum=True)), for the
+                     time series benchmarks (None skips them)
+    @type df: pd.DataFrame
+    @type df_datum: pd.DataFrame
+    '''
+    import company_col_utils
+    import Launch_Vehicle_all_in_one
+    import countries_leaderboard_activevsretired
+    import leaderboard
+    from report_renderer import FIGURES
+
+    assert isinstance(df, pd.DataFrame)
+
+    data = lambda: (df,)
+    benchmarks = [
+        ('calculate_company_success_launch_rate', company_col_utils.calculate_company_success_launch_rate, data),
+        ('calculate_company_average_launch_cost', company_col_utils.calculate_company_average_launch_cost, data),
+        ('calculate_country_average_launch_cost', company_col_utils.calculate_country_average_launch_cost, data),
+        ('alpha3code', company_col_utils.alpha3code, lambda: (df['Country'],)),
+        ('alpha2code', company_col_utils.alpha2code, lambda: (df['Country'],)),
+        ('calculate_company_per_country', company_col_utils.calculate_company_per_country, data),
+        ('numerate_mission_status', Launch_Vehicle_all_in_one.numerate_mission_status, lambda: (df.copy(),)),
+        ('launch_vehicle_stats', Launch_Vehicle_all_in_one.launch_vehicle_stats, data),
+        ('most_widely_used_LVs', Launch_Vehicle_all_in_one.most_widely_used_LVs, data),
+        ('country_leaderboard_active_data', countries_leaderboard_activevsretired.country_leaderboard_active_data, data),
+        ('country_leaderboard_retired_data', countries_leaderboard_activevsretired.country_leaderboard_retired_data,
+         data),
+        ('leaderboard:Company/successes/year/k3', leaderboard.leaderboard,
+         lambda: (df, 'Company', 'successes', 'year', 3)),
+        ('leaderboard:LaunchVehicle/launches/year/k5/w10', leaderboard.leaderboard,
+         lambda: (df, 'LaunchVehicle', 'launches', 'year', 5, 10)),
+    ]
+
+    #aggregation cube built by each backend (the duckdb one only when duckdb is installed)
+    benchmarks.append(('aggregation_cube:build_cube/pandas', aggregation_cube.build_cube, data))
+    if importlib.util.find_spec('duckdb') is not None:
+        import sql_backend
+        benchmarks.append(('aggregation_cube:build_cube/duckdb', sql_backend.build_cube_sql, data))
+
+    #inverted index of the launches: build once, then drill-down filters, each followed by the boolean mask it
+    #replaces
+    index = lambda: (bitmap_index.BitmapIndex(df),)
+    benchmarks += [
+        ('bitmap_index:build', bitmap_index.BitmapIndex, data),
+        ('bitmap_index:select/Country+Year range', lambda index: index.select({'Country': 'USA'},
+                                                                               {'Year': (1990, 2000)}), index),
+        ('bitmap_index:select/Country+Year range (mask baseline)', lambda df: np.flatnonzero(
+            ((df['Country'] == 'USA') & df['Year'].between(1990, 2000)).to_numpy()), data),
+        ('bitmap_index:select/Company+MissionStatus', lambda index: index.select(
+            {'Company': ['SpaceX', 'ULA'], 'MissionStatus': 'Success'}), index),
+        ('bitmap_index:select/Company+MissionStatus (mask baseline)', lambda df: np.flatnonzero(
+            (df['Company'].isin(['SpaceX', 'ULA']) & (df['MissionStatus'] == 'Success')).to_numpy()), data),
+        ('bitmap_index:select/Country+MissionStatus+RocketStatus', lambda index: index.select(
+            {'Country': 'Russia', 'MissionStatus': 'Success', 'RocketStatus': 'StatusRetired'}), index),
+        ('bitmap_index:select/Country+MissionStatus+RocketStatus (mask baseline)', lambda df: np.flatnonzero(
+            ((df['Country'] == 'Russia') & (df['MissionStatus'] == 'Success') &
+             (df['RocketStatus'] == 'StatusRetired')).to_numpy()), data),
+    ]
+
+    #time series on the full launch times (built from a frame keeping Datum, outside the timing)
+    series = lambda: (timeseries.LaunchTimeSeries(df_datum),)
+    benchmarks += [] if df_datum is None else [
+        ('timeseries:build', timeseries.LaunchTimeSeries, lambda: (df_datum,)),
+        ('timeseries:resample/month/Country', lambda ts: ts.resample('month', 'Country'), series),
+        ('timeseries:rolling/month/12/Company', lambda ts: ts.rolling('month', 12, 'Company'), series),
+        ('timeseries:last/6/month/Country', lambda ts: ts.last(6, 'month', 'Country'), series),
+    ]
+
+    #plots: the figures of the report, built without writing them
+    def build_figure(name):
+        import matplotlib.pyplot as plt
+
+        module, function, kwargs = FIGURES[name]
+        getattr(__import__(module), function)(df, **kwargs)
+        plt.close('all')
+
+    for name in FIGURES:
+        benchmarks.append(('figure:' + name, build_figure, lambda name=name: (name,)))
+    return benchmarks
+
+
+def clear_caches():
+    '''
+    Clears the in-memory caches of the analysis layer, so the next call is timed cold
+    '''
+    aggregation_cube._cube_cache.clear()
+    cardinality._index_cache.clear()
+    timeseries._series_cache.clear()
+    memoize.invalidate()
+
+
+def time_call(function, repeat, setup=None):
+    '''
+    Returns the list of wall times (in seconds) of `repeat` cold calls of the function
+
+    @param function: function to time
+    @param repeat: number of calls
+    @param setup: function returning the tuple of arguments of one call, not timed (None calls without arguments)
+    @type repeat: int
+    '''
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        clear_caches()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(scales=SCALES, repeat=3, name_filter=None, seed=0, verbose=True):
+    '''
+    Returns the list of benchmark results, one dictionary per (benchmark, scale) with the group, number of
+    raw rows, and the best/mean/all wall times in seconds
+
+    @param scales: sizes of the data relative to Space_Corrected.csv
+    @param repeat: number of timed calls of each benchmark
+    @param name_filter: only run the benchmarks whose name contains this string
+    @param seed: seed of the synthetic data
+    @param verbose: print every result as it is measured
+    @type scales: List
+    @type repeat: int
+    @type name_filter: str
+    @type seed: int
+    @type verbose: bool
+    '''
+    import matplotlib
+
+    assert isinstance(scales, list) and all(isinstance(x, int) and x > 0 for x in scales)
+    assert isinstance(repeat, int) and repeat > 0
+    assert name_filter is None or isinstance(name_filter, str)
+
+    matplotlib.use('Agg')
+    results = []
+    for scale in scales:
+        path = synthetic_csv(scale, seed)
+        rows = sum(1 for _ in open(path, encoding='utf-8', errors='replace')) - 1
+        df = pre_processing(path)
+        df_datum = pre_processing(path, keep_datum=True)
+        for group, benchmarks in [('cleaning', cleaning_benchmarks(path)),
+                                  ('analysis', analysis_benchmarks(df, df_datum))]:
+            for name, function, setup in benchmarks:
+                if name_filter is not None and name_filter not in name:
+                    continue
+                times = time_call(function, repeat, setup)
+                result = {'group': group, 'benchmark': name, 'scale': scale, 'rows': rows, 'repeat': repeat,
+                          'best_seconds': min(times), 'mean_seconds': float(np.mean(times)), 'seconds': times}
+                results.append(result)
+                if verbose:
+                    print('{:>5}x {:<9} {:<48} {:10.4f} s'.format(scale, group, name, result['best_seconds']))
+    return results
+
+
+def run_metadata():
+    '''
+    Returns the metadata recorded with the results: commit, time and versions
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=_BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def compare_results(base, new, threshold=1.25):
+    '''
+    Returns the list of (group, benchmark, scale, base seconds, new seconds, ratio) of the benchmarks found in both
+    result files, and the subset of them slower than threshold times the base
+
+    @param base: results file contents (as written by main) of the reference run
+    @param new: results file contents of the run to check
+    @param threshold: ratio of the best times above which a benchmark counts as a regression
+    @type base: Dict
+    @type new: Dict
+    @type threshold: float
+    '''
+    assert isinstance(base, dict) and isinstance(new, dict)
+    assert isinstance(threshold, (int, float)) and threshold > 0
+
+    base_times = {(x['group'], x['benchmark'], x['scale']): x['best_seconds'] for x in base['results']}
+    rows = []
+    for x in new['results']:
+        key = (x['group'], x['benchmark'], x['scale'])
+        if key in base_times:
+            ratio = x['best_seconds'] / base_times[key] if base_times[key] > 0 else float('inf')
+            rows.append(key + (base_times[key], x['best_seconds'], ratio))
+    return rows, [row for row in rows if row[-1] > threshold]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cleaning pipeline and the analysis functions')
+    parser.add_argument('--scales', default=','.join(str(x) for x in SCALES), help='comma-separated data scales')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls of each benchmark')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this string')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--output', default=None, help='json results file (default .cache/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two results files')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        rows, regressions = compare_results(base, new, args.threshold)
+        for group, name, scale, base_s, new_s, ratio in rows:
+            print('{:>5}x {:<9} {:<48} {:10.4f} {:10.4f} {:6.2f}{}'.format(
+                scale, group, name, base_s, new_s, ratio, '  REGRESSION' if ratio > args.threshold else ''))
+        return 1 if regressions else 0
+
+    metadata = run_metadata()
+    results = run_suite([int(x) for x in args.scales.split(',')], args.repeat, args.filter, args.seed)
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(metadata['commit'] or 'results'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'metadata': metadata, 'results': results}, f, indent=2)
+    print('results written to {}'.format(output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+'''
+Inverted index of the space data for fast multi-predicate filtering
+
+A BitmapIndex stores, for every value of the indexed columns, the sorted list of the positions of the rows
+holding it (all lists of a column share one array, ordered by value, with an offset per value). A filter starts
+from the shortest list among its predicates and checks the other predicates on those rows only, through the
+integer code of every row, so its cost depends on the selected rows rather than on the size of the frame. When
+even the shortest list holds a large share of the rows, the predicates are combined as packed bitsets instead (one
+bit per row, kept for the frequent values), which costs a few bitwise ANDs over size / 8 bytes. The values of a
+column are sorted, so a range predicate (e.g. years 1990-2000) is one contiguous slice:
+
+    index = BitmapIndex(df)
+    rows = index.select({'Country': 'USA', 'MissionStatus': 'Success'}, ranges={'Year': (1990, 2000)})
+    df.iloc[rows]
+
+aggregation_cube indexes its cached cubes this way, so cube_query filters (plot_hist, company_usa_plot, the
+leaderboards, the query service) only read the selected cells.
+'''
+import numpy as np
+import pandas as pd
+
+#columns indexed by default
+INDEX_DIMENSIONS = ['Country', 'Company', 'LaunchVehicle', 'Year', 'MissionStatus', 'RocketStatus']
+
+#a value gets a packed bitset (size / 8 bytes) when it holds at least 1 / DENSE_RATIO of the rows, so the bitsets of
+#a column take at most DENSE_RATIO / 8 bytes per row; selections whose shortest list holds at least that share of
+#the rows are combined as bitsets
+DENSE_RATIO = 16
+
+
+class BitmapIndex:
+    '''
+    Sorted row-position lists per value of the indexed columns of a dataframe, and packed bitsets of the frequent
+    values
+
+    Note: positions are the row numbers of the frame (use df.iloc). Missing values are not indexed, so no
+          predicate selects them. The index describes the frame when it was built; it is not updated
+    '''
+
+    def __init__(self, df, dims=INDEX_DIMENSIONS):
+        '''
+        @param df: dataframe to index (cleaned data or aggregation cube)
+        @param dims: columns to index
+        @type df: pd.DataFrame
+        @type dims: List
+        '''
+        assert isinstance(df, pd.DataFrame)
+        assert isinstance(dims, list) and all(dim in df.columns for dim in dims)
+
+        self.dims = list(dims)
+        self.size = len(df)
+        self.values = {}
+        self.lookup = {}
+        self.codes = {}
+        self.rows = {}
+        self.offsets = {}
+        self.bitsets = {}
+        for dim in self.dims:
+            codes, values = pd.factorize(df[dim], sort=True)
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            counts = np.bincount(codes[codes >= 0], minlength=len(values))
+            self.values[dim] = pd.Index(values)
+            self.lookup[dim] = {value: code for code, value in enumerate(self.values[dim])}
+            self.codes[dim] = codes.astype(np.int32)
+            self.rows[dim] = order[len(codes) - counts.sum():]
+            self.offsets[dim] = np.concatenate([[0], np.cumsum(counts)])
+            self.bitsets[dim] = {int(code): np.packbits(codes == code)
+                                 for code in np.flatnonzero(counts * DENSE_RATIO >= self.size)}
+
+    def _codes(self, dim, values):
+        '''
+        Returns the sorted codes of the given values of a column (unknown values are ignored)
+
+        @param dim: indexed column
+        @param values: value or list of values
+        @type dim: str
+        '''
+        assert dim in self.dims, '{} is not indexed'.format(dim)
+
+        values = list(values) if isinstance(values, (list, tuple, set, np.ndarray, pd.Index)) else [values]
+        lookup = self.lookup[dim]
+        return np.unique(np.array([lookup[x] for x in values if x in lookup], dtype=np.int64))
+
+    def _range_codes(self, dim, low, high):
+        '''
+        Returns the codes of the values of a column from low to high (both included, None for no bound)
+
+        @param dim: indexed column
+        @type dim: str
+        '''
+        assert dim in self.dims, '{} is not indexed'.format(dim)
+
+        values = self.values[dim]
+        first = 0 if low is None else values.searchsorted(low, side='left')
+        last = len(values) if high is None else values.searchsorted(high, side='right')
+        return np.arange(first, max(first, last))
+
+    def _postings(self, dim, codes):
+        '''
+        Returns the positions of the rows holding one of the codes of a column, and whether they are sorted
+
+        Note: the positions may be a view of the row array of the column, do not modify them
+
+        @param dim: indexed column
+        @param codes: sorted codes
+        '''
+        offsets = self.offsets[dim]
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int32), True
+        if codes[-1] - codes[0] + 1 == len(codes):
+            #consecutive codes (a range) are one slice of the column's row array, the positions of one value are
+            #already sorted
+            return self.rows[dim][offsets[codes[0]]:offsets[codes[-1] + 1]], len(codes) == 1
+        return np.concatenate([self.rows[dim][offsets[code]:offsets[code + 1]] for code in codes]), False
+
+    def _sorted(self, rows):
+        '''
+        Returns the sorted copy of distinct row positions: through a row mask when they are many, by sorting
+        them otherwise
+
+        @param rows: distinct row positions
+        '''
+        if len(rows) * 16 > self.size:
+            selected = np.zeros(self.size, dtype=bool)
+            selected[rows] = True
+            return np.flatnonzero(selected).astype(np.int32)
+        return np.sort(rows)
+
+    def _bitset(self, dim, codes):
+        '''
+        Returns the packed bitset of the rows holding one of the codes of a column
+
+        @param dim: indexed column
+        @param codes: sorted codes
+        '''
+        bitsets = self.bitsets[dim]
+        if all(code in bitsets for code in codes):
+            bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            for code in codes:
+                bits |= bitsets[code]
+            return bits
+        if codes[-1] - codes[0] + 1 == len(codes):
+            #consecutive codes (a range) are two comparisons of the codes (missing values, -1, are below the range)
+            return np.packbits((self.codes[dim] >= codes[0]) & (self.codes[dim] <= codes[-1]))
+        wanted = np.zeros(len(self.values[dim]) + 1, dtype=bool)
+        wanted[codes] = True
+        #missing values have the code -1, i.e. the last (always False) slot of wanted
+        return np.packbits(wanted[self.codes[dim]])
+
+    def select(self, where=None, ranges=None):
+        '''
+        Returns the sorted positions of the rows matching every predicate
+
+        @param where: dictionary with keys as indexed columns and values as a value or a list of values to keep
+        @param ranges: dictionary with keys as indexed columns and values as (low, high) bounds, both included
+                       (None for no bound)
+        @type where: Dict
+        @type ranges: Dict
+        '''
+        assert where is None or isinstance(where, dict)
+        assert ranges is None or isinstance(ranges, dict)
+
+        predicates = [(dim, self._codes(dim, values)) for dim, values in (where or {}).items()]
+        predicates += [(dim, self._range_codes(dim, low, high)) for dim, (low, high) in (ranges or {}).items()]
+        if not predicates:
+            return np.arange(self.size)
+
+        sizes = [int(np.sum(self.offsets[dim][codes + 1] - self.offsets[dim][codes])) for dim, codes in predicates]
+        if len(predicates) > 1 and min(sizes) * DENSE_RATIO >= self.size:
+            #every predicate selects a large share of the rows: AND their bitsets
+            bits = self._bitset(*predicates[0])
+            for dim, codes in predicates[1:]:
+                bits &= self._bitset(dim, codes)
+            return np.flatnonzero(np.unpackbits(bits, count=self.size).view(bool)).astype(np.int32)
+
+        #start from the predicate selecting the fewest rows, check the others on its rows only, and sort the rows
+        #left at the end
+        first = int(np.argmin(sizes))
+        dim, codes = predicates[first]
+        rows, ordered = self._postings(dim, codes)
+        for i, (dim, codes) in enumerate(predicates):
+            if i == first or len(rows) == 0:
+                continue
+            wanted = np.zeros(len(self.values[dim]) + 1, dtype=bool)
+            wanted[codes] = True
+            #missing values have the code -1, i.e. the last (always False) slot of wanted
+            rows = rows[wanted[self.codes[dim][rows]]]
+        return rows.copy() if ordered else self._sorted(rows)
+
+    def count(self, where=None, ranges=None):
+        '''
+        Returns the number of rows matching every predicate (see select)
+
+        @param where: dictionary of the value predicates
+        @param ranges: dictionary of the range predicates
+        @type where: Dict
+        @type ranges: Dict
+        '''
+        return len(self.select(where, ranges))
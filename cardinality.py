@@ -0,0 +1,165 @@
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from helper_func import frame_version
+from instrumentation import instrument
+from memoize import memoize
+
+#dimensions of the space data whose pairwise distinct counts can be queried
+DIMENSIONS = ['Company', 'Country', 'LaunchVehicle', 'SpaceCenter', 'Year']
+
+#number of co-occurrence indexes kept in memory by cooccurrence_index
+INDEX_CACHE_SIZE = 8
+#indexes of cooccurrence_index: (id(df), frame_version of its dimension columns) -> (weak reference to df, index)
+_index_cache = OrderedDict()
+
+
+class CooccurrenceIndex:
+    '''
+    Sparse co-occurrence structure of the space data: the set of distinct (Company, Country, LaunchVehicle,
+    SpaceCenter, Year) combinations, each dimension stored as integer codes. Every distinct-count question
+    between two dimensions is answered from this set (usually a few percent of the rows) instead of the rows
+
+    Note: missing values (e.g. a Country of None) have the code -1 and are not counted, like pd.Series.nunique
+    '''
+
+    def __init__(self, df, dims=DIMENSIONS):
+        '''
+        @param df: cleaned dataframe
+        @param dims: dimensions to index
+        @type df: pd.DataFrame
+        @type dims: List
+        '''
+        assert isinstance(df, pd.DataFrame)
+        assert isinstance(dims, list) and all(dim in df.columns for dim in dims)
+
+        self.dims = list(dims)
+        self.labels = {}
+        codes = {}
+        for dim in self.dims:
+            codes[dim], uniques = pd.factorize(df[dim])
+            codes[dim] = codes[dim].astype(np.int32)
+            self.labels[dim] = np.asarray(uniques, dtype=object)
+        self.combinations = pd.DataFrame(codes).drop_duplicates(ignore_index=True)
+        self._pairs = {}
+
+    def _pair(self, by, of):
+        '''
+        Returns the distinct (by, of) code pairs sorted by (by, of), without missing values
+
+        @param by: dimension to group by
+        @param of: dimension whose distinct values are counted
+        @type by: str
+        @type of: str
+        '''
+        assert by in self.dims and of in self.dims and by != of
+
+        if (by, of) not in self._pairs:
+            pairs = self.combinations[[by, of]]
+            pairs = pairs[(pairs[by] >= 0) & (pairs[of] >= 0)].drop_duplicates()
+            self._pairs[(by, of)] = pairs.sort_values([by, of], ignore_index=True)
+        return self._pairs[(by, of)]
+
+    def distinct_counts(self, by, of):
+        '''
+        Returns a series indexed by the values of `by` (in order of first appearance in the data) with the number
+        of distinct values of `of` seen together with each of them
+
+        @param by: dimension to group by
+        @param of: dimension whose distinct values are counted
+        @type by: str
+        @type of: str
+        '''
+        pairs = self._pair(by, of)
+        counts = np.bincount(pairs[by].to_numpy(), minlength=len(self.labels[by]))
+        present = np.flatnonzero(counts)
+        return pd.Series(counts[present], index=pd.Index(self.labels[by][present], name=by), name=of)
+
+    def distinct_members(self, by, of):
+        '''
+        Returns a series indexed by the values of `by` (in order of first appearance in the data) with the list
+        of distinct values of `of` seen together with each of them
+
+        @param by: dimension to group by
+        @param of: dimension whose distinct values are listed
+        @type by: str
+        @type of: str
+        '''
+        pairs = self._pair(by, of)
+        by_codes = pairs[by].to_numpy()
+        of_labels = self.labels[of][pairs[of].to_numpy()]
+        if len(by_codes) == 0:
+            return pd.Series([], index=pd.Index([], name=by), name=of, dtype=object)
+
+        #pairs are sorted by `by`, so every value of `by` owns one contiguous run of `of` values
+        starts = np.flatnonzero(np.r_[True, by_codes[1:] != by_codes[:-1]])
+        members = [list(x) for x in np.split(of_labels, starts[1:])]
+        return pd.Series(members, index=pd.Index(self.labels[by][by_codes[starts]], name=by), name=of, dtype=object)
+
+    def matrix(self):
+        '''
+        Returns a dataframe with, for every ordered pair of dimensions (row `by`, column `of`), the largest number
+        of distinct `of` values seen together with a single `by` value
+
+        '''
+        matrix = pd.DataFrame(index=self.dims, columns=self.dims, dtype=object)
+        for by in self.dims:
+            for of in self.dims:
+                if by != of:
+                    counts = self.distinct_counts(by, of)
+                    matrix.loc[by, of] = int(counts.max()) if len(counts) else 0
+        return matrix
+
+
+@instrument
+def cooccurrence_index(df, dims=DIMENSIONS):
+    '''
+    Returns the CooccurrenceIndex of the dataframe, built once per dataframe and version of its dimension columns
+
+    Note: a cached index is found without reading the rows of the dataframe (see helper_func.frame_version for
+          the in-place edits it does not see; clear _index_cache after those)
+
+    @param df: cleaned dataframe
+    @param dims: dimensions to index
+    @type df: pd.DataFrame
+    @type dims: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(dims, list)
+
+    key = (id(df), frame_version(df, dims))
+    entry = _index_cache.get(key)
+    #the weak reference tells the frame apart from a later one reusing its id
+    if entry is not None and entry[0]() is df:
+        _index_cache.move_to_end(key)
+    else:
+        entry = (weakref.ref(df), CooccurrenceIndex(df, dims))
+        _index_cache[key] = entry
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return entry[1]
+
+
+@instrument
+@memoize
+def distinct_counts(df, by, of, members=False):
+    '''
+    Returns the number of distinct values of `of` for every value of `by` (or the lists of those values if members
+    is True), as a series indexed by the values of `by` in order of first appearance in the data
+
+    @param df: cleaned dataframe
+    @param by: dimension to group by, one of DIMENSIONS
+    @param of: dimension whose distinct values are counted, one of DIMENSIONS
+    @param members: return the lists of distinct values instead of their number
+    @type df: pd.DataFrame
+    @type by: str
+    @type of: str
+    @type members: bool
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert by in DIMENSIONS and of in DIMENSIONS
+    assert isinstance(members, bool)
+
+    index = cooccurrence_index(df, [dim for dim in DIMENSIONS if dim in df.columns])
+    return index.distinct_members(by, of) if members else index.distinct_counts(by, of)
@@ -1,12 +1,9 @@
 import pandas as pd
-import numpy as np
-import os
-import pycountry
-from geopy.geocoders import Nominatim
-import geopandas
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-import matplotlib.pyplot as plt
-from data_cleaning_pre_processing import *
+from aggregation_cube import get_cube, cube_query
+from geocoding import geocode_many
+from geo_store import world_with_latlong, resolve_country_codes
+from instrumentation import instrument
+from memoize import memoize
 
 def location_split(x):
     """
@@ -19,6 +16,8 @@ def location_split(x):
         t.insert(2, "")
     return t
 
+@instrument
+@memoize
 def calculate_company_success_launch_rate(space_data):
     """
     Calculate rocket launch success rate for each company with valid values
@@ -27,18 +26,14 @@ def calculate_company_success_launch_rate(space_data):
     """
 
     assert isinstance(space_data, pd.DataFrame)
-    company_mission = space_data[['Company', 'MissionStatus']]
+    cube = get_cube(space_data)
 
-    company_mission = company_mission[company_mission['MissionStatus'] == "Success"]
-    company_mission['success_count'] = company_mission.groupby(['Company'])['MissionStatus'].transform('count')
-    company_mission = company_mission.drop_duplicates().reset_index(drop=True)
-    company_mission_success_count = company_mission[['Company', 'success_count']]
+    total_company_mission = cube_query(cube, ['Company'])[['Company', 'launches']]
+    total_company_mission = total_company_mission.rename(columns={'launches': 'total_count'})
 
-    total_company_mission = space_data[['Company', 'MissionStatus']]
-    total_company_mission["total_count"] = total_company_mission.groupby(['Company'])['MissionStatus'].transform(
-        'count')
-    total_company_mission = total_company_mission.drop_duplicates(subset=['Company']).drop(
-        columns=['MissionStatus']).reset_index(drop=True)
+    company_mission_success_count = cube_query(cube, ['Company'], where={'MissionStatus': 'Success'})
+    company_mission_success_count = company_mission_success_count[['Company', 'launches']].rename(
+        columns={'launches': 'success_count'})
 
     total_company_mission = pd.merge(total_company_mission, company_mission_success_count, on='Company',
                                      how='outer').fillna(0)
@@ -46,6 +41,8 @@ def calculate_company_success_launch_rate(space_data):
         "total_count"]
     return total_company_mission
 
+@instrument
+@memoize
 def calculate_company_average_launch_cost(space_data):
     """
     Calculate average launch cost for each company. Exclude unreasonable values.
@@ -53,21 +50,16 @@ def calculate_company_average_launch_cost(space_data):
     :return: dataframe with success rate for each valid company
     """
     assert isinstance(space_data, pd.DataFrame)
-    company_cost = space_data[['Company', 'MissionCost']]
-    company_cost = company_cost[company_cost['MissionCost'] > 0]
+    company_cost = cube_query(get_cube(space_data), ['Company'], sort=True)
+    company_cost = company_cost[company_cost['cost_pos_count'] > 0].reset_index(drop=True)
 
-    company_launch_count_cost = company_cost.copy()
-    company_launch_count_cost['launch_count'] = company_launch_count_cost.groupby(['Company'])['MissionCost'].transform(
-        'count')
-    company_launch_count_cost = company_launch_count_cost.drop(columns=["MissionCost"])
-    company_launch_count_cost = company_launch_count_cost.drop_duplicates().reset_index(drop=True)
-
-    company_cost = company_cost.groupby("Company").sum()
-
-    company_average_cost = company_cost.merge(company_launch_count_cost, on="Company", how="inner")
+    company_average_cost = company_cost[['Company', 'cost_pos_sum', 'cost_pos_count']].rename(
+        columns={'cost_pos_sum': 'MissionCost', 'cost_pos_count': 'launch_count'})
     company_average_cost["average_cost"] = company_average_cost["MissionCost"] / company_average_cost["launch_count"]
     return company_average_cost
 
+@instrument
+@memoize
 def calculate_country_average_launch_cost(space_data):
     """
     Calculate average launch cost for each country.
@@ -75,101 +67,63 @@ def calculate_country_average_launch_cost(space_data):
     :return: dataframe with success rate for each valid country
     """
     assert isinstance(space_data, pd.DataFrame)
-    country_cost = space_data[['Country', 'MissionCost']]
-    country_cost = country_cost[country_cost['MissionCost'] > 0]
-
-    country_launch_count_cost = country_cost.copy()
-    country_launch_count_cost['launch_count'] = country_launch_count_cost.groupby(['Country'])['MissionCost'].transform(
-        'count')
-    country_launch_count_cost = country_launch_count_cost.drop(columns=["MissionCost"])
-    country_launch_count_cost = country_launch_count_cost.drop_duplicates().reset_index(drop=True)
+    country_cost = cube_query(get_cube(space_data), ['Country'], sort=True)
+    country_cost = country_cost[country_cost['cost_pos_count'] > 0].reset_index(drop=True)
 
-    country_cost = country_cost.groupby("Country").sum()
-
-    country_average_cost = country_cost.merge(country_launch_count_cost, on="Country", how="inner")
+    country_average_cost = country_cost[['Country', 'cost_pos_sum', 'cost_pos_count']].rename(
+        columns={'cost_pos_sum': 'MissionCost', 'cost_pos_count': 'launch_count'})
     country_average_cost["average_cost"] = country_average_cost["MissionCost"] / country_average_cost["launch_count"]
     return country_average_cost
 
+@instrument
+@memoize
 def alpha3code(column):
     """
     helper function to convert standard 3 code
     :param column: pd series
-    :return: code columns
+    :return: code columns (None for unknown countries)
     """
     assert isinstance(column, pd.Series)
-    CODE=[]
-    for country in column:
-        country = country.rstrip().lstrip()
-        if country == "USA":
-            country = "United States"
-        elif country == "South Korea":
-            country = "Korea, Republic of"
-        elif country == "Russia":
-            country = "Russian Federation"
-        elif country == "North Korea":
-            country = "Korea, Democratic People's Republic of"
-        try:
-            code=pycountry.countries.get(name=country).alpha_3
-            CODE.append(code)
-        except Exception as e:
-            CODE.append('None')
-    return CODE
+    codes = resolve_country_codes(column)['ISO3'].astype(object)
+    return codes.where(codes.notna(), None).tolist()
 
+@instrument
+@memoize
 def alpha2code(column):
     """
     helper function to convert standard 2 code
     :param column: pd series
-    :return: code columns
+    :return: code columns (None for unknown countries)
     """
     assert isinstance(column, pd.Series)
-    CODE=[]
-    for country in column:
-        country = country.rstrip().lstrip()
-        if country == "USA":
-            country = "United States"
-        elif country == "South Korea":
-            country = "Korea, Republic of"
-        elif country == "Russia":
-            country = "Russian Federation"
-        elif country == "North Korea":
-            country = "Korea, Democratic People's Republic of"
-        try:
-            code=pycountry.countries.get(name=country).alpha_2
-            CODE.append(code)
-        except Exception as e:
-            CODE.append(None)
-    return CODE
+    codes = resolve_country_codes(column)['ISO2'].astype(object)
+    return codes.where(codes.notna(), None).tolist()
 
 
 # function to get longitude and latitude data from country name
-geolocator = Nominatim()
-def geolocate(country):
+def geolocate(country, backend=None):
     """
     calculate coords
-    :param country: country name
+    :param country: country name or alpha-3 code
+    :param backend: geocoder used for places missing from the cache and the offline table (None stays offline)
     :return: location
     """
-    try:
-        # Geolocate the center of the country
-        loc = geolocator.geocode(country)
-        # And return latitude and longitude
-        return (loc.latitude, loc.longitude)
-    except:
-        # Return missing value
-        return np.nan
+    return geocode_many([country], backend=backend)[0]
 
 
-def geolocate_col(column):
+@instrument
+def geolocate_col(column, backend=None):
     """
-    calculate location for a column
+    calculate location for a column, looking up every distinct value once
     :param column: pd series
+    :param backend: geocoder used for places missing from the cache and the offline table (None stays offline)
     :return: coords as a new column
     """
-    coords = []
-    for code in column:
-        coords.append(geolocate(code))
-    return coords
+    assert isinstance(column, pd.Series)
+    return geocode_many(column, backend=backend)
 
+@instrument
+@memoize
 def calculate_company_per_country(space_data):
     """
     Calculate number of company per country
@@ -187,50 +141,53 @@ def calculate_company_per_country(space_data):
     company_country["coord"] = geolocate_col(company_country.code)
     company_country.dropna(inplace=True)
 
-    # first let us merge geopandas data with our data
-    # 'naturalearth_lowres' is geopandas datasets so we can use it directly
-    world = geopandas.read_file(geopandas.datasets.get_path('naturalearth_lowres'))
-    # rename the columns so that we can merge with our data
-    world.columns = ['pop_est', 'continent', 'name', 'code', 'gdp_md_est', 'geometry']
-    # then merge with our data
-    merge = pd.merge(world, company_country, on='code', how="outer")
-    # last thing we need to do is - merge again with our location data which contains each country’s latitude and longitude
-    location = pd.read_csv(
-        'https://raw.githubusercontent.com/melanieshi0120/COVID-19_global_time_series_panel_data/master/data/countries_latitude_longitude.csv')
-    merge = merge.merge(location, on='name').sort_values(by='counrty_count', ascending=False).reset_index()
+    # merge the bundled country geometries (already joined with each country's latitude and longitude) with our data
+    merge = pd.merge(world_with_latlong(), company_country, on='code', how="outer")
+    merge = merge[merge['name'].notna()].sort_values(by='counrty_count', ascending=False).reset_index()
 
     merge[["counrty_count"]] = merge[['counrty_count']].fillna(value=0)
     return merge
 
 
 
+@instrument
 def visualize_country_average_launch_cost(country_average_cost):
     """
     visualization
     :param country_average_cost:  calculate_country_average_launch_cost
-    :return: plot
+    :return: matplotlib figure
     """
     country_average_cost.sort_values(inplace=True, by='average_cost')
     ax = country_average_cost.plot(kind="barh", x='Country', y='average_cost', rot=0, figsize=(30, 10))
+    return ax.figure
 
+@instrument
 def visualize_company_average_launch_cost(company_average_cost):
     """
     visualization
     :param company_average_cost:  calculate_company_average_launch_cost
-    :return: plot
+    :return: matplotlib figure
     """
     company_average_cost.sort_values(inplace=True, by='average_cost')
     ax = company_average_cost.plot(kind="barh", x='Company', y='average_cost', rot=0, figsize=(30, 10))
+    return ax.figure
 
-def visualize_num_company_per_country(merge):
+@instrument
+def visualize_num_company_per_country(merge, path="./fig.jpg", dpi=800):
     """
     visualization
-    :param company_average_cost:  calculate_company_per_country
-    :return: plot
+    :param merge:  calculate_company_per_country
+    :param path: image file the plot is saved to (None does not save it)
+    :param dpi: resolution of the saved image
+    :return: matplotlib figure
     """
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
 
     fig, ax = plt.subplots(1, 1)
     divider = make_axes_locatable(ax)
     cax = divider.append_axes("right", size="5%", pad=0.1)
     merge.plot(column='counrty_count', ax=ax, figsize=(25, 20), legend=True, cax=cax)
-    plt.savefig("./fig.jpg", dpi=800)
+    if path is not None:
+        fig.savefig(path, dpi=dpi)
+    return fig
@@ -8,47 +8,47 @@ Original file is located at
 """
 
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from sklearn.preprocessing import LabelEncoder
+from leaderboard import leaderboard
+from instrumentation import instrument
+from memoize import memoize
+from figure_budget import fit_figure
 
 import warnings
 warnings.filterwarnings("ignore")
 
 
+@instrument
+@memoize
 def country_leaderboard_active_data(data):
   '''This function gets the data 
   highlighting with the leading country in
   the most number of active rockets that particular year
   across the years'''
   assert isinstance(data,pd.DataFrame)
-  ds = data[data['RocketStatus']=='StatusActive']
-  ds = ds.groupby(['Year', 'Country'])['RocketStatus'].count().reset_index().sort_values(['Year', 'RocketStatus'], ascending=False)
-  ds = pd.concat([group[1].head(1) for group in ds.groupby(['Year'])])
-  ds.columns = ['Year', 'Country', 'launches']
-  return ds
+  ds = leaderboard(data, 'Country', 'active', 'year', k=1)
+  return ds[['Year', 'Country', 'active']].rename(columns={'active': 'launches'})
 
+@instrument
+@memoize
 def country_leaderboard_retired_data(data):
   '''This function gets the data 
   highlighting with the leading country in
   the most number of retired rockets that particular year
   across the years'''
   assert isinstance(data,pd.DataFrame)
-  ds = data[data['RocketStatus']=='StatusRetired']
-  ds = ds.groupby(['Year', 'Country'])['RocketStatus'].count().reset_index().sort_values(['Year', 'RocketStatus'], ascending=False)
-  ds = pd.concat([group[1].head(1) for group in ds.groupby(['Year'])])
-  ds.columns = ['Year', 'Country', 'launches']
-  return ds
+  ds = leaderboard(data, 'Country', 'retired', 'year', k=1)
+  return ds[['Year', 'Country', 'retired']].rename(columns={'retired': 'launches'})
 
-def country_leaderboard_active_plots(data):
+@instrument
+def country_leaderboard_active_plots(data, show=True, size_budget=None):
   '''This function produces a bar graph 
   highlighting with the leading country in
   the most number of active rockets that particular year
-  across the years'''
+  across the years (displayed if show is True,
+  and returned; size_budget is the largest serialized
+  size of the figure in bytes, see figure_budget)'''
+  import plotly.express as px
+
   assert isinstance(data,pd.DataFrame)
   ds = country_leaderboard_active_data(data)
   fig = px.bar(
@@ -59,13 +59,21 @@ def country_leaderboard_active_plots(data):
       title='Leaders by Active Rockets for every year (countries)',
       width=800
   )
-  fig.show()
+  fig = fit_figure(fig, size_budget)
+  if show:
+    fig.show()
+  return fig
 
-def country_leaderboard_retired_plots(data):
+@instrument
+def country_leaderboard_retired_plots(data, show=True, size_budget=None):
   '''This function produces a bar graph 
   highlighting with the leading country in
   the most number of retired rockets that particular year
-  across the years'''
+  across the years (displayed if show is True,
+  and returned; size_budget is the largest serialized
+  size of the figure in bytes, see figure_budget)'''
+  import plotly.express as px
+
   assert isinstance(data,pd.DataFrame)
   ds = country_leaderboard_retired_data(data)
   fig = px.bar(
@@ -76,4 +84,7 @@ def country_leaderboard_retired_plots(data):
       title='Leaders by Retired Rockets for every year (countries)',
       width=800
   )
-  fig.show()
\ No newline at end of file
+  fig = fit_figure(fig, size_budget)
+  if show:
+    fig.show()
+  return fig
\ No newline at end of file
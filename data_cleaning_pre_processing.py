@@ -1,16 +1,160 @@
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from helper_func import *
+from helper_func import (load_dataframe, load_dataframe_chunks, load_location_rules, drop_columns, rename_columns,
+                         convert_str_float, split_date, location_split_col, apply_location_rules, fill_empty_with_NaN,
+                         apply_schema, memory_report, concat_categorical_frames)
+from instrumentation import instrument, stage
 
-def pre_processing(path):
+#rough ratio between the peak memory of clean_dataframe and the size of the raw chunk it is given
+CLEANING_MEMORY_FACTOR = 4
+
+#declarative table of the custom location corrections, applied in file order
+LOCATION_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),'location_rules.csv')
+_location_rules = None
+
+MONTH_ORDER = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+#compact dtypes of the cleaned dataframe (columns not listed keep their dtype)
+CLEAN_SCHEMA = {
+  'Company': 'category',
+  'Country': 'category',
+  'LaunchVehicle': 'category',
+  'SpaceCenter': 'category',
+  'LaunchCenter': 'category',
+  'RocketStatus': pd.CategoricalDtype(['StatusActive', 'StatusRetired']),
+  'MissionStatus': pd.CategoricalDtype(['Failure', 'Success']),
+  'Month': pd.CategoricalDtype(MONTH_ORDER, ordered=True),
+  'Year': np.int16,
+}
+
+@instrument
+def pre_processing(path,compact=True,report=False,keep_datum=False,strict=False):
   '''
   Returns the final dataframe after performing all data cleaning and pre-procesing steps
+  If report is True, returns a tuple (dataframe, memory report) where the report is the per-column memory
+  usage before and after applying CLEAN_SCHEMA
   @param path: path of the csv file
+  @param compact: apply the compact CLEAN_SCHEMA dtypes at the end of cleaning
+  @param report: also return the per-column memory report
+  @param keep_datum: keep the parsed launch timestamp (UTC) as the Datum column
+  @param strict: raise ValueError on values outside the fixed categories of CLEAN_SCHEMA (see apply_schema)
   @type path: str
+  @type compact: bool
+  @type report: bool
+  @type keep_datum: bool
+  @type strict: bool
 
   '''
   #loading the dataframe from csv file
   space_data = load_dataframe(path)
+  return clean_dataframe(space_data,compact,report,keep_datum=keep_datum,strict=strict)
+
+def shard_paths(paths):
+  '''
+  Returns the list of csv shard paths of a glob pattern (sorted, so the order does not depend on the file system)
+  or of a list of paths (kept in the given order)
+  @param paths: glob pattern (e.g. 'shards/*.csv') or list of csv paths
+  @type paths: str or List
+
+  '''
+  if isinstance(paths,str):
+    resolved = sorted(glob.glob(paths))
+    assert len(resolved) > 0, 'no file matches {}'.format(paths)
+    return resolved
+  assert isinstance(paths,(list,tuple)) and len(paths) > 0
+  assert all(isinstance(x,str) for x in paths)
+  return list(paths)
+
+def _clean_shard(args):
+  '''
+  Returns (number of csv rows, cleaned dataframe) of one shard (runs in a worker process of pre_processing_shards)
+  @param args: tuple (path, compact, keep_datum)
+
+  '''
+  path,compact,keep_datum = args
+  space_data = load_dataframe(path)
+  return len(space_data),clean_dataframe(space_data,compact,keep_datum=keep_datum)
+
+@instrument
+def pre_processing_shards(paths,workers=None,compact=True,keep_datum=False):
+  '''
+  Returns the cleaned dataframe of several csv shards in the Space_Corrected.csv format, cleaning the shards in
+  parallel in a process pool
+  Note: the result does not depend on the number of workers or on which shard finishes first: the shards are
+        concatenated in the order of shard_paths, their row indexes follow each other (as if the shards had been
+        one csv file) and the categories of the categorical columns are reconciled into their sorted union, so
+        the result equals pre_processing of the concatenated shards. Every worker gets whole shards, so use at
+        least as many shards as workers
+  @param paths: glob pattern or list of csv paths, see shard_paths
+  @param workers: number of worker processes (None uses the number of CPUs, 1 cleans in this process)
+  @param compact: apply the compact CLEAN_SCHEMA dtypes (the workers also send back less data)
+  @param keep_datum: keep the parsed launch timestamp (UTC) as the Datum column
+  @type paths: str or List
+  @type workers: int
+  @type compact: bool
+  @type keep_datum: bool
+
+  '''
+  assert workers is None or (isinstance(workers,int) and workers > 0)
+  assert isinstance(compact,bool)
+
+  paths = shard_paths(paths)
+  workers = min(workers or os.cpu_count() or 1,len(paths))
+  tasks = [(path,compact,keep_datum) for path in paths]
+  if workers == 1:
+    results = [_clean_shard(task) for task in tasks]
+  else:
+    #map returns the results in the order of the tasks
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      results = list(pool.map(_clean_shard,tasks))
+
+  #cleaning drops some rows, so the index of a shard starts after the csv rows of the shards before it
+  frames = []
+  offset = 0
+  for rows,frame in results:
+    frame.index = frame.index + offset
+    frames.append(frame)
+    offset += rows
+  return concat_categorical_frames(frames) if compact else pd.concat(frames)
+
+def location_rules():
+  '''
+  Returns the location correction rules of LOCATION_RULES_PATH (read once per process)
+
+  '''
+  global _location_rules
+  if _location_rules is None:
+    _location_rules = load_location_rules(LOCATION_RULES_PATH)
+  return _location_rules
+
+@instrument
+def clean_dataframe(space_data,compact=True,report=False,rules=None,keep_datum=False,strict=False):
+  '''
+  Returns the final dataframe after performing all data cleaning and pre-procesing steps on the raw dataframe
+  If report is True, returns a tuple (dataframe, memory report), see pre_processing
+  Note: every step only depends on the row itself, so cleaning chunks of the csv and concatenating them
+        gives the same result as cleaning the whole file (use concat_categorical_frames to keep the
+        categorical columns when concatenating)
+  @param space_data: raw dataframe as read from the csv file
+  @param compact: apply the compact CLEAN_SCHEMA dtypes at the end of cleaning
+  @param report: also return the per-column memory report
+  @param rules: location correction rules (defaults to the rules of LOCATION_RULES_PATH)
+  @param keep_datum: keep the parsed launch timestamp (UTC) as the Datum column
+  @param strict: raise ValueError on values outside the fixed categories of CLEAN_SCHEMA (see apply_schema)
+  @type space_data: pd.DataFrame
+  @type compact: bool
+  @type report: bool
+  @type rules: pd.DataFrame
+  @type keep_datum: bool
+  @type strict: bool
+
+  '''
+  assert isinstance(space_data,pd.DataFrame)
+  assert isinstance(compact,bool)
+  assert isinstance(report,bool)
 
   #Remove irrelevant columns
   space_data = drop_columns(space_data,['Unnamed: 0','Unnamed: 0.1'])
@@ -22,60 +166,123 @@ def pre_processing(path):
   space_data['MissionCost'] = convert_str_float(space_data,'MissionCost')
 
   #Splitting the Detail column into two: Launch vehicle name and Rocket name
-  space_data[['LaunchVehicle', 'RocketName']] = space_data['Detail'].str.split('|',expand=True)
-  space_data=space_data.drop(['Detail'],axis=1)
+  #(only the first '|' separates them, any further '|' stays in the rocket name)
+  with stage('split_detail',len(space_data)) as s:
+    space_data[['LaunchVehicle', 'RocketName']] = space_data['Detail'].str.split('|',n=1,expand=True)
+    space_data=space_data.drop(['Detail'],axis=1)
+    s.rows_out = len(space_data)
 
   #Splitting the Datum column to month and year
-  space_data = split_date(space_data,'Datum',2)
+  space_data = split_date(space_data,'Datum',2,keep=keep_datum)
 
   #Function to split the Location column
-  space_data["Location"] =  pd.Series([location_split(x,',') for x in space_data['Location']])
-  split_df = pd.DataFrame(space_data['Location'].to_list(),columns=("LaunchCenter","SpaceCenter","State/Region","Country"))
-  space_data = pd.concat([space_data, split_df], axis=1)
-  space_data = space_data.drop(['Location'],axis=1)
+  split_df = location_split_col(space_data['Location'],',')
+  with stage('concat_location',len(space_data)) as s:
+    space_data = pd.concat([space_data, split_df], axis=1)
+    space_data = space_data.drop(['Location'],axis=1)
+    s.rows_out = len(space_data)
 
   #merge Partial and Prelaunch failure categories
   space_data['MissionStatus'] = space_data['MissionStatus'].replace({'Prelaunch Failure':'Failure','Partial Failure':'Failure'})
 
   #custom mappings!
-  #map the below names to repsective countries
+  #map the location names listed in the rule table to respective countries (see location_rules.csv)
+  space_data = apply_location_rules(space_data,location_rules() if rules is None else rules)
 
-  #New mexico
-  space_data.loc[(space_data["Country"] == "New Mexico"),"State/Region"] = "New Mexico"
-  space_data.loc[(space_data["State/Region"] == "New Mexico"),"Country"] = "USA"
+  #fill empty values with NaN
+  space_data['State/Region'] = fill_empty_with_NaN(space_data,'State/Region','')
+
+  if not (compact or report):
+    return space_data
+  compact_data = apply_schema(space_data,CLEAN_SCHEMA,strict)
+  if report:
+    return (compact_data if compact else space_data), memory_report(space_data,compact_data)
+  return compact_data
+
+def chunk_rows_for_memory(path,max_memory_mb,sample_rows=1000):
+  '''
+  Returns the number of csv rows per chunk so that cleaning one chunk stays within max_memory_mb
+  Note: the size of a raw row is estimated from the first sample_rows rows of the file
+  @param path: path of the csv file
+  @param max_memory_mb: memory ceiling for one chunk, in MB
+  @param sample_rows: number of rows used for the estimate
+  @type path: str
+  @type max_memory_mb: float
+  @type sample_rows: int
 
-  #Launch Plateform, Shahrud Missile Test Site
-  space_data.loc[(space_data["Country"] == "Shahrud Missile Test Site"),"SpaceCenter"] = "Shahrud Missile Test Site"
-  space_data.loc[(space_data["SpaceCenter"] == 'Shahrud Missile Test Site'),"Country"] = "Iran"
-  space_data.loc[(space_data["SpaceCenter"] == 'Shahrud Missile Test Site'),"LaunchCenter"] = "Launch Plateform"
+  '''
+  assert isinstance(path,str)
+  assert isinstance(max_memory_mb,(int,float)) and max_memory_mb > 0
+  assert isinstance(sample_rows,int) and sample_rows > 0
 
-  #Tai Rui Barge, Yellow Sea, China
-  space_data.loc[(space_data["Country"] == 'Yellow Sea'),"State/Region"] = "Yellow Sea"
-  space_data.loc[(space_data["State/Region"] == 'Yellow Sea'),"Country"] = "China"
-  space_data.loc[(space_data["State/Region"] == 'Yellow Sea'),"LaunchCenter"] = "Tai Rui Barge"
-  space_data.loc[(space_data["State/Region"] == 'Yellow Sea'),"SpaceCenter"] = ""
+  sample = pd.read_csv(path,nrows=sample_rows)
+  row_bytes = sample.memory_usage(index=True,deep=True).sum() / max(len(sample),1)
+  return max(int(max_memory_mb * 2**20 / (row_bytes * CLEANING_MEMORY_FACTOR)),1)
 
-  #LP-41, Kauai, Pacific Missile Range Facility
-  space_data.loc[(space_data["Country"] == 'Pacific Missile Range Facility'),"SpaceCenter"] = "Pacific Missile Range Facility"
-  space_data.loc[(space_data["SpaceCenter"] == 'Pacific Missile Range Facility'),"State/Region"] = "Kauai"
-  space_data.loc[(space_data["SpaceCenter"] == 'Pacific Missile Range Facility'),"Country"] = "USA"
+def pre_processing_chunks(path,chunksize=None,max_memory_mb=256,compact=True):
+  '''
+  Yields the cleaned dataframe chunk by chunk, reading the csv file in bounded chunks
+  Note: chunks keep the row index of the csv file, so concat_categorical_frames of all chunks equals
+        pre_processing(path, compact)
+  @param path: path of the csv file
+  @param chunksize: number of csv rows per chunk (derived from max_memory_mb when None)
+  @param max_memory_mb: memory ceiling for cleaning one chunk, in MB
+  @param compact: apply the compact CLEAN_SCHEMA dtypes to every chunk
+  @type path: str
+  @type chunksize: int
+  @type max_memory_mb: float
+  @type compact: bool
 
-  #Stargazer, Base Aerea de Gando, Gran Canaria---------(dropping the two rows)
-  #space_data.loc[(space_data["Country"] == 'Gran Canaria'),"State/Region"] = "Gran Canaria"
-  #space_data.loc[(space_data["State/Region"] == 'Gran Canaria'),"Country"] = "USA"
-  space_data=space_data[(space_data.Country != "Gran Canaria")]
+  '''
+  assert isinstance(path,str)
+  assert chunksize is None or (isinstance(chunksize,int) and chunksize > 0)
 
-  #K-407 Submarine, Barents Sea Launch Area, Barents Sea
-  space_data.loc[(space_data["Country"] == 'Barents Sea'),"State/Region"] = "Barents Sea"
-  space_data.loc[(space_data["Country"] == 'Barents Sea'),"Country"] = "Russia"
+  if chunksize is None:
+    chunksize = chunk_rows_for_memory(path,max_memory_mb)
+  for chunk in load_dataframe_chunks(path,chunksize):
+    yield clean_dataframe(chunk,compact)
 
-  #Sea Launch - LP Odyssey, Kiritimati Launch Area, Pacific Ocean
-  space_data.loc[(space_data["Country"] == 'Pacific Ocean'),"State/Region"] = "Pacific Ocean"
-  space_data.loc[(space_data["State/Region"] == 'Pacific Ocean'),"Country"] = "Kiritimati"
+@instrument
+def pre_processing_to_file(path,out_path,chunksize=None,max_memory_mb=256):
+  '''
+  Cleans the csv file chunk by chunk and writes the result to out_path without holding the full dataframe in memory
+  Returns the number of rows written
+  Note: out_path ending with .parquet is written with pyarrow, any other extension is written as csv
+  @param path: path of the csv file
+  @param out_path: path of the cleaned output file
+  @param chunksize: number of csv rows per chunk (derived from max_memory_mb when None)
+  @param max_memory_mb: memory ceiling for cleaning one chunk, in MB
+  @type path: str
+  @type out_path: str
+  @type chunksize: int
+  @type max_memory_mb: float
 
-  space_data.loc[(space_data["Country"] == "Kazakhstan"),"Country"] = "Russia"
+  '''
+  assert isinstance(path,str)
+  assert isinstance(out_path,str)
 
-  #fill empty values with NaN
-  space_data['State/Region'] = fill_empty_with_NaN(space_data,'State/Region','')
+  rows = 0
+  if out_path.endswith('.parquet'):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
-  return space_data
+    writer = None
+    try:
+      #the categories differ from chunk to chunk, so the file stores plain strings
+      for chunk in pre_processing_chunks(path,chunksize,max_memory_mb,compact=False):
+        table = pa.Table.from_pandas(chunk,preserve_index=True)
+        if writer is None:
+          #a column that is all-NaN in the first chunk would otherwise be typed null for the whole file
+          schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema],
+                             metadata=table.schema.metadata)
+          writer = pq.ParquetWriter(out_path,schema)
+        writer.write_table(table.cast(schema))
+        rows += len(chunk)
+    finally:
+      if writer is not None:
+        writer.close()
+  else:
+    for i,chunk in enumerate(pre_processing_chunks(path,chunksize,max_memory_mb)):
+      chunk.to_csv(out_path,mode='w' if i == 0 else 'a',header=(i == 0))
+      rows += len(chunk)
+  return rows
@@ -0,0 +1,215 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from data_cleaning_pre_processing import pre_processing
+
+#default location of the cleaned-data cache (one sub-directory per source fingerprint)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+#files whose contents define the "version" of the cleaning code and of the cache layout
+CODE_FILES = ['data_cleaning_pre_processing.py', 'helper_func.py', 'location_rules.csv', 'dataset_cache.py']
+
+ROW_ID_COL = '__row_id__'
+MANIFEST = 'manifest.json'
+DATA_FILE = 'data.parquet'
+
+#rows per Parquet row group: the unit skipped by the Year/Country filters (through the row group statistics)
+ROW_GROUP_SIZE = 16384
+
+
+def source_fingerprint(path, block_size=1 << 20):
+    '''
+    Returns a hex digest identifying the csv file contents together with the cleaning code version
+
+    @param path: path of the csv file
+    @param block_size: number of bytes hashed at a time
+    @type path: str
+    @type block_size: int
+    '''
+    assert isinstance(path, str)
+    assert isinstance(block_size, int) and block_size > 0
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(code_dir, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:24]
+
+
+def write_cleaned_cache(df, dataset_dir):
+    '''
+    Writes the cleaned dataframe as a single Parquet file, together with a manifest holding the column order and
+    dtypes needed to restore the exact frame
+
+    Note: the rows are written in the order of the frame (the index is kept as the __row_id__ column), so reading
+          the file back needs no sort. The launches of the csv are in chronological order, so every row group
+          covers a short range of years and the Year statistics of the row groups let filtered reads skip them.
+          The dataset is written to a temporary directory first and moved in place, so a partially written
+          cache is never picked up by a reader
+
+    @param df: cleaned dataframe
+    @param dataset_dir: directory of the cached dataset
+    @type df: pd.DataFrame
+    @type dataset_dir: str
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(dataset_dir, str)
+
+    parent = os.path.dirname(os.path.abspath(dataset_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        table = pa.Table.from_pandas(df.rename_axis(ROW_ID_COL).reset_index(), preserve_index=False)
+        pq.write_table(table, os.path.join(tmp_dir, DATA_FILE), row_group_size=ROW_GROUP_SIZE)
+
+        manifest = {
+            'columns': list(df.columns),
+            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+            'categories': {col: {'categories': dtype.categories.tolist(), 'ordered': bool(dtype.ordered)}
+                           for col, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)},
+            'rows': len(df),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        if os.path.isdir(dataset_dir):
+            shutil.rmtree(dataset_dir)
+        os.replace(tmp_dir, dataset_dir)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def read_cleaned_cache(dataset_dir, columns=None, years=None, countries=None):
+    '''
+    Returns the cleaned dataframe stored in dataset_dir, reading only the requested columns and rows
+
+    Note: the Parquet file is memory-mapped and the years/countries filters are pushed down to the reader, which
+          skips the row groups whose statistics exclude them. Categorical columns are read as dictionaries and
+          turned into categoricals from their codes, without materializing the strings
+
+    @param dataset_dir: directory of the cached dataset
+    @param columns: list of columns to read (None reads all columns)
+    @param years: list of years to read (None reads all years)
+    @param countries: list of countries to read (None reads all countries)
+    @type dataset_dir: str
+    @type columns: List
+    @type years: List
+    @type countries: List
+    '''
+    import pyarrow.parquet as pq
+
+    assert isinstance(dataset_dir, str)
+    assert columns is None or isinstance(columns, list)
+    assert years is None or isinstance(years, list)
+    assert countries is None or isinstance(countries, list)
+
+    with open(os.path.join(dataset_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if columns is None:
+        columns = manifest['columns']
+    assert all(col in manifest['dtypes'] for col in columns)
+
+    filters = []
+    if years is not None:
+        filters.append(('Year', 'in', [int(x) for x in years]))
+    if countries is not None:
+        filters.append(('Country', 'in', [str(x) for x in countries]))
+
+    categorical = [col for col in columns if col in manifest['categories']]
+    table = pq.read_table(os.path.join(dataset_dir, DATA_FILE), columns=[ROW_ID_COL] + columns,
+                          filters=filters or None, memory_map=True, read_dictionary=categorical)
+
+    data = {}
+    for col in columns:
+        if col in categorical:
+            data[col] = _dictionary_to_categorical(table.column(col),
+                                                   pd.CategoricalDtype(**manifest['categories'][col]))
+        else:
+            data[col] = table.column(col).to_pandas().to_numpy().astype(manifest['dtypes'][col], copy=False)
+    return pd.DataFrame(data, index=pd.Index(table.column(ROW_ID_COL).to_numpy()), columns=columns)
+
+
+def _dictionary_to_categorical(column, dtype):
+    '''
+    Returns the categorical of the dtype holding the values of the dictionary-encoded Arrow column
+
+    Note: every chunk has its own dictionary, so the codes of a chunk are mapped to the categories through its
+          dictionary (nulls and values missing from the categories become -1)
+
+    @param column: dictionary-encoded column
+    @param dtype: categorical dtype of the result
+    @type column: pa.ChunkedArray
+    @type dtype: pd.CategoricalDtype
+    '''
+    codes = np.empty(len(column), dtype=np.int32)
+    start = 0
+    for chunk in column.chunks:
+        mapping = np.append(dtype.categories.get_indexer(chunk.dictionary.to_pandas()), -1).astype(np.int32)
+        indices = chunk.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+        codes[start:start + len(chunk)] = mapping[indices]
+        start += len(chunk)
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
+def cleaned_dataset_dir(path, cache_dir=CACHE_DIR):
+    '''
+    Returns the directory of the cached Parquet dataset of the csv file, cleaning the csv and writing the dataset
+    when no matching cache exists
+
+    @param path: path of the csv file
+    @param cache_dir: root directory of the cache
+    @type path: str
+    @type cache_dir: str
+    '''
+    assert isinstance(path, str)
+    assert isinstance(cache_dir, str)
+
+    dataset_dir = os.path.join(cache_dir, source_fingerprint(path))
+    if not os.path.isfile(os.path.join(dataset_dir, MANIFEST)):
+        write_cleaned_cache(pre_processing(path), dataset_dir)
+    return dataset_dir
+
+
+def load_cleaned(path, columns=None, years=None, countries=None, cache_dir=CACHE_DIR):
+    '''
+    Returns the same dataframe as pre_processing(path), served from a Parquet cache keyed by the csv contents
+    and the cleaning code version. The csv is only parsed and cleaned when no matching cache exists
+
+    @param path: path of the csv file
+    @param columns: list of columns to read (None reads all columns)
+    @param years: list of years to read (None reads all years)
+    @param countries: list of countries to read (None reads all countries)
+    @param cache_dir: root directory of the cache
+    @type path: str
+    @type columns: List
+    @type years: List
+    @type countries: List
+    @type cache_dir: str
+    '''
+    return read_cleaned_cache(cleaned_dataset_dir(path, cache_dir), columns, years, countries)
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    '''
+    Removes every cached dataset under cache_dir
+
+    @param cache_dir: root directory of the cache
+    @type cache_dir: str
+    '''
+    assert isinstance(cache_dir, str)
+
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
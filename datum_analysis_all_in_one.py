@@ -1,80 +1,127 @@
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
+from aggregation_cube import get_cube, cube_query
+from leaderboard import leaderboard
+from instrumentation import instrument
+from memoize import memoize
+from figure_budget import fit_figure
 
 
 
+@instrument
 def month_country_count(df):
   '''
   Displays the number of launches each month of the top 4 countries in that month
 
   @param df: The relevant dataframe to be displayed
   @type df: pd.DataFrame
+  @return: matplotlib figure
   '''
-  
+  import matplotlib.pyplot as plt
+  import seaborn as sns
+
   assert isinstance(df, pd.DataFrame)
 
   month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
-  df1 = df.groupby(['Month', 'Country']).size().reset_index().rename(columns={0:'Count'})
-  df2 = df1
-  x = []
-  for i in range(3):
-    df_sub = df2.sort_values('Count', ascending=False).drop_duplicates(['Month'])
-    #Get the indexes of these 12 rows
-    idx = df_sub.index.tolist()
-    x = x + idx
-    #Drop these 12 rows from df2
-    df2 = df2.drop(idx)
-    i += 1
-
-  df1 = df1.loc[x]
+  #top 3 countries of every month, listed rank by rank so the countries keep their legend order
+  df1 = leaderboard(df, 'Country', 'launches', 'month', k=3).rename(columns={'launches':'Count'})
+  df1 = df1.sort_values(['rank', 'Count'], ascending=[True, False], kind='mergesort')
 
   fig, ax = plt.subplots(figsize = (9,6))
   sns.barplot(data = df1, x = 'Month', y = 'Count', hue = 'Country', order = month_order, ax = ax).set(
     title = 'Top 5 Countries Launches Each Month'
     )
+  return fig
 
 
 
-def launch_each_month(df):
+@instrument
+def launch_each_month(df, show=True):
   '''
   Creates a bar graph of the number of launches(y-axis) with respect to each month(x-axis)
 
   The bars are in descending order, with the month that has the most launches being the left-most bar
 
   @param df: Relevant dataframe to be plotted
+  @param show: display the plot
   @type df: pd.DataFrame
+  @type show: bool
+  @return: matplotlib figure
   '''
+  import matplotlib.pyplot as plt
+  import seaborn as sns
 
   assert isinstance(df,pd.DataFrame)
 
   month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
-  plt.figure(figsize=(7,5))
-  ax = sns.countplot(x='Month', data=df, order=month_order, palette='Spectral')
+  month_counts = cube_query(get_cube(df), ['Month'])
+
+  fig = plt.figure(figsize=(7,5))
+  ax = sns.barplot(x='Month', y='launches', data=month_counts, order=month_order, palette='Spectral')
   ax.axes.set_title('Launch Count for Each Month',fontsize=18)
   ax.set_xlabel('Month',fontsize=16)
   ax.set_ylabel('Count',fontsize=16)
   ax.tick_params(labelsize=11)
   plt.tight_layout()
-  plt.show()
+  if show:
+    plt.show()
+  return fig
+
+
+
+@instrument
+@memoize
+def monthly_cost_average_data(df):
+    '''
+    Returns the average mission cost (of the launches with a known cost) for each month
+
+    @param df: The relevant dataframe (or its aggregation cube)
+    @type df: pd.DataFrame
+    @return: dataframe with the columns Month and MissionCost
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    month_to_cost = cube_query(get_cube(df), ['Month'], sort=True)
+    return month_to_cost[['Month', 'cost_mean']].rename(columns={'cost_mean': 'MissionCost'})
+
+
+
+@instrument
+@memoize
+def yearly_cost_average_data(df):
+    '''
+    Returns the average mission cost (of the launches with a known cost) for each year
+
+    @param df: The relevant dataframe (or its aggregation cube)
+    @type df: pd.DataFrame
+    @return: dataframe with the columns Year and MissionCost
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    year_to_cost = cube_query(get_cube(df), ['Year'], sort=True)
+    return year_to_cost[['Year', 'cost_mean']].rename(columns={'cost_mean': 'MissionCost'})
 
 
 
-def monthly_cost_average(df):
+@instrument
+def monthly_cost_average(df, show=True, size_budget=None):
     '''
     Create a plot that analyzes the average mission cost for each month
 
     @param df: The relevant dataframe
+    @param show: display the plot
+    @param size_budget: largest serialized size of the figure in bytes (see figure_budget.fit_figure)
     @type df: pd.DataFrame
+    @type show: bool
+    @type size_budget: int
+    @return: plotly figure
     '''
+    import plotly.express as px
 
     assert isinstance(df, pd.DataFrame)
 
-    month_to_cost = df.groupby('Month', as_index=False)['MissionCost'].mean()
+    month_to_cost = monthly_cost_average_data(df)
 
     fig = px.bar(
       month_to_cost,
@@ -85,21 +132,31 @@ def monthly_cost_average(df):
     )
     fig.update_xaxes(categoryorder='array', categoryarray= ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul',
                                                             'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-    fig.show()
+    fig = fit_figure(fig, size_budget)
+    if show:
+        fig.show()
+    return fig
 
 
 
-def yearly_cost_average(df):
+@instrument
+def yearly_cost_average(df, show=True, size_budget=None):
     '''
     Create a plot that analyzes the average mission cost for each month
 
     @param df: The relevant dataframe
+    @param show: display the plot
+    @param size_budget: largest serialized size of the figure in bytes (see figure_budget.fit_figure)
     @type df: pd.DataFrame
+    @type show: bool
+    @type size_budget: int
+    @return: plotly figure
     '''
+    import plotly.express as px
 
     assert isinstance(df, pd.DataFrame)
 
-    year_to_cost = df.groupby('Year', as_index=False)['MissionCost'].mean()
+    year_to_cost = yearly_cost_average_data(df)
 
     fig = px.bar(
       year_to_cost,
@@ -108,4 +165,7 @@ def yearly_cost_average(df):
       labels = {'Year': "Year", 'MissionCost': "Average Cost (In Millions)"},
       title = "Average Cost For Each Year"
     )
-    fig.show()
\ No newline at end of file
+    fig = fit_figure(fig, size_budget)
+    if show:
+        fig.show()
+    return fig
\ No newline at end of file
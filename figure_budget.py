@@ -0,0 +1,207 @@
+'''
+Serialized size of the plotly figures and size budgets
+
+Every plotly figure of the analysis modules goes through fit_figure before it is returned, which records its
+serialized (JSON) payload size in fig.layout.meta['payload_bytes'] and, given a size budget, shrinks it:
+
+    fig = total_missions_world_plot(df, size_budget=20000)
+    fig.layout.meta['payload_bytes']
+
+The geojson of animated maps is only kept in the first trace (animation frames reuse it). Past the budget,
+map outlines are rounded to fewer decimals, scatter traces with many points switch to WebGL (figures without
+animation frames), and line/scatter traces with a numeric x axis are downsampled, in this order, until the
+figure fits. Bars and histograms are never thinned, as each of their points is a category of the data.
+'''
+import math
+import numpy as np
+
+#scatter traces with more points than this are drawn with WebGL when the figure is over its budget
+WEBGL_MIN_POINTS = 1000
+
+#decimals tried, in order, for the map outlines of figures over their budget
+GEOJSON_DECIMALS_STEPS = [1, 0]
+
+#trace types thinned by downsample (dropping a bar would drop a category from the chart)
+DOWNSAMPLE_TYPES = ['scatter', 'scattergl']
+
+#per-point attributes sliced together with x when a trace is downsampled
+POINT_ATTRIBUTES = ['x', 'y', 'text', 'hovertext', 'customdata']
+
+
+def payload_size(fig):
+    '''
+    Returns the size in bytes of the figure serialized as JSON (what a notebook or an HTML export embeds)
+
+    @param fig: plotly figure
+    '''
+    return len(fig.to_json().encode('utf-8'))
+
+
+def _traces(fig):
+    '''
+    Returns the traces of the figure and of its animation frames
+
+    @param fig: plotly figure
+    '''
+    return list(fig.data) + [trace for frame in fig.frames for trace in frame.data]
+
+
+def share_frame_geojson(fig):
+    '''
+    Removes the geojson from the traces of the animation frames; animating a frame only updates the attributes
+    it sets, so the outlines of the first trace are kept
+
+    @param fig: plotly figure
+    '''
+    for frame in fig.frames:
+        for trace in frame.data:
+            if getattr(trace, 'geojson', None) is not None:
+                trace.geojson = None
+    return fig
+
+
+def _round_coordinates(coordinates, decimals):
+    '''
+    Returns the nested coordinate lists of a geojson geometry rounded to the given decimals, without the
+    consecutive positions of a ring that become equal (rings keep at least 4 positions)
+
+    @param coordinates: (nested lists of) [x, y] positions
+    @param decimals: number of decimals kept
+    @type decimals: int
+    '''
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    parts = [_round_coordinates(part, decimals) for part in coordinates]
+    if parts and isinstance(parts[0][0], (int, float)):
+        ring = [position for i, position in enumerate(parts) if i == 0 or position != parts[i - 1]]
+        if len(ring) >= 4:
+            return ring
+    return parts
+
+
+def round_geojson(fig, decimals):
+    '''
+    Rounds the coordinates of the geojson outlines of the figure to the given decimals
+
+    @param fig: plotly figure
+    @param decimals: number of decimals kept
+    @type decimals: int
+    '''
+    assert isinstance(decimals, int) and decimals >= 0
+
+    for trace in _traces(fig):
+        geojson = getattr(trace, 'geojson', None)
+        if geojson is None:
+            continue
+        features = [dict(feature, geometry=dict(feature['geometry'], coordinates=_round_coordinates(
+            feature['geometry']['coordinates'], decimals))) for feature in geojson['features']]
+        trace.geojson = dict(geojson, features=features)
+    return fig
+
+
+def _numeric_x(trace):
+    '''
+    Returns the x values of a trace as a float array, None when the trace has no numeric x values
+
+    @param trace: plotly trace
+    '''
+    x = getattr(trace, 'x', None)
+    if x is None or len(x) < 3:
+        return None
+    try:
+        return np.asarray(x, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+
+def use_webgl(fig, min_points=WEBGL_MIN_POINTS):
+    '''
+    Switches the scatter traces with more than min_points points to WebGL (scattergl)
+
+    Note: animated figures are left as they are, their frames update the traces by position and would
+          keep scatter traces
+
+    @param fig: plotly figure
+    @param min_points: smallest number of points drawn with WebGL
+    @type min_points: int
+    '''
+    import plotly.graph_objects as go
+
+    if fig.frames:
+        return fig
+    data = []
+    for trace in fig.data:
+        if trace.type == 'scatter' and trace.x is not None and len(trace.x) > min_points:
+            trace = go.Scattergl(trace.to_plotly_json())
+        data.append(trace)
+    fig.data = []
+    fig.add_traces(data)
+    return fig
+
+
+def downsample(fig, step):
+    '''
+    Keeps every step-th point in order of x (and the points of the lowest and highest x) of the line/scatter
+    traces with a numeric x axis; the kept points stay in their original order
+
+    @param fig: plotly figure
+    @param step: distance between two kept points
+    @type step: int
+    '''
+    assert isinstance(step, int) and step > 0
+
+    for trace in _traces(fig):
+        x = _numeric_x(trace)
+        if trace.type not in DOWNSAMPLE_TYPES or x is None or step == 1:
+            continue
+        #x is not always sorted (e.g. years listed in cube order)
+        order = np.argsort(x, kind='stable')
+        keep = np.sort(order[np.unique(np.r_[np.arange(0, len(x), step), len(x) - 1])])
+        for attribute in POINT_ATTRIBUTES:
+            values = getattr(trace, attribute, None)
+            if values is not None and not isinstance(values, str) and len(values) == len(x):
+                trace[attribute] = np.asarray(values)[keep]
+    return fig
+
+
+def fit_figure(fig, size_budget=None):
+    '''
+    Returns the figure after sharing the geojson of its animation frames and, if it is larger than size_budget,
+    shrinking it (see the module docstring). The final payload size (and the budget) is recorded in
+    fig.layout.meta
+
+    Note: the figure is shrunk in place; it may still exceed the budget when most of its payload is neither
+          map outlines nor line/scatter series (e.g. a bar per category, which is never dropped)
+
+    @param fig: plotly figure
+    @param size_budget: largest serialized size in bytes (None only records the size)
+    @type size_budget: int
+    '''
+    assert size_budget is None or (isinstance(size_budget, int) and size_budget > 0)
+
+    share_frame_geojson(fig)
+    size = payload_size(fig)
+    if size_budget is not None and size > size_budget:
+        for decimals in GEOJSON_DECIMALS_STEPS:
+            if not any(getattr(trace, 'geojson', None) is not None for trace in fig.data):
+                break
+            round_geojson(fig, decimals)
+            size = payload_size(fig)
+            if size <= size_budget:
+                break
+        if size > size_budget:
+            #the first step assumes the whole payload is points, then the points are halved while it still helps
+            use_webgl(fig)
+            step = math.ceil(size / size_budget)
+            while size > size_budget:
+                downsample(fig, step)
+                previous, size = size, payload_size(fig)
+                if size > 0.95 * previous:
+                    break
+                step = 2
+
+    meta = {'payload_bytes': size}
+    if size_budget is not None:
+        meta['size_budget'] = size_budget
+    fig.update_layout(meta=meta)
+    return fig
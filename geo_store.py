@@ -0,0 +1,234 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+#bundled geo assets, built once by build_geo_assets and read lazily by the loaders below
+GEO_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo_assets')
+COUNTRIES_PATH = os.path.join(GEO_ASSETS_DIR, 'countries.parquet')
+LATLONG_PATH = os.path.join(GEO_ASSETS_DIR, 'country_latlong.csv')
+CODES_PATH = os.path.join(GEO_ASSETS_DIR, 'country_codes.csv')
+
+#tolerance (in degrees) of the geometry simplification and number of decimals kept in the geojson coordinates
+SIMPLIFY_TOLERANCE = 0.2
+GEOJSON_DECIMALS = 2
+
+#Natural Earth leaves some alpha-3 codes as -99, fixed when the assets are built
+ISO_A3_FIXES = {'France': 'FRA', 'Norway': 'NOR', 'Kosovo': 'XKX'}
+
+#spellings of the space data with their ISO 3166 alpha-3 code, when they differ from the ISO and Natural Earth names
+COUNTRY_ALIASES = {
+    'USA': 'USA',
+    'Russia': 'RUS',
+    'North Korea': 'PRK',
+    'South Korea': 'KOR',
+    'Kiritimati': 'KIR',
+    'Iran': 'IRN',
+    'Kazakhstan': 'KAZ',
+}
+
+#columns returned by resolve_country_codes, with the column of country_codes.csv they come from
+CODE_COLUMNS = {'ISO2': 'iso_a2', 'ISO3': 'iso_a3', 'ISONumeric': 'iso_n3'}
+
+_memo = {}
+_resolved = {}
+
+
+def _memoized(key, build):
+    '''
+    Returns _memo[key], computing it with build() on first use
+
+    @param key: name of the asset
+    @param build: function returning the asset
+    @type key: str
+    '''
+    if key not in _memo:
+        _memo[key] = build()
+    return _memo[key]
+
+
+def build_geo_assets(out_dir=GEO_ASSETS_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    '''
+    Builds the bundled geo assets from the Natural Earth 1:110m countries shipped with geopandas:
+    countries.parquet (simplified geometries, GeoParquet), country_latlong.csv (a representative point of every
+    country) and country_codes.csv (country names of the space data joined to their ISO 3166 alpha-3 code)
+
+    Note: only needed when the assets change, the map functions read the bundled files
+
+    @param out_dir: directory the assets are written to
+    @param tolerance: tolerance of the geometry simplification, in degrees
+    @type out_dir: str
+    @type tolerance: float
+    '''
+    import geopandas
+
+    assert isinstance(out_dir, str)
+    assert isinstance(tolerance, (int, float)) and tolerance >= 0
+
+    world = geopandas.read_file(geopandas.datasets.get_path('naturalearth_lowres'))
+    world['iso_a3'] = world['name'].map(ISO_A3_FIXES).fillna(world['iso_a3'])
+    world['geometry'] = world.geometry.simplify(tolerance, preserve_topology=True)
+    os.makedirs(out_dir, exist_ok=True)
+    world.to_parquet(os.path.join(out_dir, 'countries.parquet'), index=False)
+
+    points = world.geometry.representative_point()
+    latlong = pd.DataFrame({'name': world['name'], 'latitude': points.y.round(6), 'longitude': points.x.round(6)})
+    latlong.to_csv(os.path.join(out_dir, 'country_latlong.csv'), index=False)
+
+    codes = code_table(world[['name', 'iso_a3']])
+    codes.to_csv(os.path.join(out_dir, 'country_codes.csv'), index=False)
+
+
+def code_table(names):
+    '''
+    Returns the dataframe of country names (the given names, the ISO 3166 names and COUNTRY_ALIASES) with their
+    alpha-2, alpha-3 and numeric ISO 3166 codes, as stored in country_codes.csv
+
+    @param names: dataframe of country names (name) with their alpha-3 code (iso_a3)
+    @type names: pd.DataFrame
+    '''
+    import pycountry
+
+    assert isinstance(names, pd.DataFrame)
+
+    iso = pd.DataFrame([(c.name, c.alpha_2, c.alpha_3, c.numeric) for c in pycountry.countries],
+                       columns=['name', 'iso_a2', 'iso_a3', 'iso_n3'])
+    aliases = pd.DataFrame({'name': list(COUNTRY_ALIASES), 'iso_a3': list(COUNTRY_ALIASES.values())})
+    codes = pd.concat([names[['name', 'iso_a3']], aliases, iso[['name', 'iso_a3']]], ignore_index=True)
+    codes = codes.drop_duplicates('name').merge(iso.drop(columns='name'), on='iso_a3', how='left')
+    return codes.fillna('')
+
+
+def world_geometries():
+    '''
+    Returns the GeoDataFrame of the simplified country geometries, with the columns of naturalearth_lowres
+    (pop_est, continent, name, iso_a3, gdp_md_est, geometry). Read once per process, do not modify in place
+
+    '''
+    import geopandas
+
+    return _memoized('countries', lambda: geopandas.read_parquet(COUNTRIES_PATH))
+
+
+def country_latlong():
+    '''
+    Returns the dataframe of country names with the latitude and longitude of a point inside each country.
+    Read once per process, do not modify in place
+
+    '''
+    return _memoized('latlong', lambda: pd.read_csv(LATLONG_PATH, keep_default_na=False))
+
+
+def country_codes():
+    '''
+    Returns a dataframe indexed by country name (Natural Earth names, ISO 3166 names and the spellings used in the
+    space data) with the iso_a2, iso_a3 and iso_n3 codes of every country ('' where a code does not exist).
+    Read once per process, do not modify in place
+
+    '''
+    return _memoized('codes', lambda: pd.read_csv(CODES_PATH, dtype=str, keep_default_na=False).set_index('name'))
+
+
+def _resolve_country(name):
+    '''
+    Returns the (alpha-2, alpha-3, numeric) ISO 3166 codes of a country name, with None for unknown codes
+
+    Note: names missing from country_codes.csv (which holds COUNTRY_ALIASES) are looked up with pycountry
+          (official and common names, codes)
+
+    @param name: country name, alias or code
+    @type name: str
+    '''
+    if name not in _resolved:
+        codes = country_codes()
+        key = name.strip()
+        if key in codes.index:
+            row = codes.loc[key]
+        else:
+            import pycountry
+
+            try:
+                country = pycountry.countries.lookup(key)
+                row = {'iso_a2': country.alpha_2, 'iso_a3': country.alpha_3, 'iso_n3': country.numeric}
+            except LookupError:
+                row = {}
+        _resolved[name] = tuple(row.get(col) or None for col in CODE_COLUMNS.values())
+    return _resolved[name]
+
+
+def resolve_country_codes(column):
+    '''
+    Returns a dataframe aligned with the column of country names with the ISO2, ISO3 and ISONumeric codes of every
+    country as categorical columns (NaN for missing or unknown countries)
+
+    Note: every distinct name is resolved once (and cached for the process), through COUNTRY_ALIASES, the bundled
+          code table and pycountry, so the cost grows with the number of countries, not of rows
+
+    @param column: country names
+    @type column: pd.Series
+    '''
+    assert isinstance(column, pd.Series)
+
+    codes, uniques = pd.factorize(column)
+    resolved = [_resolve_country(str(name)) for name in uniques]
+    result = {}
+    for i, col in enumerate(CODE_COLUMNS):
+        values = pd.Categorical([country[i] for country in resolved])
+        result_codes = np.where(codes >= 0, values.codes[codes] if len(values) else -1, -1)
+        result[col] = pd.Categorical.from_codes(result_codes, values.categories)
+    return pd.DataFrame(result, index=column.index)
+
+
+def world_with_latlong():
+    '''
+    Returns the country geometries joined with their latitude and longitude, the geometry columns renamed as
+    calculate_company_per_country expects them (code instead of iso_a3). Joined once per process
+
+    '''
+    def build():
+        world = world_geometries().rename(columns={'iso_a3': 'code'})
+        return world.merge(country_latlong(), on='name')
+
+    return _memoized('world_latlong', build)
+
+
+def _round_coords(coords, decimals):
+    '''
+    Returns the (nested) geojson coordinate lists rounded to decimals
+
+    @param coords: geojson coordinates
+    @param decimals: number of decimals kept
+    @type decimals: int
+    '''
+    if isinstance(coords[0], (int, float)):
+        return [round(x, decimals) for x in coords]
+    return [_round_coords(x, decimals) for x in coords]
+
+
+def country_geojson(codes=None, decimals=GEOJSON_DECIMALS):
+    '''
+    Returns a geojson FeatureCollection of the simplified countries (feature ids in properties.iso_a3), restricted
+    to the given alpha-3 codes, for px.choropleth(..., geojson=..., featureidkey='properties.iso_a3')
+
+    Note: only the plotted countries are shipped with the figure, and coordinates are rounded to `decimals`,
+          which keeps the payload small and does not need the plotly world topojson from the network
+
+    @param codes: alpha-3 codes of the countries to include (None includes every country)
+    @param decimals: number of decimals kept in the coordinates
+    @type codes: List
+    @type decimals: int
+    '''
+    assert codes is None or isinstance(codes, (list, tuple, set, pd.Series, pd.Index))
+    assert isinstance(decimals, int) and decimals >= 0
+
+    def build():
+        features = json.loads(world_geometries()[['iso_a3', 'name', 'geometry']].to_json())['features']
+        for feature in features:
+            geometry = feature['geometry']
+            geometry['coordinates'] = _round_coords(geometry['coordinates'], decimals)
+            del feature['id']
+        return {feature['properties']['iso_a3']: feature for feature in features}
+
+    features = _memoized(('geojson', decimals), build)
+    keys = features.keys() if codes is None else [code for code in dict.fromkeys(codes) if code in features]
+    return {'type': 'FeatureCollection', 'features': [features[key] for key in keys]}
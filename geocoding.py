@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#offline table of country and launch-site centroids (looked up by name or ISO 3166 alpha-3 code)
+CENTROIDS_PATH = os.path.join(_BASE_DIR, 'geo_assets', 'centroids.csv')
+
+#persistent cache of the lookups answered by a geocoder backend
+GEOCODE_CACHE_PATH = os.path.join(_BASE_DIR, '.cache', 'geocode.json')
+
+_centroids = None
+
+
+class StubGeocoder:
+    '''
+    Geocoder backend answering from an in-memory table, for tests and offline runs
+    '''
+
+    def __init__(self, table=None):
+        '''
+        @param table: dictionary with keys as queries and values as (latitude, longitude) tuples
+        @type table: Dict
+        '''
+        assert table is None or isinstance(table, dict)
+        self.table = {str(k).strip().lower(): v for k, v in (table or {}).items()}
+        self.calls = 0
+
+    def geocode(self, query):
+        '''
+        Returns the (latitude, longitude) of the query, or None if it is unknown
+
+        @param query: place to locate
+        @type query: str
+        '''
+        self.calls += 1
+        return self.table.get(str(query).strip().lower())
+
+
+class NominatimGeocoder:
+    '''
+    Geocoder backend calling the OpenStreetMap Nominatim service through geopy
+    '''
+
+    def __init__(self, user_agent='spacetrace-analysis', timeout=10):
+        '''
+        @param user_agent: user agent sent to Nominatim, as required by its usage policy
+        @param timeout: timeout of one request, in seconds
+        @type user_agent: str
+        @type timeout: float
+        '''
+        from geopy.geocoders import Nominatim
+
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def geocode(self, query):
+        '''
+        Returns the (latitude, longitude) of the query, or None if Nominatim does not know it
+        Network errors are raised, so that they are not cached as misses
+
+        @param query: place to locate
+        @type query: str
+        '''
+        loc = self.geolocator.geocode(query)
+        return None if loc is None else (loc.latitude, loc.longitude)
+
+
+class RateLimiter:
+    '''
+    Spaces the calls of several threads by at least min_interval seconds
+    '''
+
+    def __init__(self, min_interval):
+        '''
+        @param min_interval: minimum delay between two calls, in seconds
+        @type min_interval: float
+        '''
+        assert isinstance(min_interval, (int, float)) and min_interval >= 0
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        '''
+        Blocks until the next call is allowed
+        '''
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def offline_centroids():
+    '''
+    Returns a dictionary with keys as lower-case names and alpha-3 codes and values as (latitude, longitude)
+    read from CENTROIDS_PATH (read once per process)
+
+    '''
+    global _centroids
+    if _centroids is None:
+        table = pd.read_csv(CENTROIDS_PATH, keep_default_na=False)
+        _centroids = {}
+        for row in table.itertuples(index=False):
+            for key in (row.name, row.iso3):
+                if key:
+                    _centroids[key.strip().lower()] = (float(row.latitude), float(row.longitude))
+    return _centroids
+
+
+def load_geocode_cache(path=GEOCODE_CACHE_PATH):
+    '''
+    Returns the persistent geocoding cache as a dictionary with keys as queries and values as (latitude, longitude)
+    or None for places the backend does not know
+
+    @param path: path of the json cache file
+    @type path: str
+    '''
+    assert isinstance(path, str)
+
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return {k: (tuple(v) if v is not None else None) for k, v in json.load(f).items()}
+
+
+def save_geocode_cache(cache, path=GEOCODE_CACHE_PATH):
+    '''
+    Writes the geocoding cache to path (atomically, so concurrent readers never see a partial file)
+
+    @param cache: dictionary as returned by load_geocode_cache
+    @param path: path of the json cache file
+    @type cache: Dict
+    @type path: str
+    '''
+    assert isinstance(cache, dict)
+    assert isinstance(path, str)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({k: (list(v) if v is not None else None) for k, v in cache.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def geocode_many(queries, backend=None, cache_path=GEOCODE_CACHE_PATH, offline=True, max_workers=4,
+                 min_interval=1.0):
+    '''
+    Returns the list of (latitude, longitude) tuples of the queries (np.nan where a place could not be located)
+
+    Note: every distinct query is resolved once, from the persistent cache, then the offline centroid table, then
+          the backend. Backend lookups run in a thread pool spaced by min_interval seconds (Nominatim allows
+          one request per second), and their answers are added to the cache. Without a backend nothing goes
+          to the network, and a failing backend leaves the query unresolved without caching the failure
+
+    @param queries: places to locate (country names, alpha-3 codes or launch sites)
+    @param backend: geocoder with a geocode(query) method (e.g. NominatimGeocoder or StubGeocoder), or None
+    @param cache_path: path of the json cache file, or None to disable the persistent cache
+    @param offline: use the offline centroid table
+    @param max_workers: number of concurrent backend lookups
+    @param min_interval: minimum delay between two backend lookups, in seconds
+    @type queries: List
+    @type cache_path: str
+    @type offline: bool
+    @type max_workers: int
+    @type min_interval: float
+    '''
+    assert isinstance(queries, (list, tuple, pd.Series, np.ndarray))
+    assert cache_path is None or isinstance(cache_path, str)
+    assert isinstance(offline, bool)
+    assert isinstance(max_workers, int) and max_workers > 0
+
+    queries = [str(x).strip() for x in queries]
+    cache = load_geocode_cache(cache_path) if cache_path is not None else {}
+    centroids = offline_centroids() if offline else {}
+
+    resolved = {}
+    pending = []
+    for query in dict.fromkeys(queries):
+        if query in cache:
+            resolved[query] = cache[query]
+        elif query.lower() in centroids:
+            resolved[query] = centroids[query.lower()]
+        else:
+            pending.append(query)
+
+    if pending and backend is not None:
+        limiter = RateLimiter(min_interval)
+
+        def lookup(query):
+            limiter.wait()
+            try:
+                return query, backend.geocode(query), True
+            except Exception:
+                return query, None, False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(lookup, pending))
+        for query, loc, ok in results:
+            resolved[query] = loc
+            if ok:
+                cache[query] = loc
+        if cache_path is not None and any(ok for _, _, ok in results):
+            save_geocode_cache(cache, cache_path)
+
+    return [resolved[query] if resolved.get(query) is not None else np.nan for query in queries]
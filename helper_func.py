@@ -1,7 +1,12 @@
+import hashlib
+import weakref
+import warnings
 import pandas as pd
 import numpy as np
+from instrumentation import instrument
 
 
+@instrument
 def load_dataframe(path):
     '''
     Returns a dataframe read from the given path
@@ -13,6 +18,21 @@ def load_dataframe(path):
     return df
 
 
+def load_dataframe_chunks(path, chunksize):
+    '''
+    Returns an iterator over dataframes of at most chunksize rows read from the given path
+    Note: the row index keeps counting across chunks, as if the whole file had been read at once
+    @param path: path of the csv file
+    @param chunksize: number of rows per chunk
+    @type path: str
+    @type chunksize: int
+    '''
+    assert isinstance(path, str)
+    assert isinstance(chunksize, int) and chunksize > 0
+    return pd.read_csv(path, chunksize=chunksize)
+
+
+@instrument
 def drop_columns(df, columns):
     '''
     Returns the dataframe after removing the given columns
@@ -30,6 +50,7 @@ def drop_columns(df, columns):
     return df.drop(columns, axis=1)
 
 
+@instrument
 def rename_columns(df, columns):
     '''
     Returns the dataframe after renaming the given columns
@@ -47,10 +68,12 @@ def rename_columns(df, columns):
     return df.rename(columns, axis=1)
 
 
+@instrument
 def convert_str_float(df, col_name):
     '''
     Returns the dataframe with the input column type-casted to float
     Note: Since the data had the char ',' in the numbers, replace function is used to remove the special character
+          Every distinct value is converted once and mapped back to the rows (like parse_dates)
 
     @param df: Input dataframe
     @param col_name: Column name to be type-casted to float
@@ -60,40 +83,77 @@ def convert_str_float(df, col_name):
     assert isinstance(df, pd.DataFrame)
     assert isinstance(col_name, str)
 
-    df[col_name] = df[col_name].apply(lambda x: str(x).replace(',', ''))
-    df[col_name] = df[col_name].astype(np.float64)
+    codes, uniques = pd.factorize(df[col_name])
+    values = pd.Index(uniques, dtype=object).astype(str).str.replace(',', '', regex=False).astype(np.float64)
+    #missing values have the code -1, i.e. the appended NaN
+    df[col_name] = np.append(values.to_numpy(), np.nan)[codes]
     return df[col_name]
 
 
-def split_date(df, col_name, num=2):
+#formats of the Datum column: launches with a known time, and date-only launches
+DATE_TIME_FORMAT = "%a %b %d, %Y %H:%M UTC"
+DATE_FORMAT = "%a %b %d, %Y"
+
+MONTH_ABBR = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], dtype=object)
+
+
+@instrument
+def parse_dates(column):
+    '''
+    Returns the column parsed to UTC timestamps
+
+    Note: every distinct string is parsed once, with DATE_TIME_FORMAT and then DATE_FORMAT for the values that
+          did not match; a value matching neither format raises ValueError
+
+    @param column: Input column of date strings
+    @type column: pd.Series
+
+    '''
+    assert isinstance(column, pd.Series)
+
+    codes, uniques = pd.factorize(column)
+    uniques = pd.Index(uniques, dtype=object)
+    parsed = pd.to_datetime(uniques, format=DATE_TIME_FORMAT, errors='coerce')
+    date_only = parsed.isna()
+    if date_only.any():
+        parsed = parsed.where(~date_only, pd.to_datetime(uniques.where(date_only, None), format=DATE_FORMAT))
+    parsed = parsed.tz_localize('UTC')
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=column.index, name=column.name)
+
+
+@instrument
+def split_date(df, col_name, num=2, keep=False):
     '''
     Returns the dataframe with the date column split into year, month and date column based on num
 
     Note: if num=1, then only year col is added. If num=2, year and month columns are added. If num=3, year,month and day columns are added
           Column names = 'Year', 'Month' (in 3-char format) and 'Day'
+          The date column is dropped unless keep is True, in which case it holds the parsed UTC timestamps
 
     @param df: Input dataframe
     @param col_name: Column name to be type-casted to float
+    @param num: number of columns to be added
+    @param keep: keep the parsed date column
     @type df: pd.DataFrame
     @type col_name: string
+    @type num: int
+    @type keep: bool
 
     '''
 
     assert isinstance(df, pd.DataFrame)
     assert isinstance(col_name, str)
     assert num in [1, 2, 3]
-
-    df[col_name] = pd.to_datetime(df[col_name], infer_datetime_format=True)
-    if num == 1:
-        df["Year"] = df[col_name].apply(lambda x: x.year)
-    elif num == 2:
-        df["Year"] = df[col_name].apply(lambda x: x.year)
-        df["Month"] = df[col_name].apply(lambda x: x.strftime("%b"))
-    elif num == 3:
-        df["Year"] = df[col_name].apply(lambda x: x.year)
-        df["Month"] = df[col_name].apply(lambda x: x.strftime("%b"))
-        df["Day"] = df[col_name].apply(lambda x: x.strftime("%d"))
-    df = df.drop([col_name], axis=1)
+    assert isinstance(keep, bool)
+
+    df[col_name] = parse_dates(df[col_name])
+    df["Year"] = df[col_name].dt.year
+    if num >= 2:
+        df["Month"] = MONTH_ABBR[df[col_name].dt.month.to_numpy() - 1]
+    if num == 3:
+        df["Day"] = df[col_name].dt.day.map('{:02d}'.format)
+    if not keep:
+        df = df.drop([col_name], axis=1)
     return df
 
 
@@ -125,6 +185,263 @@ def location_split(x, delim):
     return t
 
 
+@instrument
+def location_split_col(column, delim):
+    '''
+    Returns a dataframe with the column split into the columns (LaunchCenter, SpaceCenter, State/Region, Country)
+
+    Note: vectorized counterpart of location_split. 1-, 2-, 3- and 4-part values are padded with "" exactly like
+          location_split; anything beyond 4 parts is kept in LaunchCenter so that Country is always the last part.
+          Every distinct value is split once and mapped back to the rows (like parse_dates)
+
+    @param column: Input column of strings
+    @param delim: delimiter
+    @type column: pd.Series
+    @type delim: string
+
+    '''
+
+    assert isinstance(column, pd.Series)
+    assert isinstance(delim, str)
+
+    codes, uniques = pd.factorize(column)
+    parts = pd.Series(uniques, dtype=object).str.rsplit(delim, n=3, expand=True).reindex(columns=range(4))
+    num = parts.notna().sum(axis=1).to_numpy()
+    parts = parts.fillna('').apply(lambda x: x.str.strip())
+    p0, p1, p2, p3 = (parts[i].to_numpy(dtype=object) for i in range(4))
+
+    split = {
+        "LaunchCenter": np.where(num >= 3, p0, ""),
+        "SpaceCenter": np.select([num >= 3, num == 2], [p1, p0], ""),
+        "State/Region": np.where(num == 4, p2, ""),
+        "Country": np.select([num == 4, num == 3, num == 2], [p3, p2, p1], p0),
+    }
+    #missing values have the code -1, i.e. the appended ""
+    return pd.DataFrame({col: np.append(values, "").astype(object)[codes] for col, values in split.items()},
+                        index=column.index)
+
+
+def load_location_rules(path):
+    '''
+    Returns the location correction rules read from the given csv file, in file order
+
+    Note: every rule has the columns match_column, match_value, action, target_column, target_value and note.
+          action "set" writes target_value into target_column of the matching rows, action "drop" removes
+          the matching rows. Empty cells are read as "" (not NaN) so a rule can blank a column
+
+    @param path: path of the csv file
+    @type path: str
+    '''
+    assert isinstance(path, str)
+
+    rules = pd.read_csv(path, dtype=str, keep_default_na=False)
+    assert set(rules['action']) <= {'set', 'drop'}
+    return rules
+
+
+#compiled rules of apply_location_rules: (id(rules), frame_version of rules, columns) -> (weak reference to rules,
+#distinct raw location tuples seen so far, their corrected tuples, whether they are kept)
+_location_rule_tables = {}
+
+
+def _run_location_rules(locations, rules):
+    '''
+    Returns the corrected location tuples and the boolean array of the tuples kept by the rules
+
+    Note: a rule sees the output of the rules before it, exactly as a sequence of df.loc assignments would
+
+    @param locations: distinct location tuples, one column per location column
+    @param rules: rules as returned by load_location_rules
+    @type locations: pd.DataFrame
+    @type rules: pd.DataFrame
+    '''
+    locations = locations.copy()
+    keep = np.ones(len(locations), dtype=bool)
+    for rule in rules.itertuples(index=False):
+        mask = (locations[rule.match_column] == rule.match_value).to_numpy()
+        if rule.action == 'drop':
+            keep &= ~mask
+        else:
+            locations.loc[mask, rule.target_column] = rule.target_value
+    return locations, keep
+
+
+def _location_rule_table(rules, columns, locations):
+    '''
+    Returns the (raw, corrected, keep) table of the rules covering the given distinct location tuples: raw is
+    the MultiIndex of the raw tuples, corrected the dataframe of their corrected tuples and keep the boolean array
+    of the tuples kept by the rules, all in the same order
+
+    Note: the table is compiled once per rules dataframe and grows with the tuples it has not seen yet, so the
+          rule sequence runs once per distinct tuple instead of once per call
+
+    @param rules: rules as returned by load_location_rules
+    @param columns: location columns the rules match and modify
+    @param locations: distinct location tuples
+    @type rules: pd.DataFrame
+    @type columns: tuple
+    @type locations: pd.MultiIndex
+    '''
+    key = (id(rules), frame_version(rules), columns)
+    entry = _location_rule_tables.get(key)
+    #the weak reference tells the rules apart from later ones reusing their id
+    if entry is None or entry[0]() is not rules:
+        entry = (weakref.ref(rules, lambda _: _location_rule_tables.pop(key, None)), locations[:0],
+                 pd.DataFrame(columns=list(columns), dtype=object), np.ones(0, dtype=bool))
+    reference, raw, corrected, keep = entry
+
+    new = locations[raw.get_indexer(locations) < 0]
+    if len(new) > 0 or key not in _location_rule_tables:
+        new_corrected, new_keep = _run_location_rules(new.to_frame(index=False), rules)
+        raw = raw.append(new)
+        corrected = pd.concat([corrected, new_corrected], ignore_index=True)
+        keep = np.concatenate([keep, new_keep])
+        _location_rule_tables[key] = (reference, raw, corrected, keep)
+    return raw, corrected, keep
+
+
+@instrument
+def apply_location_rules(df, rules, columns=("LaunchCenter", "SpaceCenter", "State/Region", "Country")):
+    '''
+    Returns the dataframe with the location correction rules applied
+
+    Note: the rules only look at the location columns, so they are compiled into a table of raw location tuple ->
+          corrected tuple (or dropped), see _location_rule_table, and the rows are mapped through it with one
+          get_indexer over their distinct tuples and one take per column
+
+    @param df: Input dataframe
+    @param rules: rules as returned by load_location_rules
+    @param columns: location columns the rules match and modify
+    @type df: pd.DataFrame
+    @type rules: pd.DataFrame
+    @type columns: tuple
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(rules, pd.DataFrame)
+    assert isinstance(columns, tuple)
+    assert set(rules['match_column']) <= set(columns)
+    assert set(rules.loc[rules['action'] == 'set', 'target_column']) <= set(columns)
+
+    #one integer per row identifying its location tuple, built from the codes of every column (shifted by one so
+    #that missing values, coded -1, get a code of their own) instead of hashing a tuple per row
+    levels = []
+    combined = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        col_codes, uniques = pd.factorize(df[col])
+        levels.append(uniques)
+        combined = combined * (len(uniques) + 1) + (col_codes.astype(np.int64) + 1)
+    codes, uniques = pd.factorize(combined)
+    level_codes = []
+    for level in reversed(levels):
+        uniques, col_codes = np.divmod(uniques, len(level) + 1)
+        level_codes.insert(0, col_codes - 1)
+    locations = pd.MultiIndex(levels=levels, codes=level_codes, names=list(columns))
+
+    raw, corrected, keep = _location_rule_table(rules, columns, locations)
+    rows = raw.get_indexer(locations)[codes]
+    kept = np.flatnonzero(keep[rows])
+
+    #build the result in one pass instead of copying the frame, replacing columns and filtering the rows
+    data = {col: (corrected[col].to_numpy()[rows[kept]] if col in columns else df[col].array.take(kept))
+            for col in df.columns}
+    return pd.DataFrame(data, index=df.index[kept], columns=df.columns)
+
+
+@instrument
+def apply_schema(df, schema, strict=False):
+    '''
+    Returns a copy of the dataframe with the columns cast to the dtypes given in schema
+
+    Note: columns of the schema missing from the dataframe are ignored, so the same schema can be applied
+          to a subset of the columns. Values outside the categories of a fixed CategoricalDtype (e.g. a new
+          status) would become missing values and drop out of every count computed afterwards: they are listed
+          in a warning and the column is kept as an unordered categorical holding the schema categories followed
+          by the new values. With strict, any value turned into a missing value by the cast raises ValueError
+
+    @param df: Input dataframe
+    @param schema: dictionary with keys as column names and values as the dtypes
+    @param strict: raise ValueError instead of extending the categories
+    @type df: pd.DataFrame
+    @type schema: Dict
+    @type strict: bool
+
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(schema, dict)
+    assert isinstance(strict, bool)
+
+    dtypes = {col: dtype for col, dtype in schema.items() if col in df.columns}
+    cast = df.astype(dtypes)
+    for col, dtype in dtypes.items():
+        lost = cast[col].isna().to_numpy() & df[col].notna().to_numpy()
+        if not lost.any():
+            continue
+        values = sorted(str(x) for x in df.loc[lost, col].unique())
+        listed = ', '.join(values[:10]) + (', ...' if len(values) > 10 else '')
+        if isinstance(dtype, pd.CategoricalDtype) and not strict:
+            warnings.warn('{} values of column {} are not in the categories {}, added as new categories: {}'.format(
+                int(lost.sum()), col, list(dtype.categories), listed), stacklevel=3)
+            open_dtype = pd.CategoricalDtype(list(dtype.categories) + sorted(df.loc[lost, col].unique(), key=str))
+            cast[col] = df[col].astype(open_dtype)
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = 'category {}'.format(list(dtype.categories))
+        raise ValueError('{} values of column {} are not valid for dtype {}: {}'.format(
+            int(lost.sum()), col, dtype, listed))
+    return cast
+
+
+def memory_report(df, compact_df):
+    '''
+    Returns a dataframe with the dtype and memory usage (in bytes) of every column before and after compaction
+
+    @param df: dataframe before compaction
+    @param compact_df: the same dataframe after compaction
+    @type df: pd.DataFrame
+    @type compact_df: pd.DataFrame
+
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(compact_df, pd.DataFrame)
+
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': df.memory_usage(index=False, deep=True),
+        'compact_dtype': compact_df.dtypes.astype(str),
+        'compact_bytes': compact_df.memory_usage(index=False, deep=True),
+    })
+    report.loc['Total'] = ['', report['bytes'].sum(), '', report['compact_bytes'].sum()]
+    report['ratio'] = report['bytes'] / report['compact_bytes']
+    return report
+
+
+@instrument
+def concat_categorical_frames(frames):
+    '''
+    Returns the concatenation of the dataframes, keeping categorical columns categorical
+
+    Note: pd.concat falls back to object dtype when the categories of the frames differ, so the categories
+          are first reconciled into their union (ordered categoricals must already share their categories)
+
+    @param frames: list of dataframes with the same columns
+    @type frames: List
+
+    '''
+    assert isinstance(frames, list) and len(frames) > 0
+    assert all(isinstance(x, pd.DataFrame) for x in frames)
+
+    frames = [x.copy() for x in frames]
+    for col in frames[0].columns:
+        dtypes = [x[col].dtype for x in frames]
+        if not all(isinstance(x, pd.CategoricalDtype) for x in dtypes) or dtypes[0].ordered:
+            continue
+        categories = pd.api.types.union_categoricals([x[col] for x in frames], sort_categories=True).categories
+        for x in frames:
+            x[col] = x[col].cat.set_categories(categories)
+    return pd.concat(frames)
+
+
+@instrument
 def fill_empty_with_NaN(df, col_name, old_value):
     '''
     Returns the dataframe with the date column split into year, month and date column based on num
@@ -144,4 +461,80 @@ def fill_empty_with_NaN(df, col_name, old_value):
     assert isinstance(old_value, str)
 
     df[col_name] = df[col_name].replace(old_value, np.nan)
-    return df[col_name]
\ No newline at end of file
+    return df[col_name]
+
+
+def dataframe_fingerprint(df, columns=None):
+    '''
+    Returns a hex digest of the contents of the dataframe (index, column names, dtypes and values)
+
+    Note: two dataframes with the same fingerprint hold the same data, so the fingerprint can be used as the key
+          of structures built from a dataframe, even when the dataframe is modified in place in between
+
+    @param df: Input dataframe
+    @param columns: list of columns to include (None includes all columns)
+    @type df: pd.DataFrame
+    @type columns: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert columns is None or isinstance(columns, list)
+
+    if columns is not None:
+        df = df[columns]
+    digest = hashlib.sha1()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+#rows hashed by frame_version (evenly spaced, the first and last rows included)
+VERSION_SAMPLE_ROWS = 1024
+
+
+def _values_buffer(series):
+    '''
+    Returns the numpy array holding the values of the series (the codes of a categorical), None when the values
+    are not held in a numpy array
+
+    @param series: Input series
+    @type series: pd.Series
+    '''
+    values = series.array
+    base = values.codes if isinstance(values, pd.Categorical) else getattr(values, '_ndarray', None)
+    return base if isinstance(base, np.ndarray) else None
+
+
+def frame_version(df, columns=None):
+    '''
+    Returns a version stamp of the dataframe for the in-memory caches keyed on the identity of the frame: its
+    shape, column names and dtypes, the memory address of the values of every column and a hash of
+    VERSION_SAMPLE_ROWS rows (index included)
+
+    Note: unlike dataframe_fingerprint, the cost does not grow with the number of rows. Replacing a column
+          (df[col] = ...), adding or dropping rows or columns and changing a dtype give a new stamp; an in-place
+          edit of cells (df.loc[i, col] = value) only does when row i is one of the sampled rows, so clear the
+          cache (or edit a copy) after such edits
+
+    @param df: Input dataframe
+    @param columns: list of columns to include (None includes all columns)
+    @type df: pd.DataFrame
+    @type columns: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert columns is None or isinstance(columns, list)
+
+    columns = list(df.columns) if columns is None else columns
+    rows = np.unique(np.linspace(0, len(df) - 1, min(len(df), VERSION_SAMPLE_ROWS)).astype(np.int64))
+    digest = hashlib.sha1(pd.util.hash_array(np.asarray(df.index[rows])).tobytes())
+    addresses = []
+    for col in columns:
+        base = _values_buffer(df[col])
+        if base is None:
+            digest.update(pd.util.hash_array(np.asarray(df[col].iloc[rows], dtype=object)).tobytes())
+        elif base.dtype == object:
+            digest.update(pd.util.hash_array(base[rows]).tobytes())
+        else:
+            digest.update(base[rows].tobytes())
+        addresses.append(id(df[col].array) if base is None else base.__array_interface__['data'][0])
+    return (df.shape, tuple(columns), tuple(df[col].dtype for col in columns), tuple(addresses),
+            digest.hexdigest())
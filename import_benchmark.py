@@ -0,0 +1,103 @@
+'''
+Import-time benchmark of the analysis modules
+
+Every module is imported in a fresh interpreter, timed, and checked for heavy plotting/geo dependencies that
+should only load when a function needs them. Exits with status 1 when a module pulls in one of HEAVY_MODULES or
+takes longer than the budget, so it can guard batch jobs against import-time regressions:
+
+    python import_benchmark.py [--budget-ms 1500] [--repeat 3] [--json]
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+#modules imported by the batch jobs and notebooks
+MODULES = ['instrumentation', 'memoize', 'helper_func', 'data_cleaning_pre_processing', 'dataset_cache',
+           'aggregation_cube', 'cardinality', 'bitmap_index', 'leaderboard', 'timeseries', 'geocoding', 'geo_store',
+           'incremental', 'synthetic_data', 'report_renderer', 'figure_budget', 'sql_backend', 'query_service',
+           'company_col_utils', 'country_col_plots', 'countries_leaderboard_activevsretired',
+           'datum_analysis_all_in_one', 'Launch_Vehicle_all_in_one']
+
+#dependencies that must not be loaded by importing any of the MODULES
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'plotly', 'geopandas', 'shapely', 'geopy', 'pycountry', 'sklearn',
+                 'mpl_toolkits', 'duckdb']
+
+#default budget of one module import, pandas and numpy included, in milliseconds
+BUDGET_MS = 1500
+
+_PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': elapsed, 'heavy': heavy}}))
+'''
+
+
+def measure_import(module, repeat=3):
+    '''
+    Returns a dictionary with the best import time (in seconds, over `repeat` fresh interpreters) of the module
+    and the list of HEAVY_MODULES it loaded
+
+    @param module: name of the module to import
+    @param repeat: number of fresh interpreters to time the import in
+    @type module: str
+    @type repeat: int
+    '''
+    assert isinstance(module, str)
+    assert isinstance(repeat, int) and repeat > 0
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             cwd=cwd, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {'module': module, 'seconds': min(run['seconds'] for run in runs), 'heavy': runs[0]['heavy']}
+
+
+def run_benchmark(modules=MODULES, budget_ms=BUDGET_MS, repeat=3):
+    '''
+    Returns the list of measure_import results of the modules, each with an `ok` flag telling whether the module
+    stayed within the budget without loading HEAVY_MODULES
+
+    @param modules: names of the modules to import
+    @param budget_ms: import-time budget of one module, in milliseconds
+    @param repeat: number of fresh interpreters to time each import in
+    @type modules: List
+    @type budget_ms: float
+    @type repeat: int
+    '''
+    assert isinstance(modules, list)
+    assert isinstance(budget_ms, (int, float)) and budget_ms > 0
+
+    results = []
+    for module in modules:
+        result = measure_import(module, repeat)
+        result['ok'] = not result['heavy'] and result['seconds'] * 1000 <= budget_ms
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import-time benchmark of the analysis modules')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='import-time budget of one module')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per module (best time is kept)')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(budget_ms=args.budget_ms, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print('{:<42} {:>8.1f} ms  {}  {}'.format(result['module'], result['seconds'] * 1000,
+                                                     'ok  ' if result['ok'] else 'FAIL', ', '.join(result['heavy'])))
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
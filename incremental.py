@@ -0,0 +1,168 @@
+'''
+Incremental ingestion of new launches
+
+An IncrementalStore keeps the cleaned launches as append-only Parquet parts together with the aggregation cube of
+all of them. append() only cleans the rows past the stored watermark (original row id or Datum), writes them as a
+new part and merges their cube into the stored one, so a daily refresh costs in proportion to the new rows:
+
+    python incremental.py STORE_DIR NEW_ROWS.csv [--key row_id|Datum]
+'''
+import os
+import sys
+import json
+import glob
+import argparse
+import tempfile
+import pandas as pd
+from helper_func import load_dataframe, parse_dates, concat_categorical_frames
+from data_cleaning_pre_processing import clean_dataframe
+from aggregation_cube import build_cube, merge_cubes
+
+#column of the raw csv holding the original row id (the csv position is used when it is missing)
+ROW_ID_COL = 'Unnamed: 0'
+
+#watermarks an append can select new rows with
+WATERMARK_KEYS = ['row_id', 'Datum']
+
+STATE = 'state.json'
+PARTS_DIR = 'parts'
+
+
+class IncrementalStore:
+    '''
+    Append-only store of the cleaned space data and of its aggregation cube
+
+    Note: the cleaned rows are indexed by their original row id. The cube holds the additive counts and sums of
+          aggregation_cube (launches, cost sums and counts), so the rates and means derived by cube_query, and
+          every function built on get_cube (success rates, average costs, leaderboards), accept store.cube
+          directly instead of the full data
+    '''
+
+    def __init__(self, store_dir):
+        '''
+        @param store_dir: directory of the store (created on the first append)
+        @type store_dir: str
+        '''
+        assert isinstance(store_dir, str)
+
+        self.store_dir = store_dir
+        self.state = {'rows': 0, 'parts': 0, 'max_row_id': None, 'max_datum': None, 'cube': None}
+        if os.path.isfile(os.path.join(store_dir, STATE)):
+            with open(os.path.join(store_dir, STATE)) as f:
+                self.state = json.load(f)
+        self._cube = None
+
+    @property
+    def cube(self):
+        '''
+        Aggregation cube of all the stored launches (None while the store is empty)
+        '''
+        if self._cube is None and self.state['cube'] is not None:
+            self._cube = pd.read_parquet(os.path.join(self.store_dir, self.state['cube']))
+        return self._cube
+
+    def new_rows(self, raw, key='row_id'):
+        '''
+        Returns the rows of the raw dataframe past the stored watermark, indexed by their original row id
+
+        @param raw: raw dataframe as read from the csv file
+        @param key: watermark selecting the new rows, 'row_id' (row id above the largest stored one) or 'Datum'
+                    (launch time after the latest stored one)
+        @type raw: pd.DataFrame
+        @type key: str
+        '''
+        assert isinstance(raw, pd.DataFrame)
+        assert key in WATERMARK_KEYS
+
+        if ROW_ID_COL in raw.columns:
+            raw = raw.set_index(raw[ROW_ID_COL].to_numpy())
+        if key == 'row_id' and self.state['max_row_id'] is not None:
+            raw = raw[raw.index > self.state['max_row_id']]
+        elif key == 'Datum' and self.state['max_datum'] is not None:
+            raw = raw[parse_dates(raw['Datum']) > pd.Timestamp(self.state['max_datum'])]
+        return raw
+
+    def append(self, source, key='row_id'):
+        '''
+        Cleans the new rows of source, appends them to the store and updates the stored cube.
+        Returns the number of new raw rows
+
+        @param source: path of a csv file (full history or only the latest rows) or raw dataframe
+        @param key: watermark selecting the new rows, see new_rows
+        @type key: str
+        '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        assert isinstance(source, (str, pd.DataFrame))
+
+        raw = self.new_rows(load_dataframe(source) if isinstance(source, str) else source, key)
+        if len(raw) == 0:
+            return 0
+
+        cleaned = clean_dataframe(raw)
+        cube = merge_cubes(self.cube, build_cube(cleaned))
+        max_datum = parse_dates(raw['Datum']).max()
+
+        os.makedirs(os.path.join(self.store_dir, PARTS_DIR), exist_ok=True)
+        part = os.path.join(self.store_dir, PARTS_DIR, 'part-{:05d}.parquet'.format(self.state['parts']))
+        pq.write_table(pa.Table.from_pandas(cleaned), part)
+        state = dict(self.state)
+        state['cube'] = 'cube-{:05d}.parquet'.format(state['parts'])
+        cube.to_parquet(os.path.join(self.store_dir, state['cube']), index=False)
+
+        state['rows'] += len(cleaned)
+        state['parts'] += 1
+        if state['max_row_id'] is None or raw.index.max() > state['max_row_id']:
+            state['max_row_id'] = int(raw.index.max())
+        if pd.notna(max_datum) and (state['max_datum'] is None or max_datum > pd.Timestamp(state['max_datum'])):
+            state['max_datum'] = max_datum.isoformat()
+        self._write_state(state)
+        if self.state['cube'] is not None:
+            os.remove(os.path.join(self.store_dir, self.state['cube']))
+        self.state = state
+        self._cube = cube
+        return len(raw)
+
+    def _write_state(self, state):
+        '''
+        Writes the state file atomically. It is written after the new part and cube files, so an interrupted append
+        leaves the previous state (and cube) in effect
+
+        @param state: dictionary of the store state
+        @type state: Dict
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, os.path.join(self.store_dir, STATE))
+
+    def load(self, columns=None):
+        '''
+        Returns the cleaned dataframe of all the stored launches, indexed by their original row id, in append order
+
+        @param columns: list of columns to read (None reads all columns)
+        @type columns: List
+        '''
+        assert columns is None or isinstance(columns, list)
+
+        parts = sorted(glob.glob(os.path.join(self.store_dir, PARTS_DIR, 'part-*.parquet')))[:self.state['parts']]
+        assert len(parts) > 0, 'the store is empty'
+        return concat_categorical_frames([pd.read_parquet(part, columns=columns) for part in parts])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append the new launches of a csv file to an incremental store')
+    parser.add_argument('store', help='directory of the store')
+    parser.add_argument('source', help='csv file with the new (or all) launches')
+    parser.add_argument('--key', choices=WATERMARK_KEYS, default='row_id', help='watermark selecting new rows')
+    args = parser.parse_args(argv)
+
+    store = IncrementalStore(args.store)
+    added = store.append(args.source, args.key)
+    print('{} new rows, {} rows stored'.format(added, store.state['rows']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+'''
+Opt-in per-stage instrumentation of the cleaning pipeline and the analysis functions
+
+Stages are marked with the @instrument decorator or the stage() context manager and record wall time, rows in and
+out, and (optionally) peak traced memory. Recording is off by default, and a disabled stage only costs a flag
+check, so the markers stay in production code:
+
+    import instrumentation
+    instrumentation.enable(memory=True)
+    df = pre_processing('Space_Corrected.csv')
+    instrumentation.export_json('stages.json')
+    instrumentation.export_chrome_trace('trace.json')   # open in chrome://tracing or Perfetto
+
+Setting the environment variable SPACE_DATA_INSTRUMENT=1 (or =memory) enables recording at import time.
+'''
+import os
+import json
+import time
+import functools
+import threading
+
+#environment variable enabling the instrumentation at import time ('1' for timings, 'memory' to add memory peaks)
+INSTRUMENT_ENV = 'SPACE_DATA_INSTRUMENT'
+
+_enabled = False
+_memory = False
+_records = []
+_local = threading.local()
+
+
+def enable(memory=False):
+    '''
+    Starts recording the stages
+
+    @param memory: also record the peak traced memory of every stage (tracemalloc slows the code down noticeably)
+    @type memory: bool
+    '''
+    global _enabled, _memory
+    assert isinstance(memory, bool)
+
+    if memory:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    _memory = memory
+    _enabled = True
+
+
+def disable():
+    '''
+    Stops recording the stages (the records are kept until reset)
+    '''
+    global _enabled, _memory
+    if _memory:
+        import tracemalloc
+
+        tracemalloc.stop()
+    _enabled = False
+    _memory = False
+
+
+def is_enabled():
+    '''
+    Returns True while the stages are recorded
+    '''
+    return _enabled
+
+
+def reset():
+    '''
+    Drops the recorded stages
+    '''
+    del _records[:]
+
+
+def records():
+    '''
+    Returns the list of recorded stages, in the order they finished. Every record is a dictionary with the stage
+    name, start (seconds since the epoch), seconds, depth (nesting level), rows_in, rows_out, peak_memory_bytes
+    (peak traced memory above the memory at the start of the stage, None when memory is not recorded), pid and tid
+    '''
+    return list(_records)
+
+
+def _rows(value):
+    '''
+    Returns the number of rows of a dataframe, series or array (or of the first element of a tuple of them),
+    None for anything else
+
+    @param value: argument or return value of a stage
+    '''
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+    return shape[0] if isinstance(shape, tuple) and shape else None
+
+
+class _NullStage:
+    '''
+    Stage returned by stage() while recording is disabled: does nothing
+    '''
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    '''
+    Recorded stage (see stage())
+    '''
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak = 0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.depth = len(stack)
+        if _memory:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                #the parent keeps the peak reached before this stage, the peak is then tracked for this stage
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        stack.append(self)
+        self.start = time.time()
+        self.counter = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.counter
+        _local.stack.pop()
+        peak_memory = None
+        if _memory:
+            import tracemalloc
+
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_memory = max(self.peak - self.memory_start, 0)
+            if _local.stack:
+                _local.stack[-1].peak = max(_local.stack[-1].peak, self.peak)
+        _records.append({'name': self.name, 'start': self.start, 'seconds': seconds, 'depth': self.depth,
+                         'rows_in': self.rows_in, 'rows_out': self.rows_out, 'peak_memory_bytes': peak_memory,
+                         'pid': os.getpid(), 'tid': threading.get_ident()})
+        return False
+
+
+def stage(name, rows_in=None):
+    '''
+    Returns a context manager recording the enclosed block as a stage; set `rows_out` on it to record the rows
+    produced:
+
+        with stage('split_detail', len(df)) as s:
+            ...
+            s.rows_out = len(df)
+
+    @param name: name of the stage
+    @param rows_in: number of input rows
+    @type name: str
+    @type rows_in: int
+    '''
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, rows_in)
+
+
+def instrument(function=None, name=None):
+    '''
+    Decorator recording every call of the function as a stage, with the rows of its first argument as rows in and
+    the rows of its return value as rows out. Usable as @instrument or @instrument(name='...')
+
+    @param function: decorated function
+    @param name: name of the stage (defaults to the function name)
+    @type name: str
+    '''
+    if function is None:
+        return functools.partial(instrument, name=name)
+
+    stage_name = name or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with _Stage(stage_name, _rows(args[0]) if args else None) as s:
+            result = function(*args, **kwargs)
+            s.rows_out = _rows(result)
+        return result
+
+    return wrapper
+
+
+def export_json(path):
+    '''
+    Writes the recorded stages as a json list (see records)
+
+    @param path: output file
+    @type path: str
+    '''
+    assert isinstance(path, str)
+
+    with open(path, 'w') as f:
+        json.dump(records(), f, indent=2)
+
+
+def chrome_trace():
+    '''
+    Returns the recorded stages in the Chrome trace event format (complete events, times in microseconds)
+    '''
+    events = []
+    for record in _records:
+        args = {key: record[key] for key in ('rows_in', 'rows_out', 'peak_memory_bytes') if record[key] is not None}
+        events.append({'name': record['name'], 'ph': 'X', 'ts': record['start'] * 1e6, 'dur': record['seconds'] * 1e6,
+                       'pid': record['pid'], 'tid': record['tid'], 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(path):
+    '''
+    Writes the recorded stages as a Chrome trace (chrome://tracing, Perfetto)
+
+    @param path: output file
+    @type path: str
+    '''
+    assert isinstance(path, str)
+
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
+
+
+if os.environ.get(INSTRUMENT_ENV):
+    enable(memory=os.environ[INSTRUMENT_ENV] == 'memory')
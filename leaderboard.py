@@ -0,0 +1,157 @@
+'''
+Top-k leaderboards of the space data per time bucket
+
+leaderboard() ranks the values of an entity (Country, Company, LaunchVehicle, SpaceCenter) by a metric in every
+year, calendar month or decade, optionally over a trailing window of buckets, e.g. the three companies with the
+most successful launches over the last five years, for every year:
+
+    leaderboard(df, 'Company', 'successes', 'year', k=3, window=5)
+
+Metrics are rolled up from the aggregation cube and the top k of every bucket is selected with one sort and a
+group-wise counter, without a loop over the buckets.
+'''
+import numpy as np
+import pandas as pd
+from aggregation_cube import CUBE_DIMENSIONS, get_cube, cube_query
+from instrumentation import instrument
+from memoize import memoize
+
+#entities that can be ranked
+ENTITIES = ['Country', 'Company', 'LaunchVehicle', 'SpaceCenter']
+
+#time buckets: name -> (column of the result, step between consecutive buckets, None for the calendar months)
+BUCKETS = {'year': ('Year', 1), 'month': ('Month', None), 'decade': ('Decade', 10)}
+
+#metrics: name -> (slice of the cube, summed measure, measure dividing it (None for a sum))
+METRICS = {
+    'launches': (None, 'launches', None),
+    'successes': ({'MissionStatus': 'Success'}, 'launches', None),
+    'failures': ({'MissionStatus': 'Failure'}, 'launches', None),
+    'active': ({'RocketStatus': 'StatusActive'}, 'launches', None),
+    'retired': ({'RocketStatus': 'StatusRetired'}, 'launches', None),
+    'cost': (None, 'cost_sum', None),
+    'cost_mean': (None, 'cost_sum', 'cost_count'),
+}
+
+
+def _bucket_cells(data, entity, metric, bucket):
+    '''
+    Returns the summed measures of the metric per (bucket, entity), without missing entities
+
+    @param data: cleaned dataframe or aggregation cube
+    @param entity: column ranked
+    @param metric: name of the metric in METRICS
+    @param bucket: name of the time bucket in BUCKETS
+    @type data: pd.DataFrame
+    @type entity: str
+    @type metric: str
+    @type bucket: str
+    '''
+    where, measure, denominator = METRICS[metric]
+    column = BUCKETS[bucket][0]
+
+    #entities outside the default cube dimensions (SpaceCenter) get a cube of their own
+    dims = CUBE_DIMENSIONS if entity in CUBE_DIMENSIONS else ['Year', 'Month', entity, 'MissionStatus', 'RocketStatus']
+    cube = get_cube(data, dims)
+    assert entity in cube.columns, 'the cube has no {} dimension'.format(entity)
+    if bucket == 'decade':
+        cube = cube.assign(Decade=cube['Year'] // 10 * 10)
+
+    measures = [measure] if denominator is None else [measure, denominator]
+    cells = cube_query(cube, [column, entity], where=where)[[column, entity] + measures]
+    return cells[cells[entity].notna()]
+
+
+def _rolling(cells, column, entity, measures, window, step):
+    '''
+    Returns the measures of every (bucket, entity) summed over the trailing window of buckets ending at that
+    bucket, for the buckets from the first one of the data to the last one (empty windows are left out)
+
+    @param cells: summed measures per (bucket, entity)
+    @param column: bucket column
+    @param entity: entity column
+    @param measures: list of the measure columns
+    @param window: number of buckets of the window
+    @param step: difference between two consecutive bucket values
+    @type cells: pd.DataFrame
+    @type column: str
+    @type entity: str
+    @type measures: List
+    @type window: int
+    @type step: int
+    '''
+    codes, entities = pd.factorize(cells[entity])
+    first = int(cells[column].min())
+    n_buckets = (int(cells[column].max()) - first) // step + 1
+    positions = ((cells[column].to_numpy().astype(np.int64) - first) // step)
+
+    #entity x bucket matrix of every measure (and of the number of cells, to tell empty windows apart), turned
+    #into trailing window sums with a cumulative sum along the buckets
+    rolled = {}
+    for name in measures + ['cells']:
+        matrix = np.zeros((len(entities), n_buckets))
+        values = 1.0 if name == 'cells' else cells[name].to_numpy(dtype=np.float64)
+        np.add.at(matrix, (codes, positions), values)
+        total = np.cumsum(matrix, axis=1)
+        total[:, window:] -= total[:, :-window].copy()
+        rolled[name] = total
+    rows, cols = np.nonzero(rolled['cells'] > 0.5)
+
+    result = pd.DataFrame({column: (first + cols * step).astype(cells[column].dtype),
+                           entity: entities.take(rows)})
+    for name in measures:
+        result[name] = rolled[name][rows, cols]
+    return result
+
+
+@instrument
+@memoize
+def leaderboard(data, entity='Country', metric='launches', bucket='year', k=1, window=None):
+    '''
+    Returns the k highest ranked values of the entity by the metric in every time bucket, with the columns
+    [bucket column, entity, metric, 'rank'], sorted by bucket and rank
+
+    Note: ties are broken by the order of the entity values (alphabetical for the categorical columns of the
+          cleaned data). Buckets are the Year, the calendar Month or the Decade (first year of the decade); with
+          a window, the metric of a bucket covers that bucket and the window - 1 buckets before it (years or
+          decades only). Entities with an undefined metric (cost_mean without a known cost) are not ranked
+
+    @param data: cleaned dataframe or aggregation cube
+    @param entity: column ranked, one of ENTITIES
+    @param metric: one of METRICS: launches, successes, failures, active/retired (launches of rockets with that
+                   status), cost (total MissionCost) or cost_mean (mean of the known MissionCost values)
+    @param bucket: time bucket, one of BUCKETS (year, month, decade)
+    @param k: number of values kept per bucket
+    @param window: number of buckets of the trailing window (None ranks every bucket on its own)
+    @type data: pd.DataFrame
+    @type entity: str
+    @type metric: str
+    @type bucket: str
+    @type k: int
+    @type window: int
+    '''
+    assert isinstance(data, pd.DataFrame)
+    assert entity in ENTITIES
+    assert metric in METRICS
+    assert bucket in BUCKETS
+    assert isinstance(k, int) and k > 0
+    assert window is None or (isinstance(window, int) and window > 0)
+    assert window is None or BUCKETS[bucket][1] is not None, 'rolling windows need year or decade buckets'
+
+    column, step = BUCKETS[bucket]
+    _, measure, denominator = METRICS[metric]
+    measures = [measure] if denominator is None else [measure, denominator]
+
+    cells = _bucket_cells(data, entity, metric, bucket)
+    if window is not None and len(cells) > 0:
+        cells = _rolling(cells, column, entity, measures, window, step)
+    if denominator is None:
+        values = cells[measure]
+    else:
+        values = cells[measure] / cells[denominator].where(cells[denominator] > 0)
+
+    ranked = pd.DataFrame({column: cells[column], entity: cells[entity], metric: values})
+    ranked = ranked[ranked[metric].notna()]
+    ranked = ranked.sort_values([column, metric, entity], ascending=[True, False, True], kind='mergesort')
+    ranked['rank'] = ranked.groupby(column, observed=True, sort=False).cumcount() + 1
+    return ranked[ranked['rank'] <= k].reset_index(drop=True)
@@ -0,0 +1,153 @@
+'''
+Load test of the local query service
+
+Sends a mix of queries (every endpoint, with and without filters) from concurrent clients and reports the
+throughput and latency percentiles. Without --url, a service is started in this process on a free port:
+
+    python load_test.py [--url http://127.0.0.1:8143] [--requests 2000] [--concurrency 16] [--etag] [--json]
+
+With --etag, every client remembers the ETag of each query and revalidates it with If-None-Match.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#queries of the load test, sent round-robin
+QUERIES = [
+    '/company_success_rate',
+    '/company_success_rate?year_from=2000',
+    '/company_success_rate?country=USA,China&year_from=1990&year_to=2010',
+    '/company_average_cost',
+    '/country_average_cost',
+    '/country_average_cost?mission_status=Success',
+    '/leaderboard/active',
+    '/leaderboard/retired?year_to=1990',
+    '/monthly_cost_average',
+    '/yearly_cost_average?country=USA',
+    '/missions_per_country?year_from=2010',
+    '/leaderboard?entity=Company&metric=successes&k=3&window=5',
+    '/leaderboard?entity=SpaceCenter&bucket=decade&k=2',
+]
+
+
+def fetch(url, etag=None):
+    '''
+    Sends one GET request and returns (status, etag of the response, seconds)
+
+    @param url: full url of the query
+    @param etag: ETag sent as If-None-Match (None sends none)
+    @type url: str
+    @type etag: str
+    '''
+    request = urllib.request.Request(url, headers={} if etag is None else {'If-None-Match': etag})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status, etag = response.status, response.headers.get('ETag')
+    except urllib.error.HTTPError as e:
+        status = e.code
+        if e.code != 304:
+            etag = None
+    return status, etag, time.perf_counter() - start
+
+
+def run_load_test(base_url, n_requests=2000, concurrency=16, use_etag=False, queries=QUERIES):
+    '''
+    Returns the summary of a load test: requests, seconds, requests per second, latency percentiles (ms) and
+    the count of every status code
+
+    @param base_url: url of the service, without trailing slash
+    @param n_requests: total number of requests
+    @param concurrency: number of concurrent clients
+    @param use_etag: revalidate the responses with If-None-Match
+    @param queries: list of query paths, sent round-robin
+    @type base_url: str
+    @type n_requests: int
+    @type concurrency: int
+    @type use_etag: bool
+    @type queries: List
+    '''
+    assert isinstance(base_url, str)
+    assert isinstance(n_requests, int) and n_requests > 0
+    assert isinstance(concurrency, int) and concurrency > 0
+    assert isinstance(queries, list) and len(queries) > 0
+
+    etags = {}
+    lock = threading.Lock()
+
+    def client(i):
+        query = queries[i % len(queries)]
+        with lock:
+            etag = etags.get(query) if use_etag else None
+        status, etag, seconds = fetch(base_url + query, etag)
+        if use_etag and etag is not None:
+            with lock:
+                etags[query] = etag
+        return status, seconds
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, range(n_requests)))
+    total = time.perf_counter() - start
+
+    latencies = np.array([seconds for _, seconds in results]) * 1000
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {'requests': n_requests, 'concurrency': concurrency, 'etag': use_etag, 'seconds': total,
+            'requests_per_second': n_requests / total,
+            'latency_ms': {'p50': float(np.percentile(latencies, 50)), 'p90': float(np.percentile(latencies, 90)),
+                           'p99': float(np.percentile(latencies, 99)), 'max': float(latencies.max())},
+            'statuses': statuses}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the local query service')
+    parser.add_argument('--url', default=None, help='url of a running service (default: start one in process)')
+    parser.add_argument('--path', default=os.path.join(_BASE_DIR, 'Space_Corrected.csv'),
+                        help='csv file of the in-process service')
+    parser.add_argument('--requests', type=int, default=2000, help='total number of requests')
+    parser.add_argument('--concurrency', type=int, default=16, help='number of concurrent clients')
+    parser.add_argument('--etag', action='store_true', help='revalidate responses with If-None-Match')
+    parser.add_argument('--json', action='store_true', help='print the summary as json')
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        from dataset_cache import load_cleaned
+        from query_service import make_server
+
+        server = make_server(load_cleaned(args.path), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://{}:{}'.format(*server.server_address[:2])
+
+    try:
+        summary = run_load_test(base_url.rstrip('/'), args.requests, args.concurrency, args.etag)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print('{requests} requests, {concurrency} clients: {seconds:.2f} s, {requests_per_second:.0f} req/s'.format(
+            **summary))
+        print('latency ms: p50 {p50:.2f}  p90 {p90:.2f}  p99 {p99:.2f}  max {max:.2f}'.format(**summary['latency_ms']))
+        print('statuses: {}'.format(summary['statuses']))
+    return 0 if all(status in ('200', '304') for status in summary['statuses']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
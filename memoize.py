@@ -0,0 +1,206 @@
+'''
+Opt-in memoization of the analysis functions
+
+Functions decorated with @memoize keep their results in one bounded LRU cache, keyed on the function, the
+identity and version stamp of their dataframe/series arguments (see helper_func.frame_version) and the other
+arguments. The stamp is computed without reading every row, so a hit costs about a millisecond whatever the size
+of the frame. Replacing a column or adding rows gives a new stamp; an in-place edit of a few cells
+(df.loc[i, col] = value) may not, so call invalidate() after such edits. Memoization is off by default, and a
+disabled memoized function only costs a flag check:
+
+    import memoize
+    memoize.enable()
+    calculate_company_success_launch_rate(df)   # computed
+    calculate_company_success_launch_rate(df)   # from the cache
+    memoize.cache_info()                        # {'hits': 1, 'misses': 1, ...}
+    memoize.invalidate()
+
+Every call returns a copy of the cached result, so callers can modify it freely. Setting the environment variable
+SPACE_DATA_MEMOIZE=1 enables memoization at import time.
+'''
+import os
+import copy
+import contextlib
+import inspect
+import functools
+import weakref
+import threading
+from collections import OrderedDict
+import pandas as pd
+from helper_func import frame_version
+
+#environment variable enabling memoization at import time
+MEMOIZE_ENV = 'SPACE_DATA_MEMOIZE'
+
+#number of results kept in memory
+MEMO_CACHE_SIZE = 128
+
+_enabled = False
+_cache_size = MEMO_CACHE_SIZE
+_memo_cache = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(cache_size=None):
+    '''
+    Turns memoization on
+
+    @param cache_size: number of results kept in memory (None keeps the current size, MEMO_CACHE_SIZE at first)
+    @type cache_size: int
+    '''
+    global _enabled, _cache_size
+    assert cache_size is None or (isinstance(cache_size, int) and cache_size > 0)
+
+    with _lock:
+        if cache_size is not None:
+            _cache_size = cache_size
+            _evict()
+        _enabled = True
+
+
+def disable():
+    '''
+    Turns memoization off and drops the cached results
+    '''
+    global _enabled
+    _enabled = False
+    invalidate()
+
+
+def is_enabled():
+    '''
+    Returns True while the memoized functions use the cache
+    '''
+    return _enabled
+
+
+def invalidate(function=None):
+    '''
+    Drops the cached results of a memoized function (of all of them when function is None)
+
+    @param function: memoized function
+    '''
+    with _lock:
+        if function is None:
+            _memo_cache.clear()
+            return
+        name = getattr(function, '_memo_name', None)
+        assert name is not None, 'not a memoized function'
+        for key in [key for key in _memo_cache if key[0] == name]:
+            del _memo_cache[key]
+
+
+@contextlib.contextmanager
+def bypass():
+    '''
+    Context manager under which the memoized functions called by this thread compute their result without
+    reading or filling the cache (the cached results and the counters are left as they are)
+    '''
+    _local.bypass = getattr(_local, 'bypass', 0) + 1
+    try:
+        yield
+    finally:
+        _local.bypass -= 1
+
+
+def cache_info():
+    '''
+    Returns the hits, misses and evictions since the last reset_stats, and the current and maximum cache size
+    '''
+    with _lock:
+        return dict(_stats, size=len(_memo_cache), max_size=_cache_size, enabled=_enabled)
+
+
+def reset_stats():
+    '''
+    Resets the hit, miss and eviction counters
+    '''
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _evict():
+    '''
+    Drops the least recently used results above the cache size (the lock is held by the caller)
+    '''
+    while len(_memo_cache) > _cache_size:
+        _memo_cache.popitem(last=False)
+        _stats['evictions'] += 1
+
+
+def _argument_key(value):
+    '''
+    Returns the part of the cache key of one argument: the identity and version stamp of dataframes and series,
+    the repr of anything else
+
+    @param value: argument of a memoized function
+    '''
+    if isinstance(value, pd.DataFrame):
+        return 'DataFrame', id(value), frame_version(value)
+    if isinstance(value, pd.Series):
+        return 'Series', id(value), str(value.name), frame_version(value.to_frame(name=0))
+    return repr(value)
+
+
+def _copy(result):
+    '''
+    Returns a copy of a result that shares nothing mutable with it
+
+    @param result: result of a memoized function
+    '''
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy(deep=True)
+    if isinstance(result, tuple):
+        return tuple(_copy(value) for value in result)
+    return copy.deepcopy(result)
+
+
+def memoize(function=None, name=None):
+    '''
+    Decorator memoizing the function while memoization is enabled. Usable as @memoize or @memoize(name='...')
+
+    Note: only for functions whose result depends on nothing but their arguments, and not for functions
+          returning figures
+
+    @param function: decorated function
+    @param name: key of the function in the cache (defaults to its module and name)
+    @type name: str
+    '''
+    if function is None:
+        return functools.partial(memoize, name=name)
+
+    memo_name = name or '{}.{}'.format(function.__module__, function.__qualname__)
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled or getattr(_local, 'bypass', 0):
+            return function(*args, **kwargs)
+        #positional, keyword and default arguments of the same call give the same key
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (memo_name, tuple((arg, _argument_key(value)) for arg, value in bound.arguments.items()))
+        frames = [value for value in bound.arguments.values() if isinstance(value, (pd.DataFrame, pd.Series))]
+        with _lock:
+            entry = _memo_cache.get(key)
+            #the weak references tell the frames apart from later ones reusing their ids
+            if entry is not None and all(ref() is frame for ref, frame in zip(entry[0], frames)):
+                _memo_cache.move_to_end(key)
+                _stats['hits'] += 1
+                return _copy(entry[1])
+            _stats['misses'] += 1
+        result = function(*args, **kwargs)
+        with _lock:
+            _memo_cache[key] = ([weakref.ref(frame) for frame in frames], _copy(result))
+            _evict()
+        return result
+
+    wrapper._memo_name = memo_name
+    return wrapper
+
+
+if os.environ.get(MEMOIZE_ENV):
+    enable()
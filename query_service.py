@@ -0,0 +1,341 @@
+'''
+Local HTTP JSON service over the cleaned space data
+
+The csv is cleaned once (through the dataset cache) and rolled up into one aggregation cube when the service
+starts. Every request slices that cube with its filters and runs the analysis function on the slice, so a
+request never touches the launches themselves. Responses are kept in an in-memory LRU cache and carry an ETag;
+a request with a matching If-None-Match gets an empty 304:
+
+    python query_service.py [Space_Corrected.csv] [--host 127.0.0.1] [--port 8143]
+    curl 'http://127.0.0.1:8143/company_success_rate?year_from=2000&country=USA,China'
+
+GET / lists the endpoints and filters, GET /stats the cache statistics.
+'''
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import pandas as pd
+from helper_func import dataframe_fingerprint
+from aggregation_cube import CUBE_DIMENSIONS, get_cube, cube_query, index_cube
+from leaderboard import leaderboard, ENTITIES, METRICS, BUCKETS
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#dimensions of the cube of the service (SpaceCenter is added for the leaderboards and filters)
+SERVICE_DIMENSIONS = CUBE_DIMENSIONS + ['SpaceCenter']
+
+#query parameters filtering the cube: name -> dimension (values are comma-separated)
+FILTERS = {'country': 'Country', 'company': 'Company', 'launch_vehicle': 'LaunchVehicle',
+           'space_center': 'SpaceCenter', 'month': 'Month', 'mission_status': 'MissionStatus',
+           'rocket_status': 'RocketStatus'}
+
+#query parameters filtering the years (inclusive bounds)
+YEAR_FILTERS = ['year_from', 'year_to']
+
+#number of responses kept in memory
+RESPONSE_CACHE_SIZE = 256
+DEFAULT_PORT = 8143
+
+#listen backlog of the server
+REQUEST_QUEUE_SIZE = 128
+
+
+def _company_success_rate(cube, params):
+    from company_col_utils import calculate_company_success_launch_rate
+
+    return calculate_company_success_launch_rate(cube)
+
+
+def _company_average_cost(cube, params):
+    from company_col_utils import calculate_company_average_launch_cost
+
+    return calculate_company_average_launch_cost(cube)
+
+
+def _country_average_cost(cube, params):
+    from company_col_utils import calculate_country_average_launch_cost
+
+    return calculate_country_average_launch_cost(cube)
+
+
+def _leaderboard_active(cube, params):
+    from countries_leaderboard_activevsretired import country_leaderboard_active_data
+
+    return country_leaderboard_active_data(cube)
+
+
+def _leaderboard_retired(cube, params):
+    from countries_leaderboard_activevsretired import country_leaderboard_retired_data
+
+    return country_leaderboard_retired_data(cube)
+
+
+def _monthly_cost_average(cube, params):
+    from datum_analysis_all_in_one import monthly_cost_average_data
+
+    return monthly_cost_average_data(cube)
+
+
+def _yearly_cost_average(cube, params):
+    from datum_analysis_all_in_one import yearly_cost_average_data
+
+    return yearly_cost_average_data(cube)
+
+
+def _missions_per_country(cube, params):
+    return cube_query(cube, ['Country'], sort=True)[['Country', 'launches']]
+
+
+def _leaderboard(cube, params):
+    window = params.pop('window', None)
+    return leaderboard(cube, params.pop('entity', 'Country'), params.pop('metric', 'launches'),
+                       params.pop('bucket', 'year'), int(params.pop('k', '1')),
+                       None if window is None else int(window))
+
+
+#endpoints: path -> (function of the filtered cube and of the remaining query parameters, description)
+ENDPOINTS = {
+    '/company_success_rate': (_company_success_rate, 'calculate_company_success_launch_rate'),
+    '/company_average_cost': (_company_average_cost, 'calculate_company_average_launch_cost'),
+    '/country_average_cost': (_country_average_cost, 'calculate_country_average_launch_cost'),
+    '/leaderboard/active': (_leaderboard_active, 'country_leaderboard_active_data'),
+    '/leaderboard/retired': (_leaderboard_retired, 'country_leaderboard_retired_data'),
+    '/monthly_cost_average': (_monthly_cost_average, 'monthly_cost_average_data'),
+    '/yearly_cost_average': (_yearly_cost_average, 'yearly_cost_average_data'),
+    '/missions_per_country': (_missions_per_country, 'number of launches per country'),
+    '/leaderboard': (_leaderboard, 'leaderboard, with the parameters entity ({}), metric ({}), bucket ({}), k and '
+                                   'window'.format('|'.join(ENTITIES), '|'.join(METRICS), '|'.join(BUCKETS))),
+}
+
+
+class QueryError(ValueError):
+    '''
+    Invalid request, answered with the given HTTP status
+    '''
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryService:
+    '''
+    Answers the queries of the service from the aggregation cube of the cleaned data, caching the responses
+
+    Note: responses only depend on the data and the query, so they are cached for the lifetime of the service
+          (least recently used ones are evicted). ETags hash the data fingerprint and the response body
+    '''
+
+    def __init__(self, df, cache_size=RESPONSE_CACHE_SIZE):
+        '''
+        @param df: cleaned dataframe
+        @param cache_size: number of responses kept in memory
+        @type df: pd.DataFrame
+        @type cache_size: int
+        '''
+        assert isinstance(df, pd.DataFrame)
+        assert isinstance(cache_size, int) and cache_size >= 0
+
+        self.cube = get_cube(df, SERVICE_DIMENSIONS)
+        self.index = index_cube(self.cube)
+        self.fingerprint = dataframe_fingerprint(df)
+        self.rows = len(df)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'not_modified': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def filter_cube(self, params):
+        '''
+        Returns the cells of the cube matching the filter parameters, which are removed from params
+
+        Note: filters on indexed dimensions go through the BitmapIndex of the cube, so they only read the
+              selected cells; the others (space_center, month) are checked on those cells
+
+        @param params: dictionary of the query parameters (name -> value)
+        @type params: Dict
+        '''
+        assert isinstance(params, dict)
+
+        years = []
+        for name in YEAR_FILTERS:
+            try:
+                years.append(int(params.pop(name)) if name in params else None)
+            except ValueError:
+                raise QueryError('{} must be a year'.format(name))
+        where = {dim: params.pop(name).split(',') for name, dim in FILTERS.items() if name in params}
+
+        ranges = {'Year': tuple(years)} if years != [None, None] else None
+        cells = self.cube.iloc[self.index.select({dim: values for dim, values in where.items()
+                                                  if dim in self.index.dims}, ranges)]
+        mask = np.ones(len(cells), dtype=bool)
+        for dim, values in where.items():
+            if dim not in self.index.dims:
+                mask &= cells[dim].isin(values).to_numpy()
+        return cells[mask]
+
+    def answer(self, path, params):
+        '''
+        Returns the (etag, json body) of a query, from the response cache when possible
+
+        @param path: endpoint path (see ENDPOINTS)
+        @param params: dictionary of the query parameters (name -> value)
+        @type path: str
+        @type params: Dict
+        '''
+        assert isinstance(path, str)
+        assert isinstance(params, dict)
+
+        if path == '/':
+            return None, json.dumps({'rows': self.rows, 'endpoints': {p: d for p, (_, d) in ENDPOINTS.items()},
+                                     'filters': YEAR_FILTERS + list(FILTERS)}).encode()
+        if path == '/stats':
+            with self._lock:
+                stats = dict(self.stats, cached=len(self._cache))
+            return None, json.dumps(stats).encode()
+        if path not in ENDPOINTS:
+            raise QueryError('unknown endpoint {}'.format(path), status=404)
+
+        key = (path, tuple(sorted(params.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._cache[key]
+            self.stats['misses'] += 1
+
+        params = dict(params)
+        cube = self.filter_cube(params)
+        try:
+            result = ENDPOINTS[path][0](cube, params)
+        except (AssertionError, ValueError) as e:
+            raise QueryError('invalid parameters: {}'.format(e) if str(e) else 'invalid parameters')
+        if params:
+            raise QueryError('unknown parameters: {}'.format(', '.join(sorted(params))))
+
+        body = result.to_json(orient='records').encode()
+        etag = '"{}"'.format(hashlib.sha1(self.fingerprint.encode() + body).hexdigest()[:20])
+        with self._lock:
+            self._cache[key] = (etag, body)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return etag, body
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP handler of the QueryService of the server (server.service)
+    '''
+    server_version = 'SpaceDataQuery/1.0'
+
+    def do_GET(self):
+        service = self.server.service
+        service._count('requests')
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            etag, body = service.answer(url.path.rstrip('/') or '/', params)
+        except QueryError as e:
+            service._count('errors')
+            self._send(e.status, json.dumps({'error': str(e)}).encode())
+            return
+        except Exception as e:
+            service._count('errors')
+            self._send(500, json.dumps({'error': '{}: {}'.format(type(e).__name__, e)}).encode())
+            return
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            service._count('not_modified')
+            self._send(304, None, etag)
+            return
+        self._send(200, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    '''
+    Threading HTTP server of the QueryService
+
+    Note: the default listen backlog (5) makes bursts of concurrent clients wait for a SYN retry (about 1 s)
+    '''
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+def make_server(df, host='127.0.0.1', port=DEFAULT_PORT, cache_size=RESPONSE_CACHE_SIZE, verbose=False):
+    '''
+    Returns a threading HTTP server answering the queries on the cleaned dataframe (call serve_forever to start it)
+
+    @param df: cleaned dataframe
+    @param host: address to listen on
+    @param port: port to listen on (0 picks a free port, see server.server_address)
+    @param cache_size: number of responses kept in memory
+    @param verbose: log every request
+    @type df: pd.DataFrame
+    @type host: str
+    @type port: int
+    @type cache_size: int
+    @type verbose: bool
+    '''
+    assert isinstance(host, str)
+    assert isinstance(port, int)
+
+    server = QueryServer((host, port), QueryHandler)
+    server.service = QueryService(df, cache_size)
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    from dataset_cache import load_cleaned
+
+    parser = argparse.ArgumentParser(description='Serve the space data analyses as JSON over HTTP')
+    parser.add_argument('path', nargs='?', default=os.path.join(_BASE_DIR, 'Space_Corrected.csv'),
+                        help='csv file of the space data')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--cache-size', type=int, default=RESPONSE_CACHE_SIZE, help='responses kept in memory')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    server = make_server(load_cleaned(args.path), args.host, args.port, args.cache_size, args.verbose)
+    print('serving {} rows on http://{}:{}/ (ready in {:.2f} s)'.format(
+        server.service.rows, *server.server_address[:2], time.perf_counter() - start))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+'''
+Headless renderer of every analysis figure
+
+Cleans the space data once (through the dataset cache), then builds the figures in a process pool and writes
+plotly figures as HTML (and PNG when kaleido is installed) and matplotlib figures as PNG. A figure is skipped when
+its input hash (cleaned data, figure arguments and source of its module) matches the previous run. The serialized
+size of the plotly figures is reported, and --size-budget shrinks the larger ones (see figure_budget):
+
+    python report_renderer.py [Space_Corrected.csv] [--out report] [--workers 4] [--figure NAME] [--force] [--json]
+                              [--size-budget BYTES]
+'''
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from helper_func import dataframe_fingerprint
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#figures of the report: name -> (module, function, keyword arguments); functions returning a tuple give one file per figure
+FIGURES = {
+    'country_average_launch_cost': ('report_renderer', 'country_average_launch_cost_figure', {}),
+    'company_average_launch_cost': ('report_renderer', 'company_average_launch_cost_figure', {}),
+    'company_per_country_map': ('report_renderer', 'company_per_country_figure', {}),
+    'company_country_hist': ('country_col_plots', 'company_country_hist_plot', {}),
+    'company_russia': ('country_col_plots', 'company_russia_plot', {}),
+    'company_usa': ('country_col_plots', 'company_usa_plot', {}),
+    'country_missions_hist': ('country_col_plots', 'country_missions_hist_plot', {}),
+    'trend_top_five_countries': ('country_col_plots', 'trend_top_five_countries_plot', {}),
+    'trend_usa_and_russia': ('country_col_plots', 'trend_usa_and_russia_plot', {}),
+    'total_missions_world': ('country_col_plots', 'total_missions_world_plot', {}),
+    'success_failure_rate_world': ('country_col_plots', 'success_failure_rate_world_plot', {}),
+    'country_leaderboard_active': ('countries_leaderboard_activevsretired', 'country_leaderboard_active_plots',
+                                   {'show': False}),
+    'country_leaderboard_retired': ('countries_leaderboard_activevsretired', 'country_leaderboard_retired_plots',
+                                    {'show': False}),
+    'top_5_most_used_LVs': ('Launch_Vehicle_all_in_one', 'plot_top_5_most_used_LVs', {}),
+    'success_rate_LVs': ('Launch_Vehicle_all_in_one', 'plot_success_rate_LVs', {}),
+    'LVs_per_country': ('Launch_Vehicle_all_in_one', 'plot_LVs_per_country', {}),
+    'missions_per_country': ('Launch_Vehicle_all_in_one', 'plot_Missions_per_country', {}),
+    'month_country_count': ('datum_analysis_all_in_one', 'month_country_count', {}),
+    'launch_each_month': ('datum_analysis_all_in_one', 'launch_each_month', {'show': False}),
+    'monthly_cost_average': ('datum_analysis_all_in_one', 'monthly_cost_average', {'show': False}),
+    'yearly_cost_average': ('datum_analysis_all_in_one', 'yearly_cost_average', {'show': False}),
+}
+
+MANIFEST = 'manifest.json'
+PNG_DPI = 150
+
+_worker_df = None
+
+
+def country_average_launch_cost_figure(df):
+    '''
+    Returns the matplotlib figure of the average launch cost per country
+
+    @param df: cleaned dataframe
+    @type df: pd.DataFrame
+    '''
+    from company_col_utils import calculate_country_average_launch_cost, visualize_country_average_launch_cost
+
+    return visualize_country_average_launch_cost(calculate_country_average_launch_cost(df))
+
+
+def company_average_launch_cost_figure(df):
+    '''
+    Returns the matplotlib figure of the average launch cost per company
+
+    @param df: cleaned dataframe
+    @type df: pd.DataFrame
+    '''
+    from company_col_utils import calculate_company_average_launch_cost, visualize_company_average_launch_cost
+
+    return visualize_company_average_launch_cost(calculate_company_average_launch_cost(df))
+
+
+def company_per_country_figure(df):
+    '''
+    Returns the matplotlib map of the number of companies per country
+
+    @param df: cleaned dataframe
+    @type df: pd.DataFrame
+    '''
+    from company_col_utils import calculate_company_per_country, visualize_num_company_per_country
+
+    return visualize_num_company_per_country(calculate_company_per_country(df), path=None)
+
+
+def figure_hash(name, data_fingerprint, size_budget=None):
+    '''
+    Returns the input hash of a figure: the cleaned data, the figure arguments, the size budget and the source of
+    its module
+
+    @param name: name of the figure in FIGURES
+    @param data_fingerprint: dataframe_fingerprint of the cleaned data
+    @param size_budget: size budget of the plotly figures in bytes
+    @type name: str
+    @type data_fingerprint: str
+    @type size_budget: int
+    '''
+    assert name in FIGURES
+    assert isinstance(data_fingerprint, str)
+
+    module, function, kwargs = FIGURES[name]
+    digest = hashlib.sha1('{}|{}|{}|{!r}|{}'.format(data_fingerprint, module, function, sorted(kwargs.items()),
+                                                     size_budget).encode())
+    with open(importlib.util.find_spec(module).origin, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def save_figure(fig, stem, formats):
+    '''
+    Writes a plotly or matplotlib figure next to stem and returns the list of written files
+
+    Note: matplotlib figures are always written as PNG; plotly figures as HTML, and as PNG only if kaleido
+          is installed
+
+    @param fig: plotly or matplotlib figure
+    @param stem: output path without extension
+    @param formats: formats to write ('html', 'png')
+    @type stem: str
+    @type formats: List
+    '''
+    assert isinstance(stem, str)
+
+    files = []
+    if hasattr(fig, 'write_html'):
+        if 'html' in formats:
+            fig.write_html(stem + '.html', include_plotlyjs='cdn')
+            files.append(stem + '.html')
+        if 'png' in formats and importlib.util.find_spec('kaleido') is not None:
+            fig.write_image(stem + '.png')
+            files.append(stem + '.png')
+    else:
+        import matplotlib.pyplot as plt
+
+        fig.savefig(stem + '.png', dpi=PNG_DPI, bbox_inches='tight')
+        plt.close(fig)
+        files.append(stem + '.png')
+    return files
+
+
+def _init_worker(df):
+    '''
+    Process-pool initializer: keeps the cleaned dataframe in the worker and makes matplotlib headless
+
+    @param df: cleaned dataframe
+    @type df: pd.DataFrame
+    '''
+    global _worker_df
+    import matplotlib
+
+    matplotlib.use('Agg')
+    _worker_df = df
+
+
+def render_figure(name, out_dir, formats, size_budget=None):
+    '''
+    Builds one figure of FIGURES from the worker dataframe and writes it to out_dir.
+    Returns (name, list of written files, seconds, serialized size in bytes of its plotly figures or None)
+
+    @param name: name of the figure in FIGURES
+    @param out_dir: output directory
+    @param formats: formats to write ('html', 'png')
+    @param size_budget: size budget of every plotly figure in bytes (None keeps them as built)
+    @type name: str
+    @type out_dir: str
+    @type formats: List
+    @type size_budget: int
+    '''
+    from figure_budget import fit_figure
+
+    start = time.perf_counter()
+    module, function, kwargs = FIGURES[name]
+    result = getattr(importlib.import_module(module), function)(_worker_df.copy(), **kwargs)
+    figs = result if isinstance(result, tuple) else (result,)
+    files = []
+    payload = None
+    for i, fig in enumerate(figs):
+        if hasattr(fig, 'write_html'):
+            fig = fit_figure(fig, size_budget)
+            payload = (payload or 0) + fig.layout.meta['payload_bytes']
+        stem = name if len(figs) == 1 else '{}_{}'.format(name, i + 1)
+        files += save_figure(fig, os.path.join(out_dir, stem), formats)
+    return name, files, time.perf_counter() - start, payload
+
+
+def render_report(path, out_dir='report', formats=('html', 'png'), workers=None, figures=None, force=False,
+                  size_budget=None):
+    '''
+    Renders the figures of the report and returns one dictionary per figure (after one for the data loading) with
+    its status ('rendered', 'skipped' or 'failed'), seconds, written files, serialized size of its plotly figures
+    and error message
+
+    Note: the data is cleaned once (served from the dataset cache when possible) and shipped once to every
+          worker. out_dir/manifest.json keeps the input hash of every figure, so unchanged figures are skipped
+          unless force is True
+
+    @param path: path of the csv file
+    @param out_dir: output directory
+    @param formats: formats to write ('html', 'png')
+    @param workers: number of worker processes (None uses the number of CPUs)
+    @param figures: names of the figures to render (None renders all FIGURES)
+    @param force: render the figures even if their input hash is unchanged
+    @param size_budget: size budget of every plotly figure in bytes (None keeps them as built)
+    @type path: str
+    @type out_dir: str
+    @type formats: List
+    @type workers: int
+    @type figures: List
+    @type force: bool
+    @type size_budget: int
+    '''
+    from dataset_cache import load_cleaned
+
+    assert isinstance(path, str)
+    assert isinstance(out_dir, str)
+    assert all(fmt in ('html', 'png') for fmt in formats)
+    assert workers is None or (isinstance(workers, int) and workers > 0)
+    assert figures is None or all(name in FIGURES for name in figures)
+    assert isinstance(force, bool)
+    assert size_budget is None or (isinstance(size_budget, int) and size_budget > 0)
+
+    names = list(FIGURES) if figures is None else list(figures)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    start = time.perf_counter()
+    df = load_cleaned(path)
+    fingerprint = dataframe_fingerprint(df)
+    hashes = {name: figure_hash(name, fingerprint, size_budget) for name in names}
+    load_seconds = time.perf_counter() - start
+
+    results = {}
+    todo = []
+    for name in names:
+        entry = manifest.get(name)
+        if (not force and entry is not None and entry['hash'] == hashes[name]
+                and all(os.path.isfile(file) for file in entry['files'])):
+            results[name] = {'figure': name, 'status': 'skipped', 'seconds': 0.0, 'files': entry['files'],
+                             'payload_bytes': entry.get('payload_bytes')}
+        else:
+            todo.append(name)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df,)) as pool:
+            futures = {pool.submit(render_figure, name, out_dir, list(formats), size_budget): name for name in todo}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    _, files, seconds, payload = future.result()
+                except Exception as e:
+                    results[name] = {'figure': name, 'status': 'failed', 'seconds': None, 'files': [],
+                                     'error': '{}: {}'.format(type(e).__name__, e)}
+                    manifest.pop(name, None)
+                    continue
+                results[name] = {'figure': name, 'status': 'rendered', 'seconds': seconds, 'files': files,
+                                 'payload_bytes': payload}
+                manifest[name] = {'hash': hashes[name], 'files': files, 'seconds': seconds, 'payload_bytes': payload}
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    report = [results[name] for name in names]
+    report.insert(0, {'figure': '(load and clean data)', 'status': 'loaded', 'seconds': load_seconds, 'files': []})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render every analysis figure without a display')
+    parser.add_argument('path', nargs='?', default=os.path.join(_BASE_DIR, 'Space_Corrected.csv'),
+                        help='csv file of the space data')
+    parser.add_argument('--out', default='report', help='output directory')
+    parser.add_argument('--formats', default='html,png', help='comma-separated output formats (html, png)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--figure', action='append', choices=sorted(FIGURES), help='figure to render (repeatable)')
+    parser.add_argument('--force', action='store_true', help='render figures even if their input is unchanged')
+    parser.add_argument('--json', action='store_true', help='print the timings as json')
+    parser.add_argument('--size-budget', type=int, default=None, help='largest serialized plotly figure in bytes')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    report = render_report(args.path, args.out, args.formats.split(','), args.workers, args.figure, args.force,
+                           args.size_budget)
+    total = time.perf_counter() - start
+    if args.json:
+        print(json.dumps({'figures': report, 'total_seconds': total}, indent=2))
+    else:
+        for entry in report:
+            seconds = '' if entry['seconds'] is None else '{:8.2f} s'.format(entry['seconds'])
+            payload = '' if entry.get('payload_bytes') is None else '{:8.1f} kB'.format(entry['payload_bytes'] / 1000)
+            print('{:<30} {:<9} {:>10} {:>11}  {}'.format(entry['figure'], entry['status'], seconds, payload,
+                                                          entry.get('error', '')))
+        print('{:<30} {:<9} {:8.2f} s'.format('total', '', total))
+    return 1 if any(entry['status'] == 'failed' for entry in report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
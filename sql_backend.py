@@ -0,0 +1,389 @@
+'''
+Embedded DuckDB backend of the aggregations
+
+Every aggregation of company_col_utils, country_col_plots, datum_analysis_all_in_one,
+countries_leaderboard_activevsretired and leaderboard rolls up the aggregation cube of get_cube. With the duckdb
+backend, the cube is computed by one SQL GROUP BY in an embedded DuckDB database (parallel over all cores,
+spilling to disk past its memory limit) instead of a pandas groupby; the callers do not change:
+
+    aggregation_cube.set_backend('duckdb')      # or SPACE_DATA_BACKEND=duckdb
+    calculate_company_success_launch_rate(df)
+
+parquet_cube runs the same query directly over the cleaned Parquet dataset of dataset_cache, skipping the row
+groups outside the requested years/countries, so the launches never have to fit in memory. The cube it returns
+can be passed to every cube-based analysis function:
+
+    cube = parquet_cube('Space_Corrected.csv', years=list(range(1990, 2001)))
+    calculate_company_average_launch_cost(cube)
+
+check_parity runs the aggregations with both backends and reports every result that differs (the same
+comparisons run as tests in tests/test_sql_backend_parity.py):
+
+    python sql_backend.py [Space_Corrected.csv] [--json]
+'''
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import aggregation_cube
+from aggregation_cube import CUBE_DIMENSIONS, CUBE_MEASURES
+from dataset_cache import CACHE_DIR, MANIFEST, DATA_FILE, ROW_ID_COL, cleaned_dataset_dir
+from instrumentation import instrument
+
+#dtypes of the measures of a cube (DuckDB returns sums of an empty set of costs as 0.0 via COALESCE)
+MEASURE_DTYPES = {'launches': np.int64, 'cost_sum': np.float64, 'cost_count': np.int64,
+                  'cost_pos_sum': np.float64, 'cost_pos_count': np.int64}
+
+#relative tolerance of the float comparisons of check_parity (sums may be added in a different order)
+PARITY_RTOL = 1e-9
+
+#slices of the cached Parquet dataset compared by check_parity: name -> filters of parquet_cube/load_cleaned
+PARQUET_PARITY_CASES = {
+    'parquet_cube': {},
+    'parquet_cube(1990-2000, USA/Russia)': {'years': list(range(1990, 2001)), 'countries': ['USA', 'Russia']},
+}
+
+_connection = None
+_lock = threading.Lock()
+
+
+def connection():
+    '''
+    Returns a cursor of the in-memory DuckDB database of this process (one cursor per call, so threads do not
+    share one)
+    '''
+    global _connection
+    import duckdb
+
+    with _lock:
+        if _connection is None:
+            _connection = duckdb.connect(':memory:')
+        return _connection.cursor()
+
+
+def _quote(name):
+    '''
+    Returns the column name as a quoted SQL identifier
+
+    @param name: column name
+    @type name: str
+    '''
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _literal(value):
+    '''
+    Returns the value as an SQL literal (numbers and strings)
+
+    @param value: value of a filter
+    '''
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def cube_sql(relation, dims, row_col, has_cost=True, where=None):
+    '''
+    Returns the SQL query of the aggregation cube of a relation: the CUBE_MEASURES per distinct combination of
+    the dimensions, in order of the first row of every combination (the order of build_cube)
+
+    @param relation: table, view or table function holding the launches
+    @param dims: dimensions of the cube
+    @param row_col: column numbering the rows in their original order
+    @param has_cost: the relation has a MissionCost column
+    @param where: SQL condition selecting the launches (None keeps them all)
+    @type relation: str
+    @type dims: List
+    @type row_col: str
+    @type has_cost: bool
+    @type where: str
+    '''
+    keys = ', '.join(_quote(dim) for dim in dims)
+    cost = _quote('MissionCost') if has_cost else 'CAST(NULL AS DOUBLE)'
+    return ('SELECT {keys}, COUNT(*) AS launches, '
+            'COALESCE(SUM({cost}), 0) AS cost_sum, COUNT({cost}) AS cost_count, '
+            'COALESCE(SUM({cost}) FILTER (WHERE {cost} > 0), 0) AS cost_pos_sum, '
+            'COUNT(*) FILTER (WHERE {cost} > 0) AS cost_pos_count '
+            'FROM {relation}{where} GROUP BY {keys} ORDER BY MIN({row})').format(
+        keys=keys, cost=cost, relation=relation, where='' if where is None else ' WHERE ' + where,
+        row=_quote(row_col))
+
+
+def _restore_cube_dtypes(cube, dtypes):
+    '''
+    Returns the cube read from DuckDB with the dtypes of the cleaned dataframe on its dimensions and the dtypes
+    of build_cube on its measures
+
+    @param cube: result of the cube_sql query
+    @param dtypes: series with the dtype of every dimension in the cleaned dataframe
+    @type cube: pd.DataFrame
+    @type dtypes: pd.Series
+    '''
+    for col, dtype in dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            #DuckDB hands back ENUMs (or strings) with its own categories, set those of the cleaned frame
+            cube[col] = pd.Categorical(cube[col].astype(object), dtype=dtype)
+        else:
+            cube[col] = cube[col].astype(dtype)
+    for measure, dtype in MEASURE_DTYPES.items():
+        cube[measure] = cube[measure].astype(dtype)
+    return cube[list(dtypes.index) + CUBE_MEASURES]
+
+
+@instrument
+def build_cube_sql(df, dims=CUBE_DIMENSIONS):
+    '''
+    Returns the aggregation cube of the cleaned dataframe computed by DuckDB, equal to build_cube(df, dims)
+    (the cube builder of the duckdb backend of aggregation_cube)
+
+    Note: launches with a missing dimension value are counted in a cell with that dimension missing, as
+          build_cube's dropna=False intends; pandas 1.x drops missing categorical keys there (the cleaned data
+          has no missing dimension values)
+
+    @param df: cleaned dataframe
+    @param dims: dimensions of the cube (any columns of the dataframe, CUBE_DIMENSIONS by default)
+    @type df: pd.DataFrame
+    @type dims: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(dims, list)
+
+    dims = [dim for dim in dims if dim in df.columns]
+    assert len(dims) > 0
+
+    has_cost = 'MissionCost' in df.columns
+    launches = df[dims + (['MissionCost'] if has_cost else [])].assign(**{ROW_ID_COL: np.arange(len(df))})
+    cursor = connection()
+    try:
+        #DuckDB scans the registered frame in place, without copying it into the database
+        cursor.register('launches', launches)
+        cube = cursor.execute(cube_sql('launches', dims, ROW_ID_COL, has_cost)).df()
+    finally:
+        cursor.close()
+    return _restore_cube_dtypes(cube, df.dtypes[dims])
+
+
+def _manifest_dtypes(manifest, dims):
+    '''
+    Returns the series of the dtypes of the cleaned dataframe of a dataset_cache manifest
+
+    @param manifest: manifest of a cached dataset
+    @param dims: columns
+    @type manifest: Dict
+    @type dims: List
+    '''
+    dtypes = {}
+    for dim in dims:
+        if dim in manifest['categories']:
+            dtypes[dim] = pd.CategoricalDtype(**manifest['categories'][dim])
+        else:
+            dtypes[dim] = np.dtype(manifest['dtypes'][dim])
+    return pd.Series(dtypes, dtype=object)
+
+
+@instrument
+def parquet_cube(path, dims=CUBE_DIMENSIONS, years=None, countries=None, cache_dir=CACHE_DIR):
+    '''
+    Returns the aggregation cube of the cleaned launches of the csv file computed by DuckDB over the cached
+    Parquet dataset (see dataset_cache), without loading the launches into pandas. Equal to
+    build_cube(load_cleaned(path, years=years, countries=countries), dims)
+
+    Note: the year and country filters are pushed down to the Parquet reader, so the row groups whose Year/Country
+          statistics exclude them are never read
+
+    @param path: path of the csv file
+    @param dims: dimensions of the cube
+    @param years: list of years to aggregate (None aggregates all years)
+    @param countries: list of countries to aggregate (None aggregates all countries)
+    @param cache_dir: root directory of the cache
+    @type path: str
+    @type dims: List
+    @type years: List
+    @type countries: List
+    @type cache_dir: str
+    '''
+    assert isinstance(dims, list)
+    assert years is None or isinstance(years, list)
+    assert countries is None or isinstance(countries, list)
+
+    dataset_dir = cleaned_dataset_dir(path, cache_dir)
+    with open(os.path.join(dataset_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    dims = [dim for dim in dims if dim in manifest['dtypes']]
+    assert len(dims) > 0
+
+    conditions = []
+    if years is not None:
+        conditions.append('"Year" IN ({})'.format(', '.join(_literal(int(x)) for x in years) or 'NULL'))
+    if countries is not None:
+        conditions.append('"Country" IN ({})'.format(', '.join(_literal(str(x)) for x in countries) or 'NULL'))
+    relation = "read_parquet('{}')".format(os.path.join(dataset_dir, DATA_FILE).replace("'", "''"))
+
+    cursor = connection()
+    try:
+        cube = cursor.execute(cube_sql(relation, dims, ROW_ID_COL, 'MissionCost' in manifest['dtypes'],
+                                       ' AND '.join(conditions) or None)).df()
+    finally:
+        cursor.close()
+    return _restore_cube_dtypes(cube, _manifest_dtypes(manifest, dims))
+
+
+def parity_functions():
+    '''
+    Returns the list of (name, function of the cleaned dataframe) compared by check_parity: every cube-based
+    aggregation, and the figures of the country plots (compared as plotly json)
+    '''
+    import company_col_utils
+    import country_col_plots
+    import datum_analysis_all_in_one
+    import countries_leaderboard_activevsretired
+    from leaderboard import leaderboard
+
+    functions = [
+        ('calculate_company_success_launch_rate', company_col_utils.calculate_company_success_launch_rate),
+        ('calculate_company_average_launch_cost', company_col_utils.calculate_company_average_launch_cost),
+        ('calculate_country_average_launch_cost', company_col_utils.calculate_country_average_launch_cost),
+        ('monthly_cost_average_data', datum_analysis_all_in_one.monthly_cost_average_data),
+        ('yearly_cost_average_data', datum_analysis_all_in_one.yearly_cost_average_data),
+        ('country_leaderboard_active_data', countries_leaderboard_activevsretired.country_leaderboard_active_data),
+        ('country_leaderboard_retired_data',
+         countries_leaderboard_activevsretired.country_leaderboard_retired_data),
+        ('leaderboard(Company, successes, window=5)',
+         lambda df: leaderboard(df, 'Company', 'successes', 'year', k=3, window=5)),
+        ('leaderboard(SpaceCenter, launches, decade)',
+         lambda df: leaderboard(df, 'SpaceCenter', 'launches', 'decade', k=2)),
+        ('leaderboard(LaunchVehicle, cost_mean)', lambda df: leaderboard(df, 'LaunchVehicle', 'cost_mean', k=2)),
+    ]
+    for name in ['company_country_hist_plot', 'company_russia_plot', 'company_usa_plot',
+                 'country_missions_hist_plot', 'trend_top_five_countries_plot', 'trend_usa_and_russia_plot',
+                 'total_missions_world_plot', 'success_failure_rate_world_plot']:
+        plot = getattr(country_col_plots, name)
+        functions.append((name, lambda df, plot=plot: _figure_json(plot(df))))
+    return functions
+
+
+def _figure_json(figures):
+    '''
+    Returns the plotly json of a figure (or of a tuple of figures) as python objects
+
+    @param figures: plotly figure or tuple of plotly figures
+    '''
+    if isinstance(figures, tuple):
+        return [_figure_json(fig) for fig in figures]
+    return json.loads(figures.to_json())
+
+
+def _difference(expected, actual):
+    '''
+    Returns a description of the difference between two results, None when they are equal (floats within
+    PARITY_RTOL)
+
+    @param expected: result of the pandas backend
+    @param actual: result of the duckdb backend
+    '''
+    try:
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=PARITY_RTOL)
+        elif isinstance(expected, pd.Series):
+            pd.testing.assert_series_equal(expected, actual, check_exact=False, rtol=PARITY_RTOL)
+        elif expected != actual:
+            return 'results differ'
+    except AssertionError as e:
+        return str(e).strip().splitlines()[0]
+    return None
+
+
+def backend_difference(function, df):
+    '''
+    Returns the difference between the results of function(df) with the pandas and the duckdb backend, None when
+    they are equal (see _difference)
+
+    Note: memoized functions are computed without going through the memo cache, which is left as it is
+
+    @param function: function of the cleaned dataframe
+    @param df: cleaned dataframe
+    @type df: pd.DataFrame
+    '''
+    import memoize
+
+    assert isinstance(df, pd.DataFrame)
+
+    previous = aggregation_cube.get_backend()
+    outputs = {}
+    try:
+        with memoize.bypass():
+            for backend in ['pandas', 'duckdb']:
+                aggregation_cube.set_backend(backend)
+                outputs[backend] = function(df)
+    finally:
+        aggregation_cube.set_backend(previous)
+    return _difference(outputs['pandas'], outputs['duckdb'])
+
+
+def parquet_difference(path, cache_dir=CACHE_DIR, **filters):
+    '''
+    Returns the difference between parquet_cube and build_cube of the cached dataset read into pandas, None when
+    they are equal
+
+    @param path: path of the csv file
+    @param cache_dir: root directory of the cache
+    @param filters: years and/or countries, see parquet_cube
+    @type path: str
+    @type cache_dir: str
+    '''
+    from dataset_cache import load_cleaned
+
+    expected = aggregation_cube.build_cube(load_cleaned(path, cache_dir=cache_dir, **filters))
+    return _difference(expected, parquet_cube(path, cache_dir=cache_dir, **filters))
+
+
+def check_parity(df, path=None, functions=None):
+    '''
+    Returns one dictionary per aggregation with its name, an `ok` flag and the difference between the results of
+    the pandas and duckdb backends (None when equal). With the path of the csv file, the cubes of parquet_cube
+    (PARQUET_PARITY_CASES) are also compared with build_cube of the cached dataset
+
+    @param df: cleaned dataframe
+    @param path: path of the csv file of df (None skips the Parquet comparisons)
+    @param functions: list of (name, function of the cleaned dataframe), see parity_functions by default
+    @type df: pd.DataFrame
+    @type path: str
+    @type functions: List
+    '''
+    assert isinstance(df, pd.DataFrame)
+    assert path is None or isinstance(path, str)
+
+    results = []
+    for name, function in functions or parity_functions():
+        difference = backend_difference(function, df)
+        results.append({'function': name, 'ok': difference is None, 'difference': difference})
+    if path is not None:
+        for name, filters in PARQUET_PARITY_CASES.items():
+            difference = parquet_difference(path, **filters)
+            results.append({'function': name, 'ok': difference is None, 'difference': difference})
+    return results
+
+
+def main(argv=None):
+    from data_cleaning_pre_processing import pre_processing
+
+    parser = argparse.ArgumentParser(description='Parity check of the pandas and duckdb aggregation backends')
+    parser.add_argument('path', nargs='?', default='Space_Corrected.csv', help='csv file of the launches')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args(argv)
+
+    results = check_parity(pre_processing(args.path), args.path)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print('{:<48} {}  {}'.format(result['function'], 'ok  ' if result['ok'] else 'FAIL',
+                                         result['difference'] or ''))
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+'''
+Synthetic space launch data for benchmarks
+
+Rows are bootstrapped from Space_Corrected.csv, so Company, Location, Detail, statuses and costs keep their joint
+distributions and exact string formats (location shapes, '1,160.0 ' costs, ...). Every launch time is moved by a
+random offset and written back in the format of the row it came from, so the Datum column has about as many
+distinct values as rows, like real data would.
+'''
+import os
+import numpy as np
+import pandas as pd
+from helper_func import load_dataframe, parse_dates, DATE_TIME_FORMAT, DATE_FORMAT
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(_BASE_DIR, 'Space_Corrected.csv')
+SYNTHETIC_DIR = os.path.join(_BASE_DIR, '.cache', 'synthetic')
+
+#launch times are moved by up to this many days (before or after) from the sampled row
+MAX_SHIFT_DAYS = 180
+
+
+def generate_launches(n_rows, seed=0, source=SOURCE_PATH):
+    '''
+    Returns a raw dataframe of n_rows synthetic launches with the columns and formats of the source csv
+
+    @param n_rows: number of rows
+    @param seed: seed of the random generator (the same seed gives the same rows)
+    @param source: path of the csv file the rows are sampled from
+    @type n_rows: int
+    @type seed: int
+    @type source: str
+    '''
+    assert isinstance(n_rows, int) and n_rows > 0
+    assert isinstance(seed, int)
+    assert isinstance(source, str)
+
+    real = load_dataframe(source)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(real), size=n_rows)
+    data = real.iloc[rows].reset_index(drop=True)
+
+    #shift every launch time (within the time span of the source), keeping the minutes of date-and-time rows and
+    #the date-only format of the others
+    real_datum = parse_dates(real['Datum']).dt.tz_localize(None)
+    datum = real_datum.to_numpy()[rows]
+    with_time = real['Datum'].str.contains(':', regex=False).to_numpy()[rows]
+    shift = rng.integers(-MAX_SHIFT_DAYS * 24 * 60, MAX_SHIFT_DAYS * 24 * 60, size=n_rows)
+    shift = np.where(with_time, shift, shift - shift % (24 * 60))
+    shifted = np.clip(datum + shift.astype('timedelta64[m]'), real_datum.min().to_datetime64(),
+                      real_datum.max().to_datetime64())
+    shifted = pd.DatetimeIndex(shifted)
+    data['Datum'] = np.where(with_time, shifted.strftime(DATE_TIME_FORMAT), shifted.strftime(DATE_FORMAT))
+
+    #row id columns of the source csv
+    for col in [col for col in data.columns if col.startswith('Unnamed: 0')]:
+        data[col] = np.arange(n_rows)
+    return data
+
+
+def synthetic_csv(scale, seed=0, source=SOURCE_PATH, out_dir=SYNTHETIC_DIR):
+    '''
+    Returns the path of a csv file with scale times the rows of the source csv (the source itself for scale 1),
+    generating it on first use
+
+    @param scale: size of the data relative to the source csv
+    @param seed: seed of the random generator
+    @param source: path of the csv file the rows are sampled from
+    @param out_dir: directory of the generated files
+    @type scale: int
+    @type seed: int
+    @type source: str
+    @type out_dir: str
+    '''
+    assert isinstance(scale, int) and scale > 0
+    assert isinstance(out_dir, str)
+
+    if scale == 1:
+        return source
+    path = os.path.join(out_dir, 'launches-{}x-seed{}.csv'.format(scale, seed))
+    if not os.path.isfile(path):
+        n_rows = len(load_dataframe(source)) * scale
+        os.makedirs(out_dir, exist_ok=True)
+        generate_launches(n_rows, seed, source).to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    return path
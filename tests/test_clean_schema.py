@@ -0,0 +1,41 @@
+'''
+Values outside the fixed categories of CLEAN_SCHEMA are kept (with a warning) instead of failing pre_processing
+'''
+import os
+import pytest
+import pandas as pd
+from helper_func import apply_schema
+from data_cleaning_pre_processing import pre_processing, CLEAN_SCHEMA
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Space_Corrected.csv')
+
+
+@pytest.fixture
+def unseen_status_csv(tmp_path):
+    raw = pd.read_csv(CSV_PATH)
+    raw.loc[:2, 'Status Mission'] = 'In Flight'
+    raw.loc[:0, 'Status Rocket'] = 'StatusPlanned'
+    path = tmp_path / 'unseen_status.csv'
+    raw.to_csv(path, index=False)
+    return str(path)
+
+
+def test_unseen_status_is_kept(unseen_status_csv):
+    with pytest.warns(UserWarning, match='In Flight'):
+        df = pre_processing(unseen_status_csv)
+    assert list(df['MissionStatus'].cat.categories) == ['Failure', 'Success', 'In Flight']
+    assert list(df['RocketStatus'].cat.categories) == ['StatusActive', 'StatusRetired', 'StatusPlanned']
+    assert (df['MissionStatus'] == 'In Flight').sum() == 3
+    assert df['MissionStatus'].notna().all() and df['RocketStatus'].notna().all()
+
+
+def test_unseen_status_strict(unseen_status_csv):
+    with pytest.raises(ValueError, match='StatusPlanned'):
+        pre_processing(unseen_status_csv, strict=True)
+
+
+def test_known_values_keep_schema_dtype():
+    df = pd.DataFrame({'Month': ['Jan', 'Mar'], 'MissionStatus': ['Success', 'Failure']})
+    cast = apply_schema(df, CLEAN_SCHEMA, strict=True)
+    assert cast['Month'].dtype == CLEAN_SCHEMA['Month']
+    assert cast['MissionStatus'].dtype == CLEAN_SCHEMA['MissionStatus']
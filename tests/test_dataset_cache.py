@@ -0,0 +1,45 @@
+'''
+The Parquet cache of the cleaned data (dataset_cache) returns the frame of pre_processing, faster than cleaning it
+'''
+import os
+import time
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import pandas as pd
+import dataset_cache
+from data_cleaning_pre_processing import pre_processing
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Space_Corrected.csv')
+
+
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@pytest.fixture(scope='module')
+def cleaned():
+    return pre_processing(CSV_PATH)
+
+
+def test_load_cleaned_matches_pre_processing(tmp_path, cleaned):
+    pd.testing.assert_frame_equal(dataset_cache.load_cleaned(CSV_PATH, cache_dir=str(tmp_path)), cleaned)
+
+
+def test_load_cleaned_filters(tmp_path, cleaned):
+    expected = cleaned[cleaned['Year'].between(1990, 2000) & cleaned['Country'].isin(['USA', 'Russia'])]
+    df = dataset_cache.load_cleaned(CSV_PATH, years=list(range(1990, 2001)), countries=['USA', 'Russia'],
+                                    cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_warm_load_beats_pre_processing(tmp_path):
+    dataset_cache.load_cleaned(CSV_PATH, cache_dir=str(tmp_path))
+    warm = best_time(lambda: dataset_cache.load_cleaned(CSV_PATH, cache_dir=str(tmp_path)))
+    assert warm < best_time(lambda: pre_processing(CSV_PATH))
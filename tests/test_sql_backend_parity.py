@@ -0,0 +1,45 @@
+'''
+Parity of the pandas and duckdb aggregation backends (the comparisons of sql_backend.check_parity)
+'''
+import os
+import pytest
+
+pytest.importorskip('duckdb')
+
+import memoize
+import sql_backend
+from data_cleaning_pre_processing import pre_processing
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Space_Corrected.csv')
+
+FUNCTIONS = sql_backend.parity_functions()
+
+
+@pytest.fixture(scope='module')
+def cleaned():
+    return pre_processing(CSV_PATH)
+
+
+@pytest.mark.parametrize('name,function', FUNCTIONS, ids=[name for name, _ in FUNCTIONS])
+def test_backend_parity(cleaned, name, function):
+    assert sql_backend.backend_difference(function, cleaned) is None
+
+
+@pytest.mark.parametrize('name', list(sql_backend.PARQUET_PARITY_CASES))
+def test_parquet_cube_parity(tmp_path, name):
+    filters = sql_backend.PARQUET_PARITY_CASES[name]
+    assert sql_backend.parquet_difference(CSV_PATH, str(tmp_path), **filters) is None
+
+
+def test_parity_keeps_memo_cache(cleaned):
+    name, function = FUNCTIONS[0]
+    memoize.enable()
+    try:
+        function(cleaned)
+        before = memoize.cache_info()
+        assert sql_backend.backend_difference(function, cleaned) is None
+        after = memoize.cache_info()
+        assert after['size'] == before['size'] > 0
+        assert (after['hits'], after['misses']) == (before['hits'], before['misses'])
+    finally:
+        memoize.disable()
@@ -0,0 +1,292 @@
+'''
+Time-series layer of the space data on the full launch timestamps
+
+A LaunchTimeSeries keeps the launches sorted by their UTC launch time (the Datum column of
+pre_processing(path, keep_datum=True)), so a time range is found with two binary searches and every aggregation
+over time is a bincount over bucket numbers:
+
+    ts = time_series(pre_processing('Space_Corrected.csv', keep_datum=True))
+    ts.resample('quarter', by='Country')
+    ts.rolling('month', 12, by='Company')
+    ts.last(6, 'month', by='Country')       # last 6 months by country, without scanning the older launches
+
+Every aggregation has the columns launches, successes, success_rate, cost_sum, cost_count and cost_mean (mean of
+the known MissionCost values).
+'''
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from helper_func import frame_version
+from instrumentation import instrument
+
+#resampling frequencies: name -> pandas period alias (weeks start on Monday)
+FREQUENCIES = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+#columns kept by the time series (besides the launch time); the groups of the aggregations are among them
+SERIES_COLUMNS = ['Country', 'Company', 'LaunchVehicle', 'SpaceCenter', 'MissionStatus', 'RocketStatus',
+                  'MissionCost']
+
+#summed measures of the aggregations
+SERIES_MEASURES = ['launches', 'successes', 'cost_sum', 'cost_count']
+
+#number of time series kept in memory by time_series
+SERIES_CACHE_SIZE = 4
+
+#series of time_series: (id(df), frame_version of its series columns, time column) -> (weak reference to df, series)
+_series_cache = OrderedDict()
+
+
+class LaunchTimeSeries:
+    '''
+    Launches sorted by their UTC launch time, with range slicing and vectorized resampling, cumulative and
+    rolling aggregations
+
+    Note: launches without a launch time are left out. Slices (between, last) share the arrays of the series
+    '''
+
+    def __init__(self, df, time_col='Datum'):
+        '''
+        @param df: cleaned dataframe with the parsed launch times (pre_processing(..., keep_datum=True))
+        @param time_col: column of the UTC launch times
+        @type df: pd.DataFrame
+        @type time_col: str
+        '''
+        assert isinstance(df, pd.DataFrame)
+        assert time_col in df.columns and pd.api.types.is_datetime64_any_dtype(df[time_col]), \
+            'the dataframe needs the parsed launch times, see pre_processing(..., keep_datum=True)'
+
+        times = df[time_col]
+        if times.dt.tz is None:
+            times = times.dt.tz_localize('UTC')
+        else:
+            times = times.dt.tz_convert('UTC')
+        known = times.notna().to_numpy()
+        order = np.argsort(times.to_numpy()[known], kind='stable')
+
+        columns = [col for col in SERIES_COLUMNS if col in df.columns]
+        self.data = df.loc[known, columns].iloc[order].set_index(pd.DatetimeIndex(times[known].iloc[order],
+                                                                                     name=time_col))
+        cost = self.data['MissionCost'] if 'MissionCost' in columns else pd.Series(np.nan, index=self.data.index)
+        self._measures = {
+            'launches': np.ones(len(self.data)),
+            'successes': (self.data['MissionStatus'] == 'Success').to_numpy(dtype=np.float64)
+            if 'MissionStatus' in columns else np.zeros(len(self.data)),
+            'cost_sum': cost.fillna(0.0).to_numpy(dtype=np.float64),
+            'cost_count': cost.notna().to_numpy(dtype=np.float64),
+        }
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def index(self):
+        '''
+        Sorted UTC DatetimeIndex of the launch times
+        '''
+        return self.data.index
+
+    def _view(self, lo, hi):
+        '''
+        Returns the series of the launches at the positions lo to hi (excluded), sharing the arrays of this one
+
+        @param lo: first position
+        @param hi: position after the last one
+        @type lo: int
+        @type hi: int
+        '''
+        view = object.__new__(LaunchTimeSeries)
+        view.data = self.data.iloc[lo:hi]
+        view._measures = {name: values[lo:hi] for name, values in self._measures.items()}
+        return view
+
+    def between(self, start=None, end=None):
+        '''
+        Returns the series of the launches from start (included) to end (excluded), found by binary search
+
+        @param start: first launch time (timestamp or string, UTC when naive; None from the first launch)
+        @param end: launch time after the range (None to the last launch)
+        '''
+        lo = 0 if start is None else self.index.searchsorted(_utc(start), side='left')
+        hi = len(self) if end is None else self.index.searchsorted(_utc(end), side='left')
+        return self._view(lo, max(lo, hi))
+
+    def _buckets(self, freq, by):
+        '''
+        Returns (period index of the buckets from the first launch to the last one, bucket number of every
+        launch, group values, group code of every launch) of the series
+
+        @param freq: name of the frequency in FREQUENCIES
+        @param by: column to group by (None for a single group)
+        @type freq: str
+        @type by: str
+        '''
+        assert freq in FREQUENCIES
+        assert by is None or by in self.data.columns
+
+        periods = self.index.tz_convert(None).to_period(FREQUENCIES[freq])
+        ordinals = periods.asi8
+        first = ordinals[0] if len(ordinals) else 0
+        n_buckets = int(ordinals[-1] - first + 1) if len(ordinals) else 0
+        buckets = pd.period_range(pd.Period(ordinal=first, freq=FREQUENCIES[freq]), periods=n_buckets)
+        if by is None:
+            return buckets, ordinals - first, None, np.zeros(len(ordinals), dtype=np.int64)
+        codes, groups = pd.factorize(self.data[by], sort=True)
+        return buckets, ordinals - first, groups, codes
+
+    def _matrices(self, freq, by):
+        '''
+        Returns (buckets, groups, dictionary of the bucket x group matrix of every measure)
+
+        @param freq: name of the frequency in FREQUENCIES
+        @param by: column to group by (None for a single group)
+        @type freq: str
+        @type by: str
+        '''
+        buckets, positions, groups, codes = self._buckets(freq, by)
+        known = codes >= 0
+        n_groups = 1 if groups is None else len(groups)
+        flat = positions[known] * n_groups + codes[known]
+        matrices = {}
+        for name, values in self._measures.items():
+            matrices[name] = np.bincount(flat, weights=values[known], minlength=len(buckets) * n_groups).reshape(
+                len(buckets), n_groups)
+        return buckets, groups, matrices
+
+    def _frame(self, buckets, groups, matrices, by, keep_empty):
+        '''
+        Returns the long dataframe (launch time bucket, group, measures, success_rate, cost_mean) of the matrices
+
+        @param buckets: period index of the buckets
+        @param groups: group values (None for a single group)
+        @param matrices: dictionary of the bucket x group matrix of every measure
+        @param by: name of the group column
+        @param keep_empty: keep the buckets without launches
+        @type keep_empty: bool
+        '''
+        if keep_empty:
+            rows, cols = np.indices(matrices['launches'].shape).reshape(2, -1)
+        else:
+            rows, cols = np.nonzero(matrices['launches'] > 0)
+        frame = pd.DataFrame({self.index.name: buckets.to_timestamp().tz_localize('UTC')[rows]})
+        if groups is not None:
+            frame[by] = groups.take(cols)
+        for name in SERIES_MEASURES:
+            values = matrices[name][rows, cols]
+            frame[name] = values.astype(np.int64) if name != 'cost_sum' else values
+        frame['success_rate'] = frame['successes'] / frame['launches'].where(frame['launches'] > 0)
+        frame['cost_mean'] = frame['cost_sum'] / frame['cost_count'].where(frame['cost_count'] > 0)
+        return frame
+
+    @instrument(name='LaunchTimeSeries.resample')
+    def resample(self, freq='month', by=None, fill=None):
+        '''
+        Returns the launches, successes, success rate and cost measures per bucket of the frequency (and per
+        value of `by`), one row per bucket start (UTC) sorted by time, then group
+
+        @param freq: day, week, month, quarter or year
+        @param by: column to group by, e.g. Country (None for all launches)
+        @param fill: keep the buckets without launches (default: True without `by`, False with it)
+        @type freq: str
+        @type by: str
+        @type fill: bool
+        '''
+        buckets, groups, matrices = self._matrices(freq, by)
+        return self._frame(buckets, groups, matrices, by, by is None if fill is None else fill)
+
+    @instrument(name='LaunchTimeSeries.cumulative')
+    def cumulative(self, freq='month', by=None):
+        '''
+        Returns the measures accumulated from the first launch up to the end of every bucket (per value of `by`),
+        with the cumulative success rate and cost mean, for every bucket from the first launch of the group
+
+        @param freq: day, week, month, quarter or year
+        @param by: column to group by (None for all launches)
+        @type freq: str
+        @type by: str
+        '''
+        buckets, groups, matrices = self._matrices(freq, by)
+        matrices = {name: np.cumsum(matrix, axis=0) for name, matrix in matrices.items()}
+        return self._frame(buckets, groups, matrices, by, False)
+
+    @instrument(name='LaunchTimeSeries.rolling')
+    def rolling(self, freq='month', window=12, by=None):
+        '''
+        Returns the measures over the trailing window of buckets ending at every bucket (per value of `by`),
+        with the success rate and cost mean of the window; windows without launches are left out
+
+        @param freq: day, week, month, quarter or year
+        @param window: number of buckets of the window
+        @param by: column to group by (None for all launches)
+        @type freq: str
+        @type window: int
+        @type by: str
+        '''
+        assert isinstance(window, int) and window > 0
+
+        buckets, groups, matrices = self._matrices(freq, by)
+        for name, matrix in matrices.items():
+            total = np.cumsum(matrix, axis=0)
+            total[window:] -= total[:-window].copy()
+            matrices[name] = total
+        return self._frame(buckets, groups, matrices, by, False)
+
+    def last(self, n, freq='month', by=None, end=None):
+        '''
+        Returns the resampled measures of the last n buckets up to end (the bucket of the latest launch by
+        default); only the launches of these buckets are read
+
+        @param n: number of buckets
+        @param freq: day, week, month, quarter or year
+        @param by: column to group by (None for all launches)
+        @param end: launch time in the last bucket (None for the latest launch)
+        @type n: int
+        @type freq: str
+        @type by: str
+        '''
+        assert isinstance(n, int) and n > 0
+        assert freq in FREQUENCIES
+
+        if len(self) == 0:
+            return self.resample(freq, by)
+        end = self.index[-1] if end is None else _utc(end)
+        period = pd.Period(end.tz_convert(None), FREQUENCIES[freq])
+        start = (period - (n - 1)).start_time.tz_localize('UTC')
+        stop = (period + 1).start_time.tz_localize('UTC')
+        return self.between(start, stop).resample(freq, by)
+
+
+def _utc(value):
+    '''
+    Returns the value as a UTC timestamp (naive values are taken as UTC)
+
+    @param value: timestamp, datetime or string
+    '''
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tz is None else value.tz_convert('UTC')
+
+
+def time_series(df, time_col='Datum'):
+    '''
+    Returns the LaunchTimeSeries of the dataframe, built once per dataframe and version of its columns, so a
+    cached series is found without reading the rows (see helper_func.frame_version for the in-place edits it does
+    not see)
+
+    @param df: cleaned dataframe with the parsed launch times (pre_processing(..., keep_datum=True))
+    @param time_col: column of the UTC launch times
+    @type df: pd.DataFrame
+    @type time_col: str
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    columns = [time_col] + [col for col in SERIES_COLUMNS if col in df.columns]
+    key = (id(df), frame_version(df, columns), time_col)
+    entry = _series_cache.get(key)
+    if entry is not None and entry[0]() is df:
+        _series_cache.move_to_end(key)
+    else:
+        entry = (weakref.ref(df), LaunchTimeSeries(df, time_col))
+        _series_cache[key] = entry
+        while len(_series_cache) > SERIES_CACHE_SIZE:
+            _series_cache.popitem(last=False)
+    return entry[1]